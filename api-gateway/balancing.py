@@ -0,0 +1,152 @@
+"""Estrategias de balanceo de carga y expulsión de instancias atípicas.
+
+Cada servicio del registro elige su estrategia con la clave `"balancer"`:
+
+- `round_robin`: turno rotativo entre las instancias disponibles.
+- `least_outstanding`: la instancia con menos peticiones en curso.
+- `p2c`: "power of two choices"; se toman dos instancias al azar y gana la de
+  menor latencia observada (EWMA) ponderada por sus peticiones en curso.
+
+Además de los health checks activos del registro, cada respuesta alimenta
+una detección pasiva de atípicos: tras `consecutive_errors` fallos seguidos
+(errores de conexión o respuestas 5xx) la instancia se expulsa durante
+`base_ejection_seconds * número de expulsiones`, sin superar nunca
+`max_ejection_percent` de las instancias del servicio.
+"""
+
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class OutlierDetection:
+    consecutive_errors: int = 5
+    base_ejection_seconds: float = 30.0
+    max_ejection_seconds: float = 300.0
+    max_ejection_percent: float = 50.0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "OutlierDetection":
+        defaults = cls()
+        return cls(
+            consecutive_errors=int(
+                config.get("consecutive_errors", defaults.consecutive_errors)
+            ),
+            base_ejection_seconds=float(
+                config.get("base_ejection_seconds", defaults.base_ejection_seconds)
+            ),
+            max_ejection_seconds=float(
+                config.get("max_ejection_seconds", defaults.max_ejection_seconds)
+            ),
+            max_ejection_percent=float(
+                config.get("max_ejection_percent", defaults.max_ejection_percent)
+            ),
+        )
+
+
+# Peso de la última muestra en la media móvil exponencial de latencia.
+EWMA_ALPHA = 0.3
+# Latencia mínima (segundos) con la que cuenta un intento fallido. Un error
+# rápido (conexión rechazada, 503 inmediato) no debe hacer que p2c prefiera
+# justamente a la instancia que está fallando.
+FAILURE_LATENCY_PENALTY = 1.0
+
+
+class InstanceStats:
+    """Contadores que el gateway mantiene por instancia."""
+
+    def __init__(self):
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.consecutive_errors = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def is_ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def start(self):
+        self.outstanding += 1
+
+    def cancel(self):
+        """Petición cancelada antes de responder: no cuenta como latencia ni error."""
+        self.outstanding = max(0, self.outstanding - 1)
+
+    def finish(self, latency: float, failed: bool):
+        self.outstanding = max(0, self.outstanding - 1)
+        if failed:
+            latency = max(latency, FAILURE_LATENCY_PENALTY)
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += EWMA_ALPHA * (latency - self.ewma_latency)
+        self.consecutive_errors = self.consecutive_errors + 1 if failed else 0
+
+    def score(self) -> float:
+        # Las instancias sin muestras todavía se prueban primero.
+        return (self.ewma_latency or 0.0) * (self.outstanding + 1)
+
+
+def maybe_eject(instances: list, instance, policy: OutlierDetection, now: float):
+    """Expulsa `instance` si superó el umbral de errores y el límite lo permite."""
+    stats = instance.stats
+    if stats.consecutive_errors < policy.consecutive_errors or stats.is_ejected(now):
+        return False
+    ejected = sum(1 for i in instances if i.stats.is_ejected(now))
+    if (ejected + 1) * 100 > policy.max_ejection_percent * len(instances):
+        return False
+    stats.ejections += 1
+    stats.ejected_until = now + min(
+        policy.base_ejection_seconds * stats.ejections, policy.max_ejection_seconds
+    )
+    stats.consecutive_errors = 0
+    return True
+
+
+class RoundRobin:
+    name = "round_robin"
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, candidates: List):
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class LeastOutstanding:
+    name = "least_outstanding"
+
+    def choose(self, candidates: List):
+        fewest = min(i.stats.outstanding for i in candidates)
+        return random.choice([i for i in candidates if i.stats.outstanding == fewest])
+
+
+class PowerOfTwoChoices:
+    name = "p2c"
+
+    def choose(self, candidates: List):
+        if len(candidates) == 1:
+            return candidates[0]
+        a, b = random.sample(candidates, 2)
+        return a if a.stats.score() <= b.stats.score() else b
+
+
+BALANCERS = {
+    cls.name: cls for cls in (RoundRobin, LeastOutstanding, PowerOfTwoChoices)
+}
+
+
+def create_balancer(name: str):
+    try:
+        return BALANCERS[name]()
+    except KeyError:
+        raise ValueError(
+            f"Balanceador desconocido '{name}'. Opciones: {sorted(BALANCERS)}"
+        )
+
+
+def now() -> float:
+    return time.monotonic()
@@ -0,0 +1,106 @@
+"""Peticiones agrupadas: `POST /api/v1/batch`.
+
+El cliente envía una lista de subpeticiones independientes:
+
+    [
+        {"method": "GET", "path": "/api/v1/productos/?limit=20"},
+        {"method": "GET", "path": "/api/v1/pedidos/"},
+        {"method": "POST", "path": "/api/v1/pagos/", "body": {...}}
+    ]
+
+y recibe, en el mismo orden, `[{"status": 200, "body": ...}, ...]`. Las
+subpeticiones se envían a la vez (como mucho `GATEWAY_BATCH_CONCURRENCY`
+simultáneas) con un plazo total de `GATEWAY_BATCH_TIMEOUT` segundos; las que
+no terminan a tiempo se cancelan y responden 504. Un error en una
+subpetición no afecta a las demás.
+
+Los cuerpos JSON de los microservicios se insertan en la respuesta sin
+decodificarlos.
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List, Literal, Optional, Tuple
+from urllib.parse import urlsplit
+
+from pydantic import BaseModel
+
+from common.serialization import dumps
+
+MAX_REQUESTS = int(os.getenv("GATEWAY_BATCH_MAX_REQUESTS", "20"))
+CONCURRENCY = int(os.getenv("GATEWAY_BATCH_CONCURRENCY", "6"))
+TIMEOUT = float(os.getenv("GATEWAY_BATCH_TIMEOUT", "10"))
+
+PREFIX = "/api/v1/"
+
+# (status, content-type, cuerpo) de cada subpetición.
+Result = Tuple[int, Optional[str], bytes]
+
+
+class SubRequest(BaseModel):
+    method: Literal["GET", "POST", "PUT", "DELETE"] = "GET"
+    path: str
+    body: Optional[Any] = None
+
+
+def split_path(path: str) -> Tuple[str, str]:
+    """Separa `/api/v1/<ruta>?<query>` en (ruta, query)."""
+    parts = urlsplit(path)
+    if parts.scheme or parts.netloc or not parts.path.startswith(PREFIX):
+        raise ValueError(f"La ruta debe empezar por {PREFIX}: '{path}'")
+    route = parts.path[len(PREFIX):]
+    if route.split("/", 1)[0] == "batch":
+        raise ValueError("No se permiten batch anidados.")
+    return route, parts.query
+
+
+def error(status: int, detail: str) -> Result:
+    return status, "application/json", dumps({"detail": detail})
+
+
+async def run_batch(
+    subrequests: List[SubRequest],
+    execute: Callable[[SubRequest], Awaitable[Result]],
+    concurrency: int = CONCURRENCY,
+    timeout: float = TIMEOUT,
+) -> List[Result]:
+    """Ejecuta las subpeticiones en paralelo y devuelve sus resultados en orden."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(sub: SubRequest) -> Result:
+        async with slots:
+            return await execute(sub)
+
+    tasks = [asyncio.create_task(run(sub)) for sub in subrequests]
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        # También si se cancela el batch completo (el cliente se desconectó).
+        for task in tasks:
+            task.cancel()
+    # Espera a que las canceladas liberen sus conexiones antes de responder.
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(error(504, f"Sin respuesta en el plazo del batch ({timeout}s)."))
+        elif task.exception() is not None:
+            results.append(error(502, f"Error inesperado: {task.exception()}"))
+        else:
+            results.append(task.result())
+    return results
+
+
+def encode_results(results: List[Result]) -> bytes:
+    """Arma la respuesta JSON reutilizando los bytes JSON de cada microservicio."""
+    items = []
+    for status, content_type, body in results:
+        if not body:
+            payload = b"null"
+        elif content_type and content_type.lower().startswith("application/json"):
+            payload = body
+        else:
+            payload = dumps(body.decode("utf-8", errors="replace"))
+        items.append(b'{"status":%d,"body":%s}' % (status, payload))
+    return b"[" + b",".join(items) + b"]"
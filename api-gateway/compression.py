@@ -0,0 +1,221 @@
+"""Compresión de respuestas negociada con `Accept-Encoding`.
+
+- Se elige la mejor codificación disponible entre zstd, br y gzip según los
+  valores q del cliente (brotli y zstandard son opcionales).
+- Los cuerpos menores que `GATEWAY_COMPRESS_MIN_SIZE` o de tipos no
+  comprimibles se envían tal cual.
+- Los cuerpos grandes se comprimen en el threadpool, con un número limitado
+  de compresiones simultáneas, para no bloquear el event loop.
+- Si el microservicio ya respondió comprimido con una codificación que el
+  cliente acepta, los bytes se reenvían sin descomprimir ni recomprimir.
+- Los resultados se guardan en una caché LRU indexada por el hash del cuerpo,
+  de modo que un listado que no cambia se comprime una sola vez.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard es opcional
+    zstandard = None
+
+MIN_SIZE = int(os.getenv("GATEWAY_COMPRESS_MIN_SIZE", "1024"))
+THREAD_THRESHOLD = int(os.getenv("GATEWAY_COMPRESS_THREAD_THRESHOLD", str(64 * 1024)))
+MAX_THREADS = int(os.getenv("GATEWAY_COMPRESS_MAX_THREADS", str(os.cpu_count() or 1)))
+CACHE_MAX_BYTES = int(os.getenv("GATEWAY_COMPRESS_CACHE_MB", "32")) * 1024 * 1024
+
+# Niveles moderados: buena relación de compresión con un coste de CPU acotado.
+GZIP_LEVEL = int(os.getenv("GATEWAY_GZIP_LEVEL", "6"))
+BROTLI_LEVEL = int(os.getenv("GATEWAY_BROTLI_LEVEL", "4"))
+ZSTD_LEVEL = int(os.getenv("GATEWAY_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/msgpack",
+    "image/svg+xml",
+    "text/",
+)
+
+
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=BROTLI_LEVEL)
+
+
+def _zstd(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+
+
+# Orden de preferencia del servidor cuando el cliente acepta varias con el mismo q.
+ENCODERS = OrderedDict()
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+ENCODERS["gzip"] = _gzip
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+
+def accepts(header: Optional[str], encoding: str) -> bool:
+    accepted = parse_accept_encoding(header)
+    return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+
+def merge_vary(vary: Optional[str], field: str) -> str:
+    """Agrega `field` al Vary del microservicio (p. ej. `Accept`) sin pisarlo."""
+    fields = [f.strip() for f in (vary or "").split(",") if f.strip()]
+    if "*" not in fields and field.lower() not in {f.lower() for f in fields}:
+        fields.append(field)
+    return ", ".join(fields)
+
+
+def negotiate(header: Optional[str]) -> Optional[str]:
+    """Devuelve la codificación a usar o None para enviar sin comprimir."""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for encoding in ENCODERS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressedCache:
+    """Caché LRU de cuerpos ya comprimidos, limitada por tamaño total en bytes."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+
+    @staticmethod
+    def key(body: bytes, encoding: str) -> Tuple[bytes, str]:
+        return hashlib.blake2b(body, digest_size=16).digest(), encoding
+
+    def get(self, key) -> Optional[bytes]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+cache = CompressedCache()
+_thread_slots: Optional[asyncio.Semaphore] = None
+
+
+async def compress(body: bytes, encoding: str) -> bytes:
+    global _thread_slots
+    key = cache.key(body, encoding)
+    compressed = cache.get(key)
+    if compressed is not None:
+        return compressed
+
+    encoder = ENCODERS[encoding]
+    if len(body) < THREAD_THRESHOLD:
+        compressed = encoder(body)
+    else:
+        if _thread_slots is None:
+            _thread_slots = asyncio.Semaphore(MAX_THREADS)
+        async with _thread_slots:
+            compressed = await run_in_threadpool(encoder, body)
+    cache.put(key, compressed)
+    return compressed
+
+
+async def read_upstream_body(
+    response: httpx.Response, accept_encoding: Optional[str]
+) -> Tuple[bytes, Optional[str]]:
+    """Lee el cuerpo de una respuesta en streaming del microservicio.
+
+    Si ya viene comprimido con una codificación que el cliente acepta se
+    devuelven los bytes sin decodificar junto con esa codificación.
+    """
+    upstream_encoding = response.headers.get("content-encoding", "").strip().lower()
+    if (
+        upstream_encoding
+        and upstream_encoding != "identity"
+        and not response.is_error
+        and accepts(accept_encoding, upstream_encoding)
+    ):
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        return raw, upstream_encoding
+    return await response.aread(), None
+
+
+async def build_response(
+    body: bytes,
+    status_code: int,
+    content_type: Optional[str],
+    accept_encoding: Optional[str],
+    upstream_encoding: Optional[str] = None,
+    upstream_headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    headers = dict(upstream_headers or {})
+    headers["Vary"] = merge_vary(headers.get("Vary"), "Accept-Encoding")
+    if upstream_encoding:
+        headers["Content-Encoding"] = upstream_encoding
+    elif (
+        status_code not in (206, 304)
+        and len(body) >= MIN_SIZE
+        and is_compressible(content_type)
+    ):
+        encoding = negotiate(accept_encoding)
+        if encoding:
+            body = await compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            # Los bytes ya no son los del microservicio: el ETag pasa a ser débil.
+            etag = headers.get("ETag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+    return Response(
+        content=body, status_code=status_code, media_type=content_type, headers=headers
+    )
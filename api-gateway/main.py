@@ -1,11 +1,52 @@
 from fastapi import FastAPI, APIRouter, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+import asyncio
 import httpx
 import os
 import logging
+import time
+from typing import List
+from common.http_client import ClienteHTTP
+from common.profiling import instalar_profiling
+from common.readiness import instalar_readiness
+from common.serialization import ORJSONResponse, dumps
+from registry import ServiceRegistry
+import batch
+import compression
+
+# Cliente HTTP asíncrono que se reutilizará en todas las peticiones.
+# Se abre en el lifespan para que cada worker tenga su propio pool de conexiones.
+http = ClienteHTTP(timeout=5.0)
+
+# Registro de microservicios: archivo JSON recargable (GATEWAY_SERVICES_FILE)
+# o, por defecto, las variables *_SERVICE_URL definidas en docker-compose.yml.
+registry = ServiceRegistry(os.getenv("GATEWAY_SERVICES_FILE"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    client = http.abrir()
+    tasks = [
+        asyncio.create_task(registry.health_loop(client)),
+        asyncio.create_task(
+            registry.watch_config(float(os.getenv("GATEWAY_RELOAD_INTERVAL", "2")))
+        ),
+    ]
+    yield
+    for task in tasks:
+        task.cancel()
+    await http.cerrar()
+
 
 # Define la instancia de la aplicación FastAPI.
-app = FastAPI(title="API Gateway Taller Microservicios")
+app = FastAPI(
+    title="API Gateway Taller Microservicios",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
+)
 
 # Configura CORS (Cross-Origin Resource Sharing).
 # Esto es esencial para permitir que el frontend se comunique con el gateway.
@@ -21,38 +62,149 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Profiling bajo demanda (X-Profile-Token) y captura de peticiones lentas.
+instalar_profiling(app)
+# /ready pasa a 200 cuando termina el lifespan.
+instalar_readiness(app)
+
 # Configura un logger básico
 logging.basicConfig(level=logging.INFO)
 
 # Crea un enrutador para las peticiones de los microservicios.
 router = APIRouter(prefix="/api/v1")
 
-# Define los microservicios y sus URLs.
-# La URL debe coincidir con el nombre del servicio definido en docker-compose.yml.
-SERVICES = {
-    "auth-service": os.getenv("AUTH_SERVICE_URL", "http://auth-service:8001"),
-    "productos-service": os.getenv(
-        "PRODUCTOS_SERVICE_URL", "http://productos-service:8004"
-    ),
-    "pedidos-service": os.getenv("PEDIDOS_SERVICE_URL", "http://pedidos-service:8003"),
-    "pagos-service": os.getenv("PAGOS_SERVICE_URL", "http://pagos-service:8002"),
-}
 
-# Crea un cliente HTTP asíncrono que se reutilizará en todas las peticiones.
-client = httpx.AsyncClient()
+# Métodos que se pueden reintentar en otra instancia sin riesgo de duplicar efectos.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Respuestas que indican un problema de la instancia y no de la petición.
+RETRYABLE_STATUS = {502, 503, 504}
+# Encabezados de caché y de rangos que se copian de la respuesta del microservicio.
+PASSTHROUGH_HEADERS = (
+    "ETag",
+    "Cache-Control",
+    "Last-Modified",
+    "Accept-Ranges",
+    "Content-Range",
+    # Los servicios negocian JSON o MessagePack según Accept (Vary: Accept);
+    # sin él, una caché compartida podría mezclar ambas representaciones.
+    "Vary",
+    # Instante de la última escritura, para leer lo escrito (common/db.py).
+    "X-DB-Escritura",
+)
+# Se agregan al reenviar en streaming, porque el cuerpo no se toca.
+STREAM_HEADERS = ("Content-Length", "Content-Encoding")
+
+
+async def send_to_service(service, method: str, path: str, **kwargs) -> httpx.Response:
+    """Envía la petición a una instancia elegida por el balanceador del servicio.
+
+    Devuelve la respuesta sin leer (streaming); hay que leerla y cerrarla.
+
+    Los errores de conexión se reintentan siempre en otra instancia (la
+    petición no llegó a enviarse); los timeouts y las respuestas 502/503/504
+    solo se reintentan en métodos idempotentes.
+    """
+    tried = []
+    for attempt in range(service.retries + 1):
+        instance = service.choose_instance(exclude=tried)
+        tried.append(instance)
+        last_attempt = attempt == service.retries
+        service_url = f"{instance.url}/{path}"
+        logging.info(f"Forwarding request to: {service_url}")
+
+        instance.stats.start()
+        started = time.perf_counter()
+        # Si el intento termina sin registrarse (cancelación del cliente, plazo
+        # de un batch o cualquier error inesperado) se descuenta igual de las
+        # peticiones en curso, sin contarlo como latencia ni error.
+        recorded = False
+        try:
+            try:
+                # Usa httpx para enviar la petición de forma asíncrona. La respuesta
+                # se recibe en streaming: el cuerpo lo lee quien llama.
+                upstream_request = http.client.build_request(
+                    method=method, url=service_url, timeout=5, **kwargs
+                )
+                response = await http.client.send(upstream_request, stream=True)
+            except httpx.TransportError as e:
+                service.record(instance, time.perf_counter() - started, failed=True)
+                recorded = True
+                retryable = isinstance(e, httpx.ConnectError) or method in IDEMPOTENT_METHODS
+                if last_attempt or not retryable:
+                    raise
+                logging.warning(f"Reintentando {service.name} tras error en {instance.url}: {e}")
+                continue
+
+            failed = response.status_code >= 500
+            service.record(instance, time.perf_counter() - started, failed=failed)
+            recorded = True
+        finally:
+            if not recorded:
+                instance.stats.cancel()
+        if (
+            response.status_code in RETRYABLE_STATUS
+            and method in IDEMPOTENT_METHODS
+            and not last_attempt
+        ):
+            await response.aclose()
+            logging.warning(
+                f"Reintentando {service.name}: {instance.url} respondió {response.status_code}"
+            )
+            continue
+        return response
+
+
+def stream_passthrough(method: str, response: httpx.Response) -> bool:
+    """Si la respuesta se reenvía sin leerla: HEAD y cuerpos que no se comprimen.
+
+    Las imágenes y demás binarios no ganan nada pasando por la compresión, así
+    que se copian a medida que llegan en lugar de cargarlos enteros en memoria.
+    Los errores siguen el camino normal para convertirlos en HTTPException.
+    """
+    if not (response.is_success or response.status_code == 304):
+        return False
+    return method == "HEAD" or not compression.is_compressible(
+        response.headers.get("content-type")
+    )
+
+
+def relay_response(response: httpx.Response) -> StreamingResponse:
+    """Reenvía en streaming la respuesta del microservicio y la cierra al terminar."""
+
+    async def body():
+        # El finally cubre también la desconexión del cliente, en la que
+        # Starlette no ejecuta la tarea de fondo.
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await response.aclose()
+
+    headers = {
+        h: response.headers[h]
+        for h in PASSTHROUGH_HEADERS + STREAM_HEADERS
+        if h in response.headers
+    }
+    resultado = StreamingResponse(
+        body(),
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+        headers=headers,
+        background=BackgroundTask(response.aclose),
+    )
+    for cookie in response.headers.get_list("set-cookie"):
+        resultado.headers.append("set-cookie", cookie)
+    return resultado
 
 
 async def forward_request(service_name: str, path: str, request: Request):
     """Función genérica para redirigir peticiones a los microservicios."""
-    if service_name not in SERVICES:
+    service = registry.get(service_name)
+    if service is None:
         raise HTTPException(
             status_code=404, detail=f"Service '{service_name}' not found."
         )
 
-    # Construcción de la URL de destino más robusta
-    base_service_url = SERVICES[service_name]
-    service_url = f"{base_service_url}/{path}"
-
     try:
         # Prepara los datos para la petición
         headers = {
@@ -64,27 +216,46 @@ async def forward_request(service_name: str, path: str, request: Request):
         content = await request.body()
 
         # Imprimir información de depuración
-        logging.info(f"Forwarding request to: {service_url}")
         logging.info(f"Method: {request.method}, Headers: {headers}")
         logging.info(f"Params: {params}")
 
-        # Usa httpx para enviar la petición de forma asíncrona
-        response = await client.request(
-            method=request.method,
-            url=service_url,
+        response = await send_to_service(
+            service,
+            request.method,
+            path,
             headers=headers,
             params=params,
             content=content,
-            timeout=5,  # Timeout de 5 segundos
         )
+        if stream_passthrough(request.method, response):
+            return relay_response(response)
+
+        accept_encoding = request.headers.get("accept-encoding")
+        try:
+            body, upstream_encoding = await compression.read_upstream_body(
+                response, accept_encoding
+            )
+        finally:
+            await response.aclose()
 
-        response.raise_for_status()
+        # 304 Not Modified no es un error: el cliente ya tiene el recurso.
+        if response.status_code != 304:
+            response.raise_for_status()
 
-        # Devuelve la respuesta del microservicio
-        content_type = response.headers.get("content-type", "")
-        if content_type.startswith("application/json"):
-            return response.json()
-        return response.text
+        # Devuelve el cuerpo del microservicio sin decodificar el JSON para
+        # volver a codificarlo, comprimido según el Accept-Encoding del cliente.
+        resultado = await compression.build_response(
+            body,
+            response.status_code,
+            response.headers.get("content-type"),
+            accept_encoding,
+            upstream_encoding,
+            {h: response.headers[h] for h in PASSTHROUGH_HEADERS if h in response.headers},
+        )
+        # Puede haber varias cookies: cada una va en su propio Set-Cookie.
+        for cookie in response.headers.get_list("set-cookie"):
+            resultado.headers.append("set-cookie", cookie)
+        return resultado
 
     except httpx.ConnectError as e:
         logging.error(f"Connection error to {service_name}: {str(e)}")
@@ -102,26 +273,99 @@ async def forward_request(service_name: str, path: str, request: Request):
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 
-def create_proxy_route(service_name: str, service_path_prefix: str):
-    """Función para crear dinámicamente las rutas del proxy."""
+# Encabezados del batch que no se copian a las subpeticiones: los cuerpos se
+# piden en JSON sin comprimir para poder insertarlos en la respuesta, y los
+# hop-by-hop (RFC 9110, 7.6.1) solo valen para la conexión con el cliente.
+BATCH_SKIP_HEADERS = {
+    "host",
+    "content-length",
+    "content-type",
+    "accept",
+    "accept-encoding",
+    "connection",
+    "keep-alive",
+    "transfer-encoding",
+    "te",
+    "upgrade",
+}
+
+
+async def execute_subrequest(sub: batch.SubRequest, headers: dict) -> batch.Result:
+    try:
+        path, query = batch.split_path(sub.path)
+    except ValueError as e:
+        return batch.error(400, str(e))
+    service = registry.resolve(path)
+    if service is None:
+        return batch.error(404, f"No hay un servicio para '/{path}'.")
+
+    headers = {**headers, "accept": "application/json"}
+    content = None
+    if sub.body is not None:
+        headers["content-type"] = "application/json"
+        content = dumps(sub.body)
+    try:
+        response = await send_to_service(
+            service,
+            sub.method,
+            f"api/v1/{path}",
+            headers=headers,
+            params=httpx.QueryParams(query),
+            content=content,
+        )
+    except httpx.ConnectError as e:
+        return batch.error(503, f"No se pudo conectar al servicio {service.name}: {e}")
+    except httpx.TimeoutException:
+        return batch.error(504, f"Timeout del servicio {service.name}.")
+    except httpx.TransportError as e:
+        return batch.error(502, f"Error de transporte con {service.name}: {e}")
+    try:
+        body = await response.aread()
+    finally:
+        await response.aclose()
+    return response.status_code, response.headers.get("content-type"), body
+
 
-    @router.api_route(
-        f"/{service_path_prefix}/{{path:path}}",
-        methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        # El nombre del endpoint debe ser único
-        name=f"{service_name}_proxy",
+# Se registra antes que el proxy genérico, que también acepta POST.
+@router.post("/batch", name="batch")
+async def batch_requests(subrequests: List[batch.SubRequest], request: Request):
+    """Ejecuta varias subpeticiones en un solo viaje de ida y vuelta."""
+    if not subrequests:
+        raise HTTPException(status_code=422, detail="El batch está vacío.")
+    if len(subrequests) > batch.MAX_REQUESTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Como máximo {batch.MAX_REQUESTS} subpeticiones por batch.",
+        )
+    headers = {
+        key: value
+        for key, value in request.headers.items()
+        if key.lower() not in BATCH_SKIP_HEADERS
+    }
+    results = await batch.run_batch(
+        subrequests, lambda sub: execute_subrequest(sub, headers)
+    )
+    return await compression.build_response(
+        batch.encode_results(results),
+        200,
+        "application/json",
+        request.headers.get("accept-encoding"),
     )
-    async def proxy(path: str, request: Request):
-        # La ruta completa que se reenvía al microservicio
-        forward_path = f"api/v1/{service_path_prefix}/{path}"
-        return await forward_request(service_name, forward_path, request)
 
 
-# --- Creación dinámica de rutas para cada microservicio ---
-create_proxy_route("auth-service", "auth")
-create_proxy_route("productos-service", "productos")
-create_proxy_route("pedidos-service", "pedidos")
-create_proxy_route("pagos-service", "pagos")
+@router.api_route(
+    "/{path:path}",
+    methods=["GET", "HEAD", "POST", "PUT", "DELETE", "OPTIONS"],
+    name="proxy",
+)
+async def proxy(path: str, request: Request):
+    # El servicio se resuelve con el trie de prefijos del registro, que se
+    # recompila en cada recarga de la configuración.
+    service = registry.resolve(path)
+    if service is None:
+        raise HTTPException(status_code=404, detail=f"No hay un servicio para '/{path}'.")
+    # La ruta completa que se reenvía al microservicio
+    return await forward_request(service.name, f"api/v1/{path}", request)
 
 
 # Incluye el router en la aplicación principal.
@@ -131,4 +375,8 @@ app.include_router(router)
 # Endpoint de salud para verificar el estado del gateway.
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "message": "API Gateway is running."}
+    return {
+        "status": "ok",
+        "message": "API Gateway is running.",
+        "services": registry.describe(),
+    }
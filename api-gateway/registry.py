@@ -0,0 +1,316 @@
+"""Registro de servicios del API Gateway.
+
+La tabla de rutas se construye a partir de un archivo JSON (variable de
+entorno `GATEWAY_SERVICES_FILE`) o, si no se define, de las variables
+`*_SERVICE_URL` de siempre. Formato del archivo:
+
+    {
+      "services": {
+        "productos-service": {
+          "prefix": "productos",
+          "instances": ["http://productos-1:8004", "http://productos-2:8004"],
+          "health_path": "/ready",
+          "balancer": "p2c",
+          "retries": 1
+        }
+      },
+      "health_check": {"interval": 5, "timeout": 2, "unhealthy_threshold": 2},
+      "outlier_detection": {"consecutive_errors": 5, "base_ejection_seconds": 30}
+    }
+
+Las estrategias de balanceo y la expulsión de atípicos están en balancing.py.
+
+Cada recarga genera una tabla nueva e inmutable (`RouteTable`) que se
+sustituye de una sola vez; las peticiones en curso terminan con la tabla
+anterior y el pool de conexiones HTTP no se toca.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import httpx
+
+from balancing import (
+    InstanceStats,
+    OutlierDetection,
+    RoundRobin,
+    create_balancer,
+    maybe_eject,
+    now,
+)
+
+DEFAULT_BALANCER = os.getenv("GATEWAY_BALANCER", "round_robin")
+
+
+def default_config() -> dict:
+    """Configuración equivalente al antiguo diccionario SERVICES."""
+    return {
+        "services": {
+            "auth-service": {
+                "prefix": "auth",
+                "instances": [os.getenv("AUTH_SERVICE_URL", "http://auth-service:8001")],
+            },
+            "productos-service": {
+                "prefix": "productos",
+                "instances": [
+                    os.getenv("PRODUCTOS_SERVICE_URL", "http://productos-service:8004")
+                ],
+            },
+            "pedidos-service": {
+                "prefix": "pedidos",
+                "instances": [
+                    os.getenv("PEDIDOS_SERVICE_URL", "http://pedidos-service:8003")
+                ],
+            },
+            "pagos-service": {
+                "prefix": "pagos",
+                "instances": [os.getenv("PAGOS_SERVICE_URL", "http://pagos-service:8002")],
+            },
+        }
+    }
+
+
+@dataclass
+class Instance:
+    url: str
+    healthy: bool = True
+    consecutive_failures: int = 0
+    stats: InstanceStats = field(default_factory=InstanceStats, repr=False)
+
+
+@dataclass
+class Service:
+    name: str
+    prefix: str
+    instances: List[Instance]
+    health_path: str = "/ready"
+    balancer: object = field(default_factory=RoundRobin, repr=False)
+    retries: int = 1
+    outlier_detection: OutlierDetection = field(default_factory=OutlierDetection)
+
+    def available_instances(self, exclude: Sequence[Instance] = ()) -> List[Instance]:
+        """Instancias sanas y no expulsadas, sin las ya intentadas.
+
+        Si no queda ninguna se relajan los filtros (fail-open) para no
+        rechazar tráfico que alguna instancia todavía podría atender.
+        """
+        current = now()
+        pending = [i for i in self.instances if i not in exclude] or self.instances
+        healthy = [i for i in pending if i.healthy and not i.stats.is_ejected(current)]
+        return healthy or [i for i in pending if i.healthy] or pending
+
+    def choose_instance(self, exclude: Sequence[Instance] = ()) -> Instance:
+        return self.balancer.choose(self.available_instances(exclude))
+
+    def record(self, instance: Instance, latency: float, failed: bool):
+        """Registra el resultado de una petición y expulsa la instancia si es atípica."""
+        instance.stats.finish(latency, failed)
+        if maybe_eject(self.instances, instance, self.outlier_detection, now()):
+            logging.warning(
+                f"Instancia {instance.url} de {self.name} expulsada por errores consecutivos "
+                f"({instance.stats.ejections} expulsiones)"
+            )
+
+
+class PrefixTrie:
+    """Trie de segmentos de ruta para resolver el servicio por prefijo más largo."""
+
+    def __init__(self):
+        self.children: Dict[str, "PrefixTrie"] = {}
+        self.value = None
+
+    def insert(self, prefix: str, value):
+        node = self
+        for segment in _segments(prefix):
+            node = node.children.setdefault(segment, PrefixTrie())
+        node.value = value
+
+    def lookup(self, path: str):
+        node, match = self, self.value
+        for segment in _segments(path):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.value is not None:
+                match = node.value
+        return match
+
+
+def _segments(path: str) -> List[str]:
+    return [s for s in path.strip("/").split("/") if s]
+
+
+class RouteTable:
+    """Tabla inmutable de servicios y trie de prefijos compilado."""
+
+    def __init__(self, services: Dict[str, Service]):
+        self.services = services
+        self.trie = PrefixTrie()
+        for service in services.values():
+            self.trie.insert(service.prefix, service)
+
+    def resolve(self, path: str) -> Optional[Service]:
+        return self.trie.lookup(path)
+
+
+class ServiceRegistry:
+    def __init__(self, config_path: Optional[str] = None):
+        self.config_path = config_path
+        self.health_interval = 5.0
+        self.health_timeout = 2.0
+        self.unhealthy_threshold = 2
+        self._mtime: Optional[float] = None
+        self.table = RouteTable({})
+        self.load()
+
+    # --- Carga y recarga de la configuración ---
+
+    def _read_config(self) -> dict:
+        if not self.config_path:
+            return default_config()
+        with open(self.config_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self):
+        config = self._read_config()
+        if self.config_path:
+            self._mtime = os.path.getmtime(self.config_path)
+
+        outliers = OutlierDetection.from_config(config.get("outlier_detection", {}))
+        health = config.get("health_check", {})
+        health_interval = float(health.get("interval", self.health_interval))
+        health_timeout = float(health.get("timeout", self.health_timeout))
+        unhealthy_threshold = int(
+            health.get("unhealthy_threshold", self.unhealthy_threshold)
+        )
+
+        # Se conserva el estado de salud de las instancias que siguen existiendo.
+        previous = {
+            (name, i.url): i
+            for name, service in self.table.services.items()
+            for i in service.instances
+        }
+        services = {}
+        for name, spec in config["services"].items():
+            urls = spec["instances"]
+            if not isinstance(urls, list) or not all(isinstance(u, str) for u in urls):
+                raise TypeError(f"{name}: 'instances' debe ser una lista de URLs")
+            instances = [
+                previous.get((name, url.rstrip("/"))) or Instance(url.rstrip("/"))
+                for url in urls
+            ]
+            services[name] = Service(
+                name=name,
+                prefix=spec.get("prefix", name),
+                instances=instances,
+                health_path=spec.get("health_path", "/ready"),
+                balancer=create_balancer(spec.get("balancer", DEFAULT_BALANCER)),
+                retries=int(spec.get("retries", 1)),
+                outlier_detection=outliers,
+            )
+        # Nada se aplica hasta validar toda la configuración.
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.unhealthy_threshold = unhealthy_threshold
+        # Sustitución atómica: una sola asignación de referencia.
+        self.table = RouteTable(services)
+        logging.info(f"Registro de servicios cargado: {sorted(services)}")
+
+    def reload_if_changed(self) -> bool:
+        if not self.config_path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            if mtime == self._mtime:
+                return False
+            self.load()
+            return True
+        except Exception as e:
+            # Una configuración inválida (JSON roto o con otra forma, p. ej.
+            # "services": [] o tipos incorrectos) no debe tumbar el gateway:
+            # se mantiene la anterior.
+            logging.error(f"No se pudo recargar {self.config_path}: {e}")
+            return False
+
+    async def watch_config(self, interval: float = 2.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                logging.error(f"Error al vigilar {self.config_path}: {e}")
+
+    # --- Consultas ---
+
+    @property
+    def services(self) -> Dict[str, Service]:
+        return self.table.services
+
+    def get(self, name: str) -> Optional[Service]:
+        return self.table.services.get(name)
+
+    def resolve(self, path: str) -> Optional[Service]:
+        return self.table.resolve(path)
+
+    # --- Health checks activos ---
+
+    async def _check_instance(
+        self, client: httpx.AsyncClient, service: Service, instance: Instance
+    ):
+        try:
+            response = await client.get(
+                f"{instance.url}{service.health_path}", timeout=self.health_timeout
+            )
+            ok = response.is_success
+        except httpx.HTTPError:
+            ok = False
+
+        if ok:
+            if not instance.healthy:
+                logging.info(f"Instancia {instance.url} de {service.name} recuperada")
+            instance.healthy = True
+            instance.consecutive_failures = 0
+        else:
+            instance.consecutive_failures += 1
+            if instance.healthy and instance.consecutive_failures >= self.unhealthy_threshold:
+                logging.warning(
+                    f"Instancia {instance.url} de {service.name} fuera de rotación"
+                )
+                instance.healthy = False
+
+    async def check_health(self, client: httpx.AsyncClient):
+        table = self.table
+        await asyncio.gather(
+            *(
+                self._check_instance(client, service, instance)
+                for service in table.services.values()
+                for instance in service.instances
+            )
+        )
+
+    async def health_loop(self, client: httpx.AsyncClient):
+        while True:
+            try:
+                await self.check_health(client)
+            except Exception as e:
+                logging.error(f"Error en el health check de instancias: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    def describe(self) -> Dict[str, List[dict]]:
+        return {
+            name: [
+                {
+                    "url": i.url,
+                    "healthy": i.healthy,
+                    "ejected": i.stats.is_ejected(now()),
+                    "outstanding": i.stats.outstanding,
+                    "ewma_latency_ms": round((i.stats.ewma_latency or 0) * 1000, 2),
+                }
+                for i in service.instances
+            ]
+            for name, service in self.table.services.items()
+        }
@@ -0,0 +1,431 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+from fastapi import Request
+
+import compression
+import main
+from balancing import create_balancer, now
+from registry import PrefixTrie, ServiceRegistry
+
+
+def escribir_config(path, instancias):
+    path.write_text(
+        json.dumps(
+            {
+                "services": {
+                    "productos-service": {"prefix": "productos", "instances": instancias},
+                    "pagos-service": {"prefix": "pagos", "instances": ["http://pagos:8002"]},
+                }
+            }
+        )
+    )
+
+
+def test_trie_prefijo_mas_largo():
+    trie = PrefixTrie()
+    trie.insert("pagos", "pagos")
+    trie.insert("pagos/settlements", "liquidaciones")
+    assert trie.lookup("pagos/") == "pagos"
+    assert trie.lookup("pagos/15") == "pagos"
+    assert trie.lookup("pagos/settlements/abc") == "liquidaciones"
+    assert trie.lookup("productos/") is None
+
+
+def test_round_robin_entre_instancias(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004", "http://p2:8004"])
+    registry = ServiceRegistry(str(config))
+    servicio = registry.resolve("productos/1")
+    urls = [servicio.choose_instance().url for _ in range(4)]
+    assert urls == ["http://p1:8004", "http://p2:8004"] * 2
+
+
+def test_instancia_no_sana_sale_de_rotacion(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004", "http://p2:8004"])
+    registry = ServiceRegistry(str(config))
+    servicio = registry.get("productos-service")
+    servicio.instances[0].healthy = False
+    assert {servicio.choose_instance().url for _ in range(4)} == {"http://p2:8004"}
+
+    # Si ninguna instancia está sana se usan todas (fail-open).
+    servicio.instances[1].healthy = False
+    assert len(servicio.available_instances()) == 2
+
+
+def test_recarga_conserva_estado_de_salud(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    registry = ServiceRegistry(str(config))
+    registry.get("productos-service").instances[0].healthy = False
+
+    escribir_config(config, ["http://p1:8004", "http://p3:8004"])
+    registry._mtime = None  # Fuerza la recarga aunque el mtime no cambie
+    assert registry.reload_if_changed()
+    instancias = registry.get("productos-service").instances
+    assert [(i.url, i.healthy) for i in instancias] == [
+        ("http://p1:8004", False),
+        ("http://p3:8004", True),
+    ]
+
+
+def test_config_invalida_mantiene_la_anterior(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    registry = ServiceRegistry(str(config))
+    config.write_text("{no es json")
+    registry._mtime = None
+    assert not registry.reload_if_changed()
+    assert registry.resolve("productos/").instances[0].url == "http://p1:8004"
+
+
+def test_config_con_forma_incorrecta_mantiene_la_anterior(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    registry = ServiceRegistry(str(config))
+    invalidas = [
+        {"services": []},
+        {"services": {"productos-service": {"instances": "http://p2:8004"}}},
+        {"services": {"productos-service": {"instances": [8004]}}},
+        {"services": {}, "health_check": {"interval": "rapido"}},
+        [],
+    ]
+    for invalida in invalidas:
+        config.write_text(json.dumps(invalida))
+        registry._mtime = None
+        assert not registry.reload_if_changed()
+    assert registry.health_interval == 5.0
+    assert registry.resolve("productos/").instances[0].url == "http://p1:8004"
+
+
+def test_watch_config_sobrevive_a_una_config_invalida(tmp_path, monkeypatch):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    registry = ServiceRegistry(str(config))
+    llamadas = []
+
+    def recargar():
+        llamadas.append(1)
+        if len(llamadas) == 1:
+            raise TypeError("forma inesperada")
+        return False
+
+    monkeypatch.setattr(registry, "reload_if_changed", recargar)
+
+    async def vigilar():
+        tarea = asyncio.create_task(registry.watch_config(interval=0))
+        while len(llamadas) < 3:
+            await asyncio.sleep(0)
+        assert not tarea.done()
+        tarea.cancel()
+
+    asyncio.run(vigilar())
+
+
+def test_least_outstanding_prefiere_la_instancia_menos_ocupada(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004", "http://p2:8004"])
+    registry = ServiceRegistry(str(config))
+    servicio = registry.get("productos-service")
+    servicio.balancer = create_balancer("least_outstanding")
+    servicio.instances[0].stats.outstanding = 3
+    assert servicio.choose_instance().url == "http://p2:8004"
+
+
+def test_p2c_evita_la_instancia_lenta(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004", "http://lenta:8004"])
+    registry = ServiceRegistry(str(config))
+    servicio = registry.get("productos-service")
+    servicio.balancer = create_balancer("p2c")
+    servicio.record(servicio.instances[0], 0.010, failed=False)
+    servicio.record(servicio.instances[1], 0.500, failed=False)
+    assert {servicio.choose_instance().url for _ in range(10)} == {"http://p1:8004"}
+
+
+def test_p2c_no_prefiere_la_instancia_que_falla_rapido(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004", "http://rota:8004"])
+    registry = ServiceRegistry(str(config))
+    servicio = registry.get("productos-service")
+    servicio.balancer = create_balancer("p2c")
+    servicio.record(servicio.instances[0], 0.050, failed=False)
+    servicio.record(servicio.instances[1], 0.001, failed=True)
+    assert {servicio.choose_instance().url for _ in range(10)} == {"http://p1:8004"}
+
+
+def test_send_to_service_libera_la_peticion_en_curso_ante_un_error(tmp_path, monkeypatch):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    servicio = ServiceRegistry(str(config)).get("productos-service")
+
+    def handler(request):
+        raise RuntimeError("error inesperado")
+
+    async def enviar():
+        main.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            await main.send_to_service(servicio, "GET", "api/v1/productos/")
+        finally:
+            await main.http.cerrar()
+
+    try:
+        asyncio.run(enviar())
+    except RuntimeError:
+        pass
+    assert servicio.instances[0].stats.outstanding == 0
+    assert servicio.instances[0].stats.ewma_latency is None
+
+
+def test_expulsion_de_atipicos(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004", "http://p2:8004"])
+    registry = ServiceRegistry(str(config))
+    servicio = registry.get("productos-service")
+    mala = servicio.instances[0]
+    for _ in range(servicio.outlier_detection.consecutive_errors):
+        mala.stats.start()
+        servicio.record(mala, 0.01, failed=True)
+    assert mala.stats.is_ejected(now())
+    assert {servicio.choose_instance().url for _ in range(4)} == {"http://p2:8004"}
+
+    # Nunca se expulsa más del porcentaje máximo de instancias.
+    buena = servicio.instances[1]
+    for _ in range(servicio.outlier_detection.consecutive_errors):
+        servicio.record(buena, 0.01, failed=True)
+    assert not buena.stats.is_ejected(now())
+
+
+def test_reintento_en_otra_instancia(tmp_path):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://caida:8004", "http://p2:8004"])
+    servicio = ServiceRegistry(str(config)).get("productos-service")
+
+    def handler(request):
+        if request.url.host == "caida":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    async def enviar():
+        main.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await main.send_to_service(servicio, "GET", "api/v1/productos/")
+        finally:
+            await main.http.cerrar()
+
+    respuesta = asyncio.run(enviar())
+    assert respuesta.status_code == 200
+    assert servicio.instances[0].stats.consecutive_errors == 1
+
+
+def test_negociacion_de_codificacion():
+    assert compression.negotiate("gzip, deflate") == "gzip"
+    assert compression.negotiate("gzip;q=0.5, br") == "br"
+    assert compression.negotiate("br;q=0, gzip;q=0") is None
+    assert compression.negotiate("identity") is None
+    assert compression.negotiate(None) is None
+
+
+def test_respuesta_grande_se_comprime_y_pequena_no():
+    grande = json.dumps([{"descripcion": "x" * 50}] * 100).encode()
+    respuesta = asyncio.run(
+        compression.build_response(grande, 200, "application/json", "gzip")
+    )
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(respuesta.body) == grande
+
+    pequena = asyncio.run(
+        compression.build_response(b"{}", 200, "application/json", "gzip")
+    )
+    assert "content-encoding" not in pequena.headers
+
+
+def test_cuerpo_ya_comprimido_se_reenvia_sin_recomprimir():
+    comprimido = gzip.compress(b'{"ok": true}' * 200)
+
+    def handler(request):
+        return httpx.Response(
+            200,
+            stream=httpx.ByteStream(comprimido),
+            headers={"content-type": "application/json", "content-encoding": "gzip"},
+        )
+
+    async def leer():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            async with client.stream("GET", "http://productos/") as respuesta:
+                return await compression.read_upstream_body(respuesta, "gzip, br")
+
+    cuerpo, codificacion = asyncio.run(leer())
+    assert (cuerpo, codificacion) == (comprimido, "gzip")
+
+
+def test_etag_debil_al_comprimir_y_rangos_sin_comprimir():
+    grande = json.dumps([{"descripcion": "x" * 50}] * 100).encode()
+    respuesta = asyncio.run(
+        compression.build_response(
+            grande, 200, "application/json", "gzip", upstream_headers={"ETag": '"abc"'}
+        )
+    )
+    assert respuesta.headers["etag"] == 'W/"abc"'
+
+    parcial = asyncio.run(
+        compression.build_response(
+            grande[:2000], 206, "application/json", "gzip",
+            upstream_headers={"Content-Range": f"bytes 0-1999/{len(grande)}"},
+        )
+    )
+    assert "content-encoding" not in parcial.headers
+    assert parcial.headers["content-range"] == f"bytes 0-1999/{len(grande)}"
+
+
+def test_batch_respeta_el_orden_y_el_plazo(tmp_path, monkeypatch):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    monkeypatch.setattr(main, "registry", ServiceRegistry(str(config)))
+
+    async def handler(request):
+        if request.url.host == "pagos":
+            await asyncio.sleep(1)
+        return httpx.Response(200, json={"ruta": request.url.path, "q": request.url.query.decode()})
+
+    subpeticiones = [
+        main.batch.SubRequest(path="/api/v1/productos/?limit=2"),
+        main.batch.SubRequest(path="/api/v1/pagos/"),
+        main.batch.SubRequest(path="/api/v1/desconocido/"),
+        main.batch.SubRequest(path="/api/v1/batch"),
+    ]
+
+    async def enviar():
+        main.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await main.batch.run_batch(
+                subpeticiones, lambda sub: main.execute_subrequest(sub, {}), timeout=0.2
+            )
+        finally:
+            await main.http.cerrar()
+
+    respuesta = json.loads(main.batch.encode_results(asyncio.run(enviar())))
+    assert [r["status"] for r in respuesta] == [200, 504, 404, 400]
+    assert respuesta[0]["body"] == {"ruta": "/api/v1/productos/", "q": "limit=2"}
+    pagos = main.registry.get("pagos-service").instances[0]
+    assert pagos.stats.outstanding == 0
+
+
+def test_imagenes_se_reenvian_en_streaming_con_rangos_y_head(tmp_path, monkeypatch):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    monkeypatch.setattr(main, "registry", ServiceRegistry(str(config)))
+    imagen = bytes(range(256)) * 64
+    leidos = []
+
+    def handler(request):
+        headers = {"content-type": "image/png", "etag": '"abc"', "accept-ranges": "bytes"}
+        if request.method == "HEAD":
+            headers["content-length"] = str(len(imagen))
+            return httpx.Response(200, stream=httpx.ByteStream(b""), headers=headers)
+        if request.headers.get("range") == "bytes=0-99":
+            headers["content-range"] = f"bytes 0-99/{len(imagen)}"
+            return httpx.Response(206, stream=httpx.ByteStream(imagen[:100]), headers=headers)
+        leidos.append(request.url.path)
+        return httpx.Response(200, stream=httpx.ByteStream(imagen), headers=headers)
+
+    main.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        from fastapi.testclient import TestClient
+
+        client = TestClient(main.app)
+        ruta = "/api/v1/productos/imagenes/abc.png"
+        completa = client.get(ruta, headers={"accept-encoding": "gzip"})
+        assert completa.status_code == 200
+        assert completa.content == imagen
+        assert "content-encoding" not in completa.headers
+        assert completa.headers["etag"] == '"abc"'
+
+        parcial = client.get(ruta, headers={"range": "bytes=0-99"})
+        assert parcial.status_code == 206
+        assert parcial.content == imagen[:100]
+        assert parcial.headers["content-range"] == f"bytes 0-99/{len(imagen)}"
+
+        cabecera = client.head(ruta)
+        assert cabecera.status_code == 200
+        assert cabecera.content == b""
+        assert cabecera.headers["content-length"] == str(len(imagen))
+    finally:
+        asyncio.run(main.http.cerrar())
+    assert leidos == ["/api/v1/productos/imagenes/abc.png"]
+    assert main.registry.get("productos-service").instances[0].stats.outstanding == 0
+
+
+
+def test_batch_no_copia_encabezados_hop_by_hop(tmp_path, monkeypatch):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    monkeypatch.setattr(main, "registry", ServiceRegistry(str(config)))
+    recibidos = []
+
+    def handler(request):
+        recibidos.append(request.headers)
+        return httpx.Response(200, json={})
+
+    async def enviar():
+        main.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            return await main.batch_requests(
+                [main.batch.SubRequest(path="/api/v1/productos/")],
+                Request(
+                    {
+                        "type": "http",
+                        "method": "POST",
+                        "path": "/api/v1/batch",
+                        "headers": [
+                            (b"authorization", b"Bearer x"),
+                            (b"connection", b"keep-alive, upgrade"),
+                            (b"keep-alive", b"timeout=5"),
+                            (b"transfer-encoding", b"chunked"),
+                            (b"te", b"trailers"),
+                            (b"upgrade", b"websocket"),
+                        ],
+                    }
+                ),
+            )
+        finally:
+            await main.http.cerrar()
+
+    asyncio.run(enviar())
+    headers = recibidos[0]
+    assert headers["authorization"] == "Bearer x"
+    for nombre in ("keep-alive", "transfer-encoding", "te", "upgrade"):
+        assert nombre not in headers
+    # httpx pone su propio Connection; el del cliente no se copia.
+    assert "upgrade" not in headers.get("connection", "")
+
+
+def test_vary_del_servicio_se_conserva_junto_a_accept_encoding(tmp_path, monkeypatch):
+    config = tmp_path / "services.json"
+    escribir_config(config, ["http://p1:8004"])
+    monkeypatch.setattr(main, "registry", ServiceRegistry(str(config)))
+
+    def handler(request):
+        return httpx.Response(
+            200,
+            stream=httpx.ByteStream(json.dumps([{"id": 1}] * 200).encode()),
+            headers={"content-type": "application/json", "vary": "Accept"},
+        )
+
+    main.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    try:
+        from fastapi.testclient import TestClient
+
+        respuesta = TestClient(main.app).get(
+            "/api/v1/productos/", headers={"accept-encoding": "gzip"}
+        )
+    finally:
+        asyncio.run(main.http.cerrar())
+    assert respuesta.headers["content-encoding"] == "gzip"
+    # El CORS del gateway agrega además Origin.
+    assert respuesta.headers["vary"].startswith("Accept, Accept-Encoding")
+    assert compression.merge_vary("accept-encoding", "Accept-Encoding") == "accept-encoding"
+    assert compression.merge_vary("*", "Accept-Encoding") == "*"
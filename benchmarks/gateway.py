@@ -0,0 +1,425 @@
+"""Benchmark de rendimiento del gateway contra backends simulados.
+
+Mide el coste propio del gateway (forward_request, pool de conexiones,
+compresión, caché) sin que pesen los microservicios ni Postgres:
+
+1. Arranca los backends simulados de `benchmarks/stubs.py` en otro proceso.
+2. Arranca el gateway con `common.server` (un worker por defecto) apuntando
+   a ellos mediante las variables *_SERVICE_URL.
+3. Con concurrencia fija, envía peticiones a las rutas del proxy durante
+   `--duration` segundos, tras un calentamiento que no se mide.
+4. Repite la misma carga directamente contra los backends: la diferencia de
+   latencias es lo que añade el salto por el gateway.
+
+Reporta por ruta y en total: peticiones/s, p50/p90/p99, latencia añadida
+(p50 y p99), errores (5xx o de conexión), CPU del gateway (ms de CPU por
+cada 1000 peticiones y % de un núcleo) y memoria (RSS al final y pico). CPU
+y memoria se leen de /proc, así que solo están disponibles en Linux.
+
+El generador de carga es Python (httpx): a concurrencias altas puede ser él
+el cuello de botella. Conviene mirar el % de CPU del gateway; si está lejos
+de 100% por worker, el gateway no está saturado.
+
+Uso:
+
+    python benchmarks/gateway.py
+    python benchmarks/gateway.py --concurrency 64 --duration 20 --payload-bytes 50000
+    python benchmarks/gateway.py --latency-ms 5 --distribution exponencial --error-rate 0.01
+    python benchmarks/gateway.py --accept-encoding gzip --json
+
+Sale con código 1 si las peticiones/s totales quedan por debajo de
+`--min-rps` o la latencia añadida p99 supera `--max-added-p99-ms`, para
+detectar regresiones en CI.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from startup import RAIZ, get, puerto_libre
+from stubs import DISTRIBUCIONES, SERVICIOS
+
+RUTAS = "/api/v1/productos/,/api/v1/pedidos/,/api/v1/pagos/"
+TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+# --- Procesos ---
+
+
+def lanzar(comando: List[str], **kwargs) -> subprocess.Popen:
+    # La salida va a un archivo y no a un pipe: el gateway registra cada
+    # petición y un pipe lleno lo bloquearía a mitad de la medición.
+    log = tempfile.TemporaryFile()
+    proceso = subprocess.Popen(
+        comando, stdout=subprocess.DEVNULL, stderr=log, **kwargs
+    )
+    proceso.log = log
+    return proceso
+
+
+def esperar_listo(proceso: subprocess.Popen, urls: List[str], timeout: float):
+    inicio = time.perf_counter()
+    pendientes = list(urls)
+    while pendientes:
+        if proceso.poll() is not None:
+            proceso.log.seek(0)
+            raise RuntimeError(proceso.log.read().decode(errors="replace"))
+        if time.perf_counter() - inicio > timeout:
+            raise TimeoutError(f"Sin respuesta de {pendientes[0]} en {timeout}s")
+        try:
+            if get(pendientes[0], timeout=0.5) == 200:
+                pendientes.pop(0)
+                continue
+        except OSError:
+            pass
+        time.sleep(0.05)
+
+
+def detener(proceso: subprocess.Popen):
+    proceso.terminate()
+    try:
+        proceso.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+    proceso.log.close()
+
+
+def arrancar_stubs(args, puertos: Dict[str, int]) -> subprocess.Popen:
+    comando = [
+        sys.executable, os.path.join(RAIZ, "benchmarks", "stubs.py"),
+        "--services", ",".join(puertos),
+        "--ports", ",".join(str(p) for p in puertos.values()),
+        "--payload-bytes", str(args.payload_bytes),
+        "--latency-ms", str(args.latency_ms),
+        "--distribution", args.distribution,
+        "--error-rate", str(args.error_rate),
+    ]
+    if args.stubs_config:
+        comando += ["--config", args.stubs_config]
+    proceso = lanzar(comando)
+    esperar_listo(
+        proceso, [f"http://127.0.0.1:{p}/ready" for p in puertos.values()], args.timeout
+    )
+    return proceso
+
+
+def arrancar_gateway(args, puertos: Dict[str, int], puerto: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = RAIZ + os.pathsep + env.get("PYTHONPATH", "")
+    env.pop("GATEWAY_SERVICES_FILE", None)
+    env.pop("PROFILE_TOKEN", None)
+    for nombre, variable in SERVICIOS.items():
+        env[variable] = f"http://127.0.0.1:{puertos[nombre]}"
+    proceso = lanzar(
+        [
+            sys.executable, "-m", "common.server", "main:app",
+            "--host", "127.0.0.1", "--port", str(puerto),
+            "--workers", str(args.gateway_workers),
+        ],
+        cwd=os.path.join(RAIZ, "api-gateway"),
+        env=env,
+    )
+    esperar_listo(proceso, [f"http://127.0.0.1:{puerto}/ready"], args.timeout)
+    return proceso
+
+
+# --- CPU y memoria desde /proc ---
+
+
+def procesos(pid: int) -> List[int]:
+    """El proceso y sus descendientes (los workers de uvicorn)."""
+    pids, pendientes = [], [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        pids.append(actual)
+        try:
+            for tarea in os.listdir(f"/proc/{actual}/task"):
+                with open(f"/proc/{actual}/task/{tarea}/children") as f:
+                    pendientes.extend(int(h) for h in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def segundos_de_cpu(pid: int) -> Optional[float]:
+    total = 0
+    try:
+        for p in procesos(pid):
+            with open(f"/proc/{p}/stat") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            # utime y stime son los campos 14 y 15 de /proc/<pid>/stat.
+            total += int(campos[11]) + int(campos[12])
+    except (OSError, IndexError):
+        return None
+    return total / TICKS
+
+
+def memoria_kb(pid: int, campo: str) -> Optional[int]:
+    """Suma de VmRSS o VmHWM (pico) del proceso y sus descendientes, en kB."""
+    total = 0
+    try:
+        for p in procesos(pid):
+            with open(f"/proc/{p}/status") as f:
+                for linea in f:
+                    if linea.startswith(campo + ":"):
+                        total += int(linea.split()[1])
+    except OSError:
+        return None
+    return total
+
+
+# --- Carga ---
+
+
+def percentil(ordenados: List[float], q: float) -> float:
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+async def generar_carga(
+    bases: Dict[str, str],
+    rutas: List[str],
+    concurrencia: int,
+    duracion: float,
+    calentamiento: float,
+    accept_encoding: str,
+    pid: Optional[int] = None,
+) -> dict:
+    """Envía GET a `rutas` con `concurrencia` peticiones en curso.
+
+    `bases` da la URL base de cada ruta (el gateway, o el backend de esa ruta
+    en la medición directa). Si se indica `pid`, mide su CPU en la ventana
+    medida.
+    """
+    latencias: Dict[str, List[float]] = {r: [] for r in rutas}
+    errores: Dict[str, int] = {r: 0 for r in rutas}
+    limites = httpx.Limits(
+        max_connections=concurrencia, max_keepalive_connections=concurrencia
+    )
+    inicio = time.perf_counter()
+    inicio_medido = inicio + calentamiento
+    fin = inicio_medido + duracion
+
+    async with httpx.AsyncClient(
+        limits=limites, timeout=30, headers={"Accept-Encoding": accept_encoding}
+    ) as client:
+
+        async def trabajador(n: int):
+            while True:
+                t = time.perf_counter()
+                if t >= fin:
+                    return
+                ruta = rutas[n % len(rutas)]
+                n += 1
+                try:
+                    r = await client.get(bases[ruta] + ruta)
+                    fallo = r.status_code >= 500
+                except httpx.HTTPError:
+                    fallo = True
+                if t >= inicio_medido:
+                    latencias[ruta].append(time.perf_counter() - t)
+                    errores[ruta] += fallo
+
+        async def medir_cpu():
+            await asyncio.sleep(calentamiento)
+            antes = segundos_de_cpu(pid)
+            await asyncio.sleep(duracion)
+            despues = segundos_de_cpu(pid)
+            if antes is None or despues is None:
+                return None
+            return despues - antes
+
+        tareas = [trabajador(i) for i in range(concurrencia)]
+        medicion = medir_cpu() if pid else asyncio.sleep(0)
+        *_, cpu = await asyncio.gather(*tareas, medicion)
+
+    return {"latencias": latencias, "errores": errores, "duracion": duracion, "cpu": cpu}
+
+
+def resumir(ruta: str, latencias: List[float], errores: int, duracion: float) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        "ruta": ruta,
+        "peticiones": len(ordenadas),
+        "rps": round(len(ordenadas) / duracion, 1),
+        "p50_ms": round(percentil(ordenadas, 0.50) * 1000, 2),
+        "p90_ms": round(percentil(ordenadas, 0.90) * 1000, 2),
+        "p99_ms": round(percentil(ordenadas, 0.99) * 1000, 2),
+        "errores": errores,
+    }
+
+
+def resumen_por_ruta(resultado: dict) -> List[dict]:
+    filas = [
+        resumir(r, lat, resultado["errores"][r], resultado["duracion"])
+        for r, lat in resultado["latencias"].items()
+    ]
+    todas = [l for lat in resultado["latencias"].values() for l in lat]
+    filas.append(
+        resumir("total", todas, sum(resultado["errores"].values()), resultado["duracion"])
+    )
+    return filas
+
+
+def ejecutar(args) -> dict:
+    rutas = [r.strip() for r in args.paths.split(",") if r.strip()]
+    servicios = list(SERVICIOS)
+    puertos = {nombre: puerto_libre() for nombre in servicios}
+    puerto_gateway = puerto_libre()
+    gateway_url = f"http://127.0.0.1:{puerto_gateway}"
+
+    def backend_de(ruta: str) -> str:
+        # /api/v1/<servicio>/... -> backend simulado de ese servicio.
+        nombre = ruta.split("/")[3]
+        if nombre not in puertos:
+            raise SystemExit(f"La ruta {ruta} no corresponde a ningún servicio")
+        return f"http://127.0.0.1:{puertos[nombre]}"
+
+    directos = {r: backend_de(r) for r in rutas}
+    stubs = arrancar_stubs(args, puertos)
+    try:
+        gateway = arrancar_gateway(args, puertos, puerto_gateway)
+        try:
+            via_gateway = asyncio.run(
+                generar_carga(
+                    {r: gateway_url for r in rutas},
+                    rutas,
+                    args.concurrency,
+                    args.duration,
+                    args.warmup,
+                    args.accept_encoding,
+                    pid=gateway.pid,
+                )
+            )
+            rss_kb = memoria_kb(gateway.pid, "VmRSS")
+            pico_kb = memoria_kb(gateway.pid, "VmHWM")
+        finally:
+            detener(gateway)
+        directo = None
+        if not args.no_direct:
+            directo = asyncio.run(
+                generar_carga(
+                    directos,
+                    rutas,
+                    args.concurrency,
+                    args.duration,
+                    args.warmup,
+                    args.accept_encoding,
+                )
+            )
+    finally:
+        detener(stubs)
+
+    filas = resumen_por_ruta(via_gateway)
+    if directo is not None:
+        for fila, base in zip(filas, resumen_por_ruta(directo)):
+            fila["directo_p50_ms"] = base["p50_ms"]
+            fila["directo_p99_ms"] = base["p99_ms"]
+            fila["añadido_p50_ms"] = round(fila["p50_ms"] - base["p50_ms"], 2)
+            fila["añadido_p99_ms"] = round(fila["p99_ms"] - base["p99_ms"], 2)
+
+    total = filas[-1]
+    cpu = via_gateway["cpu"]
+    return {
+        "configuracion": {
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "gateway_workers": args.gateway_workers,
+            "payload_bytes": args.payload_bytes,
+            "latency_ms": args.latency_ms,
+            "distribution": args.distribution,
+            "error_rate": args.error_rate,
+            "accept_encoding": args.accept_encoding,
+        },
+        "rutas": filas,
+        "gateway": {
+            "cpu_segundos": None if cpu is None else round(cpu, 3),
+            "cpu_porcentaje": None if cpu is None else round(cpu / args.duration * 100, 1),
+            "cpu_ms_por_1000_peticiones": (
+                None
+                if cpu is None or not total["peticiones"]
+                else round(cpu * 1000 / total["peticiones"] * 1000, 1)
+            ),
+            "rss_mb": None if rss_kb is None else round(rss_kb / 1024, 1),
+            "rss_pico_mb": None if pico_kb is None else round(pico_kb / 1024, 1),
+        },
+    }
+
+
+def imprimir(resultado: dict):
+    c = resultado["configuracion"]
+    print(
+        f"concurrencia={c['concurrency']} duración={c['duration']}s "
+        f"workers={c['gateway_workers']} payload={c['payload_bytes']}B "
+        f"latencia={c['latency_ms']}ms ({c['distribution']}) errores={c['error_rate']} "
+        f"accept-encoding={c['accept_encoding']}"
+    )
+    print(
+        f"{'ruta':<24} {'rps':>9} {'p50':>8} {'p90':>8} {'p99':>8} "
+        f"{'+p50':>8} {'+p99':>8} {'errores':>8}"
+    )
+    for f in resultado["rutas"]:
+        print(
+            f"{f['ruta']:<24} {f['rps']:>9.1f} {f['p50_ms']:>6.2f}ms {f['p90_ms']:>6.2f}ms "
+            f"{f['p99_ms']:>6.2f}ms {f.get('añadido_p50_ms', float('nan')):>6.2f}ms "
+            f"{f.get('añadido_p99_ms', float('nan')):>6.2f}ms {f['errores']:>8}"
+        )
+    g = resultado["gateway"]
+    print(
+        f"gateway: CPU {g['cpu_porcentaje']}% de un núcleo, "
+        f"{g['cpu_ms_por_1000_peticiones']} ms de CPU por 1000 peticiones, "
+        f"RSS {g['rss_mb']} MB (pico {g['rss_pico_mb']} MB)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--paths", default=RUTAS, help="Rutas del proxy, separadas por comas")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--gateway-workers", type=int, default=1)
+    parser.add_argument("--payload-bytes", type=int, default=2048)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=DISTRIBUCIONES, default="fija")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stubs-config", help="JSON por servicio (ver stubs.py)")
+    parser.add_argument(
+        "--accept-encoding", default="identity", help="Accept-Encoding del cliente"
+    )
+    parser.add_argument("--no-direct", action="store_true", help="Sin medición directa")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--min-rps", type=float)
+    parser.add_argument("--max-added-p99-ms", type=float)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    resultado = ejecutar(args)
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    else:
+        imprimir(resultado)
+
+    total = resultado["rutas"][-1]
+    regresiones = []
+    if args.min_rps and total["rps"] < args.min_rps:
+        regresiones.append(f"{total['rps']} peticiones/s < {args.min_rps}")
+    añadido = total.get("añadido_p99_ms")
+    if args.max_added_p99_ms and añadido is not None and añadido > args.max_added_p99_ms:
+        regresiones.append(f"latencia añadida p99 {añadido}ms > {args.max_added_p99_ms}ms")
+    if regresiones:
+        print(f"Superan el límite: {'; '.join(regresiones)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Benchmark de arranque en frío de los servicios.
+
+Para cada servicio mide, en procesos nuevos:
+
+- import: tiempo de `import main` (sin contar el arranque del intérprete).
+- ready: desde que se lanza uvicorn hasta que GET /ready responde 200.
+- primera petición: duración de la primera petición real después de /ready.
+
+Por defecto los servicios con SQL usan un SQLite temporal y auth el almacén
+en memoria, así que no hace falta levantar las bases de datos. Con `--use-env`
+se respetan las variables de entorno actuales (DATABASE_URL, etc.).
+
+Uso:
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --services productos,pedidos --runs 5
+    python benchmarks/startup.py --max-import-ms 1500 --max-ready-ms 5000
+
+Sale con código 1 si alguna mediana supera los límites indicados, para poder
+detectar regresiones de arranque en CI.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# nombre: (directorio, ¿usa SQL?, ruta de la primera petición)
+SERVICIOS = {
+    "auth": ("services/authentication", False, "/health"),
+    "productos": ("services/productos", True, "/api/v1/productos/"),
+    "pedidos": ("services/pedidos", True, "/api/v1/pedidos/"),
+    "pagos": ("services/pagos", True, "/api/v1/pagos/"),
+    "gateway": ("api-gateway", False, "/health"),
+}
+
+MEDIR_IMPORT = (
+    "import time; t = time.perf_counter(); import main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def entorno(nombre: str, usa_sql: bool, tmp: str, use_env: bool) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = RAIZ + os.pathsep + env.get("PYTHONPATH", "")
+    if not use_env:
+        if usa_sql:
+            env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, nombre)}.db"
+            env.pop("DATABASE_REPLICA_URLS", None)
+        else:
+            env.pop("DATABASE_URL", None)
+        env["ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+    return env
+
+
+def medir_import(directorio: str, env: dict) -> float:
+    salida = subprocess.run(
+        [sys.executable, "-c", MEDIR_IMPORT],
+        cwd=directorio,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def get(url: str, timeout: float = 2.0) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as r:
+            r.read()
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def medir_arranque(directorio: str, env: dict, ruta: str, timeout: float):
+    puerto = puerto_libre()
+    base = f"http://127.0.0.1:{puerto}"
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(puerto), "--log-level", "warning",
+        ],
+        cwd=directorio,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        while True:
+            if proceso.poll() is not None:
+                raise RuntimeError(proceso.stderr.read().decode(errors="replace"))
+            if time.perf_counter() - inicio > timeout:
+                raise TimeoutError(f"/ready no respondió en {timeout}s")
+            try:
+                if get(f"{base}/ready", timeout=0.5) == 200:
+                    break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.01)
+        listo = time.perf_counter() - inicio
+
+        t = time.perf_counter()
+        status = get(f"{base}{ruta}")
+        primera = time.perf_counter() - t
+        return listo, primera, status
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def medir_servicio(nombre: str, runs: int, use_env: bool, timeout: float) -> dict:
+    carpeta, usa_sql, ruta = SERVICIOS[nombre]
+    directorio = os.path.join(RAIZ, carpeta)
+    imports, listos, primeras, status = [], [], [], None
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = entorno(nombre, usa_sql, tmp, use_env)
+            imports.append(medir_import(directorio, env))
+            listo, primera, status = medir_arranque(directorio, env, ruta, timeout)
+            listos.append(listo)
+            primeras.append(primera)
+    return {
+        "servicio": nombre,
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "ready_ms": round(statistics.median(listos) * 1000, 1),
+        "primera_peticion_ms": round(statistics.median(primeras) * 1000, 1),
+        "primera_peticion": f"GET {ruta} -> {status}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", default=",".join(SERVICIOS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--use-env", action="store_true")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-ready-ms", type=float)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    nombres = [s.strip() for s in args.services.split(",") if s.strip()]
+    desconocidos = set(nombres) - set(SERVICIOS)
+    if desconocidos:
+        parser.error(f"Servicios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    resultados = [
+        medir_servicio(n, args.runs, args.use_env, args.timeout) for n in nombres
+    ]
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        print(f"{'servicio':<10} {'import':>10} {'ready':>10} {'1ª petición':>12}")
+        for r in resultados:
+            print(
+                f"{r['servicio']:<10} {r['import_ms']:>8.1f}ms {r['ready_ms']:>8.1f}ms "
+                f"{r['primera_peticion_ms']:>10.1f}ms  {r['primera_peticion']}"
+            )
+
+    regresiones = [
+        r["servicio"]
+        for r in resultados
+        if (args.max_import_ms and r["import_ms"] > args.max_import_ms)
+        or (args.max_ready_ms and r["ready_ms"] > args.max_ready_ms)
+    ]
+    if regresiones:
+        print(f"Superan el límite: {', '.join(regresiones)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Backends simulados para medir el gateway sin los microservicios reales.
+
+Levanta un servidor ASGI mínimo por cada servicio del registro del gateway
+(auth, productos, pedidos, pagos). Cada uno responde a cualquier ruta con un
+JSON pregenerado del tamaño indicado, tras una demora aleatoria según la
+distribución elegida, y falla con 503 en la proporción `--error-rate`.
+`/ready` y `/health` responden siempre 200 sin demora, para que los chequeos
+activos del gateway los den por sanos.
+
+No hay base de datos ni validación: todo lo que se mide al ponerlos detrás
+del gateway es coste del propio gateway.
+
+Uso:
+
+    python benchmarks/stubs.py
+    python benchmarks/stubs.py --payload-bytes 50000 --latency-ms 5 --distribution exponencial
+    python benchmarks/stubs.py --config stubs.json
+
+El archivo `--config` permite valores distintos por servicio:
+
+    {"productos": {"payload_bytes": 50000, "latency_ms": 8, "distribution": "lognormal"},
+     "pagos": {"error_rate": 0.05}}
+
+Al arrancar imprime las variables *_SERVICE_URL con las que lanzar el gateway.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+from dataclasses import dataclass, fields, replace
+from typing import Dict, List
+
+import uvicorn
+
+# servicio: variable de entorno que lee el registro del gateway
+SERVICIOS = {
+    "auth": "AUTH_SERVICE_URL",
+    "productos": "PRODUCTOS_SERVICE_URL",
+    "pedidos": "PEDIDOS_SERVICE_URL",
+    "pagos": "PAGOS_SERVICE_URL",
+}
+DISTRIBUCIONES = ("fija", "uniforme", "exponencial", "lognormal")
+# Dispersión de la lognormal: con sigma=1 el p99 queda en ~10 veces la mediana.
+SIGMA_LOGNORMAL = 1.0
+
+HEADERS_JSON = [(b"content-type", b"application/json")]
+
+
+@dataclass
+class Perfil:
+    payload_bytes: int = 2048
+    latency_ms: float = 0.0
+    distribution: str = "fija"
+    error_rate: float = 0.0
+
+
+def demora(perfil: Perfil, rng: random.Random) -> float:
+    """Segundos de espera de una petición; `latency_ms` es siempre la media."""
+    media = perfil.latency_ms / 1000
+    if media <= 0:
+        return 0.0
+    if perfil.distribution == "uniforme":
+        return rng.uniform(0, 2 * media)
+    if perfil.distribution == "exponencial":
+        return rng.expovariate(1 / media)
+    if perfil.distribution == "lognormal":
+        mu = math.log(media) - SIGMA_LOGNORMAL**2 / 2
+        return rng.lognormvariate(mu, SIGMA_LOGNORMAL)
+    return media
+
+
+def generar_cuerpo(nombre: str, payload_bytes: int) -> bytes:
+    """Listado JSON con forma de registros reales de aproximadamente ese tamaño."""
+    registros, tamano = [], 2
+    while tamano < payload_bytes:
+        i = len(registros) + 1
+        registro = {
+            "id": i,
+            "nombre": f"{nombre}-{i}",
+            "descripcion": "x" * 64,
+            "precio": 1000.0 + i,
+            "activo": True,
+        }
+        registros.append(registro)
+        tamano += len(json.dumps(registro, separators=(",", ":"))) + 1
+    return json.dumps(registros, separators=(",", ":")).encode()
+
+
+class Stub:
+    """Aplicación ASGI de un backend simulado."""
+
+    def __init__(self, nombre: str, perfil: Perfil, semilla: int = 0):
+        self.nombre = nombre
+        self.perfil = perfil
+        self.cuerpo = generar_cuerpo(nombre, perfil.payload_bytes)
+        self.error = json.dumps({"detail": f"{nombre}: error simulado"}).encode()
+        self.rng = random.Random(semilla)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        mensaje = await receive()
+        while mensaje.get("more_body"):
+            mensaje = await receive()
+
+        if scope["path"] in ("/ready", "/health"):
+            status, cuerpo = 200, b'{"status":"ok"}'
+        else:
+            espera = demora(self.perfil, self.rng)
+            if espera:
+                await asyncio.sleep(espera)
+            if self.rng.random() < self.perfil.error_rate:
+                status, cuerpo = 503, self.error
+            else:
+                status, cuerpo = 200, self.cuerpo
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": HEADERS_JSON + [(b"content-length", str(len(cuerpo)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def servir(stubs: Dict[str, Stub], host: str, puertos: List[int]):
+    servidores = [
+        uvicorn.Server(
+            uvicorn.Config(
+                stub, host=host, port=puerto, lifespan="off", log_level="warning"
+            )
+        )
+        for stub, puerto in zip(stubs.values(), puertos)
+    ]
+    await asyncio.gather(*(s.serve() for s in servidores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--services", default=",".join(SERVICIOS))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=18100)
+    parser.add_argument(
+        "--ports", help="Puertos separados por comas, en el orden de --services"
+    )
+    parser.add_argument("--payload-bytes", type=int, default=Perfil.payload_bytes)
+    parser.add_argument("--latency-ms", type=float, default=Perfil.latency_ms)
+    parser.add_argument("--distribution", choices=DISTRIBUCIONES, default="fija")
+    parser.add_argument("--error-rate", type=float, default=Perfil.error_rate)
+    parser.add_argument("--config", help="JSON con valores por servicio")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    nombres = [s.strip() for s in args.services.split(",") if s.strip()]
+    desconocidos = set(nombres) - set(SERVICIOS)
+    if desconocidos:
+        parser.error(f"Servicios desconocidos: {', '.join(sorted(desconocidos))}")
+    if args.ports:
+        puertos = [int(p) for p in args.ports.split(",")]
+        if len(puertos) != len(nombres):
+            parser.error("--ports debe tener un puerto por servicio")
+    else:
+        puertos = [args.base_port + i for i in range(len(nombres))]
+
+    base = Perfil(args.payload_bytes, args.latency_ms, args.distribution, args.error_rate)
+    por_servicio = {}
+    if args.config:
+        with open(args.config) as f:
+            por_servicio = json.load(f)
+    validos = {f.name for f in fields(Perfil)}
+    stubs = {}
+    for i, nombre in enumerate(nombres):
+        ajustes = por_servicio.get(nombre, {})
+        if set(ajustes) - validos:
+            parser.error(f"Claves no válidas para {nombre}: {sorted(set(ajustes) - validos)}")
+        perfil = replace(base, **ajustes)
+        if perfil.distribution not in DISTRIBUCIONES:
+            parser.error(f"Distribución no válida para {nombre}: {perfil.distribution}")
+        stubs[nombre] = Stub(nombre, perfil, semilla=args.seed + i)
+
+    for (nombre, stub), puerto in zip(stubs.items(), puertos):
+        print(f"{SERVICIOS[nombre]}=http://{args.host}:{puerto}  # {stub.perfil}")
+    sys.stdout.flush()
+    asyncio.run(servir(stubs, args.host, puertos))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Archivo frío de registros antiguos en NDJSON comprimido con gzip.
+
+Los servicios mueven periódicamente a disco los registros terminados o
+inactivos más antiguos que `ARCHIVE_RETENTION_DAYS`, para que las tablas
+calientes solo contengan el conjunto de trabajo.
+
+Cada lote archivado es un archivo inmutable:
+
+    <ARCHIVE_DIR>/<tabla>/<AAAA-MM>/<id_min>-<id_max>-<sufijo>.ndjson.gz
+
+El mes sale de `fecha_creacion` y el rango de ids va en el nombre, de modo
+que una búsqueda por id solo descomprime los archivos cuyo rango lo contiene.
+El archivo se escribe (y sincroniza a disco) antes de borrar las filas: si el
+borrado falla, el registro queda en ambos sitios y se vuelve a archivar en la
+siguiente pasada, lo que es inofensivo porque se consulta primero la base.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from common.db import clave_advisory_lock
+from common.serialization import dumps
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_RETENTION_DAYS = int(os.getenv("ARCHIVE_RETENTION_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+
+EXTENSION = ".ndjson.gz"
+
+
+class Archivo:
+    def __init__(self, tabla: str, directorio: str = ARCHIVE_DIR):
+        self.tabla = tabla
+        self.directorio = os.path.join(directorio, tabla)
+
+    def escribir(self, registros: Iterable[dict]) -> List[str]:
+        """Guarda los registros agrupados por mes de creación. Devuelve las rutas."""
+        por_mes: Dict[str, List[dict]] = defaultdict(list)
+        for registro in registros:
+            por_mes[registro["fecha_creacion"].strftime("%Y-%m")].append(registro)
+
+        rutas = []
+        for mes, grupo in por_mes.items():
+            ids = [r["id"] for r in grupo]
+            carpeta = os.path.join(self.directorio, mes)
+            os.makedirs(carpeta, exist_ok=True)
+            nombre = f"{min(ids)}-{max(ids)}-{uuid.uuid4().hex[:8]}{EXTENSION}"
+            ruta = os.path.join(carpeta, nombre)
+            temporal = ruta + ".tmp"
+            with open(temporal, "wb") as f:
+                with gzip.GzipFile(fileobj=f, mode="wb", mtime=0) as gz:
+                    for registro in sorted(grupo, key=lambda r: r["id"]):
+                        gz.write(dumps(registro) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta)
+            rutas.append(ruta)
+        return rutas
+
+    def _segmentos(self) -> List[Tuple[int, int, str]]:
+        segmentos = []
+        if not os.path.isdir(self.directorio):
+            return segmentos
+        for mes in os.scandir(self.directorio):
+            if not mes.is_dir():
+                continue
+            for archivo in os.scandir(mes.path):
+                if not archivo.name.endswith(EXTENSION):
+                    continue
+                try:
+                    id_min, id_max, _ = archivo.name.split("-", 2)
+                    segmentos.append((int(id_min), int(id_max), archivo.path))
+                except ValueError:
+                    continue
+        return segmentos
+
+    def buscar(self, id: int) -> Optional[dict]:
+        """Busca un registro archivado por id (ruta lenta: descomprime y recorre)."""
+        # Los registros se serializan con "id" como primera clave, así que basta
+        # con comparar el inicio de la línea antes de decodificarla.
+        prefijo = b'{"id":%d,' % id
+        for id_min, id_max, ruta in self._segmentos():
+            if not id_min <= id <= id_max:
+                continue
+            with gzip.open(ruta, "rb") as f:
+                for linea in f:
+                    if linea.startswith(prefijo):
+                        return json.loads(linea)
+        return None
+
+
+def limite_de_retencion(dias: int = ARCHIVE_RETENTION_DAYS) -> datetime:
+    return datetime.utcnow() - timedelta(days=dias)
+
+
+def tomar_lock_de_archivado(db, nombre: str) -> bool:
+    """Evita que varios workers archiven a la vez (lock liberado al hacer commit)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return bool(
+        db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:clave)"),
+            {"clave": clave_advisory_lock(f"archive:{nombre}")},
+        ).scalar()
+    )
+
+
+async def archivado_periodico(archivar: Callable[[], int], nombre: str):
+    """Tarea del lifespan que ejecuta `archivar` cada `ARCHIVE_INTERVAL_SECONDS`."""
+    while True:
+        try:
+            archivados = await run_in_threadpool(archivar)
+            if archivados:
+                logging.info(f"Registros de {nombre} archivados: {archivados}")
+        except Exception as e:
+            logging.error(f"Error al archivar {nombre}: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SECONDS)
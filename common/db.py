@@ -0,0 +1,350 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from sqlalchemy import MetaData, cast, create_engine, literal, select, text, union_all
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+# Réplicas de lectura: URLs separadas por comas (vacío = solo el primario).
+DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")
+# Segundos que dura la marca de escritura de un cliente (ver `Database`).
+DB_STICKY_SECONDS = float(os.getenv("DB_STICKY_SECONDS", "5"))
+# Retraso máximo de replicación (segundos) para seguir usando una réplica.
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "2"))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Conexiones que se abren al arrancar, antes de que /ready responda 200.
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "2"))
+
+METODOS_DE_LECTURA = {"GET", "HEAD", "OPTIONS"}
+# Encabezado con el instante de la última escritura del cliente; también va
+# en la cookie `db_escritura_<servicio>`.
+HEADER_ESCRITURA = "X-DB-Escritura"
+
+# Retraso de una réplica de PostgreSQL. Si ya aplicó todo lo que recibió el
+# retraso es 0, aunque el primario lleve tiempo sin escrituras.
+SQL_RETRASO_REPLICA = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+    """
+)
+
+
+def clave_advisory_lock(nombre: str) -> int:
+    """Convierte un nombre en una clave estable para `pg_advisory_lock`."""
+    return zlib.crc32(nombre.encode("utf-8"))
+
+
+def tabla_de_lote(nombre: str, columnas: Sequence[Tuple[str, object]], filas: Iterable):
+    """Filas literales como tabla, para `UPDATE ... FROM` por lotes.
+
+    Equivale a `(VALUES ...) AS nombre (columnas)` pero se genera como
+    `SELECT CAST(? AS tipo) AS col, ... UNION ALL SELECT ...`, que PostgreSQL
+    y SQLite aceptan por igual (SQLite no admite alias de columnas en
+    VALUES): los tests ejecutan la misma sentencia que producción. El CAST
+    fija el tipo de cada columna, que de otro modo PostgreSQL infiere como
+    texto en un UNION de parámetros.
+    """
+    consultas = [
+        select(
+            *[
+                cast(literal(valor), tipo).label(columna)
+                for valor, (columna, tipo) in zip(fila, columnas)
+            ]
+        )
+        for fila in filas
+    ]
+    return union_all(*consultas).subquery(nombre)
+
+
+def bloquear_claves(db, espacio: str, ids) -> None:
+    """Toma un advisory lock de transacción por cada id dentro de `espacio`.
+
+    Sirve para serializar "comprobar y luego insertar" sobre claves que no
+    tienen un índice único. Los locks se liberan con el commit o el rollback
+    y se toman ordenados por id para que dos lotes no se bloqueen en cruz.
+    En SQLite no hace nada: ya serializa las escrituras.
+    """
+    ids = sorted(set(ids))
+    if not ids or db.get_bind().dialect.name != "postgresql":
+        return
+    # Forma de dos claves int4: (espacio, id). Con ORDER BY en la misma
+    # consulta PostgreSQL evalúa la función después de ordenar.
+    db.execute(
+        text(
+            "SELECT pg_advisory_xact_lock(:espacio, id) "
+            "FROM unnest(CAST(:ids AS integer[])) AS t(id) ORDER BY id"
+        ),
+        {"espacio": clave_advisory_lock(espacio) & 0x7FFFFFFF, "ids": ids},
+    )
+
+
+def crear_esquema(engine, metadata: MetaData, nombre: str):
+    """Crea las tablas que falten, serializando a los workers que arrancan a la vez.
+
+    En PostgreSQL se toma un advisory lock de transacción: el primer worker
+    crea el esquema y el resto, al obtener el lock, encuentra las tablas ya
+    creadas y no hace nada.
+    """
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(:clave)"),
+                {"clave": clave_advisory_lock(f"schema:{nombre}")},
+            )
+        # Solo crea tablas nuevas; los índices y columnas que se agregan a
+        # tablas existentes van en el migraciones.py del servicio.
+        metadata.create_all(bind=conn)
+
+
+class RutaConReplicas(APIRoute):
+    """Ruta que repite en el primario una lectura fallida en una réplica.
+
+    Si la réplica que entregó `get_read_db` falla a mitad de la consulta,
+    se saca de rotación hasta el próximo chequeo y se vuelve a ejecutar el
+    handler, que esta vez obtiene una sesión del primario. Se usa como
+    `route_class` del router del servicio.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def con_reintento(request: Request):
+            try:
+                return await handler(request)
+            except OperationalError:
+                replica = getattr(request.state, "replica", None)
+                if replica is None:
+                    raise
+                replica.sana = False
+                logging.warning(
+                    f"Réplica {replica.url} falló; {request.url.path} se repite en el primario"
+                )
+                request.state.replica = None
+                request.state.forzar_primario = True
+                return await handler(request)
+
+        return con_reintento
+
+
+class Replica:
+    def __init__(self, url: str, engine_kwargs: dict):
+        self.url = url
+        self.engine = create_engine(url, **engine_kwargs)
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine
+        )
+        # Hasta el primer chequeo no se usa: se lee del primario.
+        self.sana = False
+        self.retraso: Optional[float] = None
+
+    def comprobar(self, max_retraso: float):
+        try:
+            with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    self.retraso = float(conn.execute(SQL_RETRASO_REPLICA).scalar())
+                else:
+                    conn.execute(text("SELECT 1"))
+                    self.retraso = 0.0
+            self.sana = self.retraso <= max_retraso
+        except Exception as e:
+            if self.sana:
+                logging.warning(f"Réplica {self.url} fuera de servicio: {e}")
+            self.sana = False
+            self.retraso = None
+
+
+class Database:
+    """Motor y sesiones de SQLAlchemy de un servicio.
+
+    El motor no se crea al importar el módulo sino en `iniciar()`, que se llama
+    desde el lifespan de la aplicación. Así cada worker (uvicorn --workers,
+    gunicorn) abre su propio pool de conexiones después del fork.
+
+    Con réplicas configuradas, `get_read_db` reparte las lecturas entre las
+    réplicas sanas cuyo retraso no supera `DB_REPLICA_MAX_LAG` y vuelve al
+    primario si no hay ninguna.
+
+    Para leer lo que uno mismo escribió, cada respuesta exitosa a un método
+    que no es de lectura lleva el instante de la escritura en la cookie
+    `db_escritura_<servicio>` y en el encabezado `X-DB-Escritura`. Mientras
+    el cliente la devuelva (la cookie sola, o el encabezado) y no hayan
+    pasado `DB_STICKY_SECONDS`, sus lecturas van al primario. La marca viaja
+    con el cliente, así que vale para cualquier worker o instancia detrás
+    del gateway. El frontend llama al gateway desde otro origen, así que sus
+    `fetch` usan `credentials: 'include'` (el CORS del gateway permite
+    credenciales); sin eso el navegador no devuelve la cookie.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        metadata: MetaData,
+        nombre: str,
+        replicas: Optional[str] = None,
+        migraciones: Optional[list] = None,
+        **engine_kwargs,
+    ):
+        self.url = url
+        self.metadata = metadata
+        self.nombre = nombre
+        # Cambios sobre tablas existentes (ver common/migraciones.py).
+        self.migraciones = migraciones or []
+        self.engine_kwargs = {"pool_pre_ping": True, **engine_kwargs}
+        self.engine = None
+        self.SessionLocal: Optional[sessionmaker] = None
+        if replicas is None:
+            replicas = DATABASE_REPLICA_URLS
+        self.replica_urls = [u.strip() for u in replicas.split(",") if u.strip()]
+        self.replicas: List[Replica] = []
+        self._turno = itertools.count()
+        self.cookie_escritura = f"db_escritura_{nombre}"
+
+    def iniciar(self):
+        if self.engine is not None:
+            return
+        self.engine = create_engine(self.url, **self.engine_kwargs)
+        self.SessionLocal = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine
+        )
+        crear_esquema(self.engine, self.metadata, self.nombre)
+        self.migrar()
+        self.replicas = [Replica(u, self.engine_kwargs) for u in self.replica_urls]
+        self.comprobar_replicas()
+        self.calentar()
+
+    def migrar(self):
+        """Aplica las migraciones normales y lanza las concurrentes en segundo plano."""
+        if not self.migraciones:
+            return
+        from common.migraciones import aplicar_migraciones
+
+        aplicar_migraciones(self.engine, self.migraciones, self.nombre)
+        if any(m.concurrente for m in self.migraciones):
+            threading.Thread(
+                target=self._migrar_en_segundo_plano,
+                args=(self.engine,),
+                name=f"migraciones-{self.nombre}",
+                daemon=True,
+            ).start()
+
+    def _migrar_en_segundo_plano(self, engine):
+        from common.migraciones import aplicar_migraciones
+
+        try:
+            aplicar_migraciones(engine, self.migraciones, self.nombre, concurrentes=True)
+        except Exception as e:
+            logging.error(f"Error en las migraciones de fondo de {self.nombre}: {e}")
+
+    def calentar(self, conexiones: int = DB_POOL_WARM):
+        """Abre `conexiones` del pool a la vez para que la primera petición no las pague."""
+        abiertas = []
+        try:
+            for _ in range(conexiones):
+                conn = self.engine.connect()
+                abiertas.append(conn)
+                conn.execute(text("SELECT 1"))
+        finally:
+            for conn in abiertas:
+                conn.close()
+
+    def cerrar(self):
+        if self.engine is not None:
+            self.engine.dispose()
+        for replica in self.replicas:
+            replica.engine.dispose()
+        self.engine = None
+        self.SessionLocal = None
+        self.replicas = []
+
+    def comprobar_replicas(self):
+        for replica in self.replicas:
+            replica.comprobar(DB_REPLICA_MAX_LAG)
+
+    async def vigilar_replicas(self, intervalo: float = DB_REPLICA_CHECK_INTERVAL):
+        """Tarea del lifespan que revisa salud y retraso de las réplicas."""
+        while self.replicas:
+            await asyncio.sleep(intervalo)
+            await run_in_threadpool(self.comprobar_replicas)
+
+    def instalar(self, app: FastAPI):
+        """Agrega el middleware que marca las escrituras de cada cliente."""
+
+        @app.middleware("http")
+        async def marcar_escritura(request: Request, call_next):
+            response = await call_next(request)
+            if request.method not in METODOS_DE_LECTURA and response.status_code < 400:
+                marca = f"{time.time():.3f}"
+                response.headers[HEADER_ESCRITURA] = marca
+                response.set_cookie(
+                    self.cookie_escritura,
+                    marca,
+                    max_age=max(1, int(DB_STICKY_SECONDS + 0.999)),
+                    httponly=True,
+                    samesite="lax",
+                )
+            return response
+
+    def leer_del_primario(self, request: Request) -> bool:
+        """Si el cliente escribió hace menos de `DB_STICKY_SECONDS`."""
+        valor = request.headers.get(HEADER_ESCRITURA) or request.cookies.get(
+            self.cookie_escritura
+        )
+        try:
+            return time.time() - float(valor) < DB_STICKY_SECONDS
+        except (TypeError, ValueError):
+            return False
+
+    def elegir_replica(self) -> Optional[Replica]:
+        sanas = [r for r in self.replicas if r.sana]
+        if not sanas:
+            return None
+        return sanas[next(self._turno) % len(sanas)]
+
+    def sesion(self):
+        if self.SessionLocal is None:
+            self.iniciar()
+        return self.SessionLocal()
+
+    def get_db(self, request: Request):
+        """Dependencia de FastAPI que entrega una sesión del primario por petición."""
+        db = self.sesion()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def get_read_db(self, request: Request):
+        """Como `get_db`, pero para handlers de solo lectura: usa una réplica si puede."""
+        replica = None
+        if (
+            self.replicas
+            and not getattr(request.state, "forzar_primario", False)
+            and not self.leer_del_primario(request)
+        ):
+            replica = self.elegir_replica()
+        if replica is None:
+            yield from self.get_db(request)
+            return
+        # Si la réplica falla, RutaConReplicas la saca de rotación y repite la
+        # lectura en el primario.
+        request.state.replica = replica
+        db = replica.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
@@ -1,5 +1,3 @@
-import json
-import requests
 import httpx
 from datetime import datetime
 from typing import Any
@@ -40,6 +38,6 @@ async def send_async_request(url: str, method: str = "GET", json_data: Any = Non
 #     # Envía una petición para obtener todos los usuarios del servicio de autenticación
 #     users = send_request_to_service(auth_url)
 #     print("Usuarios obtenidos:", users)
-# except requests.exceptions.RequestException:
+# except httpx.RequestError:
 #     print("No se pudo obtener la lista de usuarios.")
 #
\ No newline at end of file
@@ -0,0 +1,37 @@
+from typing import Optional
+
+import httpx
+
+
+class ClienteHTTP:
+    """Cliente httpx compartido por todas las peticiones de un worker.
+
+    Se abre en el lifespan de la aplicación (después del fork) y reutiliza las
+    conexiones con los demás microservicios en lugar de crear un
+    `httpx.AsyncClient` nuevo en cada llamada.
+    """
+
+    def __init__(self, timeout: float = 5.0, max_connections: int = 100):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def abrir(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def cerrar(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or self.abrir()
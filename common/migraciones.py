@@ -0,0 +1,158 @@
+"""Migraciones de esquema sobre tablas que ya existen.
+
+`create_all` solo crea tablas nuevas: no agrega columnas ni índices a una
+tabla existente. Esos cambios se declaran en el `migraciones.py` de cada
+servicio y se aplican una sola vez, registrados en `schema_migrations`.
+
+- Las migraciones normales se aplican en `Database.iniciar()`, antes de que
+  /ready responda 200, cada una en su transacción.
+- Las migraciones `concurrente=True` (por ejemplo `CREATE INDEX
+  CONCURRENTLY`) no pueden ir dentro de una transacción y en tablas grandes
+  tardan; se aplican en un hilo de fondo después del arranque, sin bloquear
+  las escrituras.
+
+Un advisory lock evita que varios workers o instancias apliquen la misma
+migración a la vez. Si una migración falla se registra el error y se vuelve
+a intentar en el próximo arranque.
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List, Sequence
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from common.db import clave_advisory_lock
+
+TABLA = "schema_migrations"
+
+
+@dataclass
+class Migracion:
+    id: str
+    aplicar: Callable[[Connection], None]
+    concurrente: bool = False
+
+
+def agregar_columna(tabla: str, columna: str, definicion: str) -> Callable[[Connection], None]:
+    """`ALTER TABLE ... ADD COLUMN` si la columna todavía no existe."""
+
+    def aplicar(conn: Connection):
+        if columna in {c["name"] for c in inspect(conn).get_columns(tabla)}:
+            return
+        conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+
+    return aplicar
+
+
+def crear_indice(
+    nombre: str, tabla: str, columnas: Sequence[str], unico: bool = False
+) -> Callable[[Connection], None]:
+    """Crea un índice sin bloquear escrituras (CONCURRENTLY en PostgreSQL).
+
+    Si un intento anterior de `CREATE INDEX CONCURRENTLY` falló, el índice
+    queda marcado como inválido; se borra antes de volver a crearlo.
+    """
+    tipo = "UNIQUE INDEX" if unico else "INDEX"
+    lista = ", ".join(columnas)
+
+    def aplicar(conn: Connection):
+        if conn.dialect.name != "postgresql":
+            conn.execute(text(f"CREATE {tipo} IF NOT EXISTS {nombre} ON {tabla} ({lista})"))
+            return
+        invalido = conn.execute(
+            text(
+                "SELECT NOT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :nombre"
+            ),
+            {"nombre": nombre},
+        ).scalar()
+        if invalido:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}"))
+        conn.execute(
+            text(f"CREATE {tipo} CONCURRENTLY IF NOT EXISTS {nombre} ON {tabla} ({lista})")
+        )
+
+    return aplicar
+
+
+def borrar_indice(nombre: str) -> Callable[[Connection], None]:
+    """Borra un índice si existe (CONCURRENTLY en PostgreSQL)."""
+
+    def aplicar(conn: Connection):
+        concurrente = " CONCURRENTLY" if conn.dialect.name == "postgresql" else ""
+        conn.execute(text(f"DROP INDEX{concurrente} IF EXISTS {nombre}"))
+
+    return aplicar
+
+
+def _aplicadas(engine: Engine) -> set:
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {TABLA} "
+                "(id VARCHAR(200) PRIMARY KEY, aplicada TIMESTAMP)"
+            )
+        )
+        return set(conn.execute(text(f"SELECT id FROM {TABLA}")).scalars())
+
+
+def _registrar(conn: Connection, migracion: Migracion):
+    conn.execute(
+        text(f"INSERT INTO {TABLA} (id, aplicada) VALUES (:id, :aplicada)"),
+        {"id": migracion.id, "aplicada": datetime.utcnow()},
+    )
+
+
+def aplicar_migraciones(
+    engine: Engine, migraciones: List[Migracion], nombre: str, concurrentes: bool = False
+) -> List[str]:
+    """Aplica las migraciones pendientes del tipo indicado. Devuelve sus ids."""
+    seleccion = [m for m in migraciones if m.concurrente == concurrentes]
+    if not seleccion:
+        return []
+    aplicadas = []
+    # La conexión del lock va en AUTOCOMMIT: una transacción abierta en ella
+    # haría esperar para siempre a CREATE INDEX CONCURRENTLY.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        postgres = lock.dialect.name == "postgresql"
+        clave = clave_advisory_lock(f"migraciones:{nombre}:{int(concurrentes)}")
+        if postgres:
+            if concurrentes:
+                # Las de fondo las aplica un solo worker; el resto no espera.
+                if not lock.execute(
+                    text("SELECT pg_try_advisory_lock(:clave)"), {"clave": clave}
+                ).scalar():
+                    return []
+            else:
+                # Las normales se esperan: el servicio las necesita para arrancar.
+                lock.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": clave})
+        try:
+            hechas = _aplicadas(engine)
+            for migracion in seleccion:
+                if migracion.id in hechas:
+                    continue
+                try:
+                    if concurrentes:
+                        with engine.connect().execution_options(
+                            isolation_level="AUTOCOMMIT"
+                        ) as conn:
+                            migracion.aplicar(conn)
+                            _registrar(conn, migracion)
+                    else:
+                        with engine.begin() as conn:
+                            migracion.aplicar(conn)
+                            _registrar(conn, migracion)
+                except Exception as e:
+                    logging.error(f"Migración {migracion.id} de {nombre} fallida: {e}")
+                    if not concurrentes:
+                        raise
+                    continue
+                logging.info(f"Migración {migracion.id} de {nombre} aplicada")
+                aplicadas.append(migracion.id)
+        finally:
+            if postgres:
+                lock.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": clave})
+    return aplicadas
@@ -0,0 +1,329 @@
+"""Profiling bajo demanda y captura de peticiones lentas para las apps FastAPI.
+
+Uso en un servicio:
+
+    from common.profiling import instalar_profiling
+    instalar_profiling(app)
+
+- Si la petición trae `X-Profile-Token` con el valor de `PROFILE_TOKEN`, se
+  activa el muestreador de pilas mientras dura la petición y la captura se
+  guarda siempre (su id vuelve en el encabezado `X-Profile-Id`).
+- Toda petición que tarde más de `SLOW_REQUEST_MS` se guarda con las
+  sentencias SQL que ejecutó y su duración. Con `PROFILE_SLOW_REQUESTS=1` el
+  muestreador queda encendido de forma permanente y esas capturas incluyen
+  también el perfil de pilas.
+- Las últimas `PROFILE_CAPTURES` capturas se consultan en `/admin/profiles`
+  (con el mismo encabezado de token).
+- Las capturas se guardan como archivos JSON en `PROFILE_DIR`, compartido
+  por todos los workers del servicio (WEB_CONCURRENCY): el listado muestra
+  las de todos y un `X-Profile-Id` se puede consultar desde cualquiera. Con
+  varias réplicas del contenedor, cada una tiene su propio directorio salvo
+  que se monte un volumen común.
+
+El muestreador es un hilo que lee `sys._current_frames()` cada
+`PROFILE_INTERVAL_MS` y solo conserva pilas que pasan por código de la
+aplicación (no por librerías ni por el event loop en reposo). Con tráfico
+concurrente las muestras de una ventana pueden incluir otras peticiones.
+"""
+
+import hmac
+import itertools
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import List, Optional
+
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "x-profile-token"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+PROFILE_SLOW_REQUESTS = os.getenv("PROFILE_SLOW_REQUESTS", "0") == "1"
+PROFILE_CAPTURES = int(os.getenv("PROFILE_CAPTURES", "50"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Por defecto un directorio temporal por servicio (su directorio de trabajo).
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(
+    tempfile.gettempdir(), f"profiles-{os.path.basename(os.getcwd())}"
+)
+MAX_SQL_POR_PETICION = 200
+MAX_PILAS_POR_CAPTURA = 50
+
+_sql_peticion: ContextVar[Optional[list]] = ContextVar("sql_peticion", default=None)
+
+
+# --- Sentencias SQL por petición ---
+
+
+def _antes_de_sql(conn, cursor, statement, parameters, context, executemany):
+    if _sql_peticion.get() is not None:
+        conn.info.setdefault("profiling_inicio", []).append(time.perf_counter())
+
+
+def _despues_de_sql(conn, cursor, statement, parameters, context, executemany):
+    sentencias = _sql_peticion.get()
+    if sentencias is None or not conn.info.get("profiling_inicio"):
+        return
+    duracion = time.perf_counter() - conn.info["profiling_inicio"].pop()
+    if len(sentencias) < MAX_SQL_POR_PETICION:
+        # No se guardan los parámetros: pueden contener datos personales.
+        sentencias.append(
+            {"sql": statement, "ms": round(duracion * 1000, 3), "executemany": executemany}
+        )
+
+
+def _registrar_eventos_sql():
+    # Solo si el servicio ya usa SQLAlchemy: el gateway y auth no lo importan
+    # y así no pagan su tiempo de importación al arrancar.
+    if "sqlalchemy" not in sys.modules:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    # Se registran sobre la clase Engine para cubrir también los engines que se
+    # crean después (Database.iniciar los crea en el lifespan).
+    if not event.contains(Engine, "before_cursor_execute", _antes_de_sql):
+        event.listen(Engine, "before_cursor_execute", _antes_de_sql)
+        event.listen(Engine, "after_cursor_execute", _despues_de_sql)
+
+
+# --- Muestreador de pilas ---
+
+
+class Muestreador:
+    def __init__(self, intervalo_ms: float, raiz: str, max_muestras: int = 200_000):
+        self.intervalo = intervalo_ms / 1000
+        self.raiz = os.path.abspath(raiz)
+        self.muestras = deque(maxlen=max_muestras)
+        self.siempre = False
+        self._usuarios = 0
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+
+    def _es_de_la_app(self, filename: str) -> bool:
+        return (
+            filename.startswith(self.raiz)
+            and "site-packages" not in filename
+            and filename != __file__
+        )
+
+    def _pila(self, frame):
+        pila, de_la_app = [], False
+        while frame is not None:
+            code = frame.f_code
+            de_la_app = de_la_app or self._es_de_la_app(code.co_filename)
+            pila.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(pila)) if de_la_app else None
+
+    def _ejecutar(self):
+        propio = threading.get_ident()
+        while True:
+            # La condición de salida y el borrado de `_hilo` van juntos bajo el
+            # lock: si no, un `adquirir()` entre ambos vería el hilo todavía
+            # vivo, no arrancaría otro y se quedaría sin muestras.
+            with self._lock:
+                if not (self.siempre or self._usuarios > 0):
+                    self._hilo = None
+                    return
+            ahora = time.monotonic()
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = self._pila(frame)
+                if pila:
+                    self.muestras.append((ahora, pila))
+            time.sleep(self.intervalo)
+
+    def _asegurar_hilo(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(
+                target=self._ejecutar, name="profiling-muestreador", daemon=True
+            )
+            self._hilo.start()
+
+    def encender_siempre(self):
+        with self._lock:
+            self.siempre = True
+            self._asegurar_hilo()
+
+    def adquirir(self):
+        with self._lock:
+            self._usuarios += 1
+            self._asegurar_hilo()
+
+    def liberar(self):
+        with self._lock:
+            self._usuarios = max(0, self._usuarios - 1)
+
+    @property
+    def activo(self) -> bool:
+        return self._hilo is not None
+
+    def perfil(self, desde: float, hasta: float):
+        """Pilas agregadas (formato "collapsed" de flamegraph) de una ventana de tiempo."""
+        conteo = Counter(pila for t, pila in list(self.muestras) if desde <= t <= hasta)
+        return {
+            "intervalo_ms": self.intervalo * 1000,
+            "muestras": sum(conteo.values()),
+            "pilas": [
+                {"pila": pila, "muestras": n}
+                for pila, n in conteo.most_common(MAX_PILAS_POR_CAPTURA)
+            ],
+        }
+
+
+# --- Capturas compartidas entre workers ---
+
+
+class Capturas:
+    """Capturas como archivos `<id>.json` en un directorio compartido.
+
+    El id empieza por el instante en hexadecimal de ancho fijo, así que el
+    orden por nombre es el orden de llegada; sigue el pid del worker y un
+    contador, para que dos workers nunca generen el mismo id.
+    """
+
+    _ID = re.compile(r"^[0-9a-f]{16}-\d+-\d+$")
+
+    def __init__(self, directorio: str, maximo: int):
+        self.directorio = directorio
+        self.maximo = maximo
+        self._contador = itertools.count(1)
+
+    def nuevo_id(self) -> str:
+        return f"{time.time_ns():016x}-{os.getpid()}-{next(self._contador)}"
+
+    def _ruta(self, id: str) -> str:
+        return os.path.join(self.directorio, f"{id}.json")
+
+    def _ids(self) -> List[str]:
+        try:
+            nombres = os.listdir(self.directorio)
+        except FileNotFoundError:
+            return []
+        ids = (n[: -len(".json")] for n in nombres if n.endswith(".json"))
+        return sorted((i for i in ids if self._ID.match(i)), reverse=True)
+
+    def guardar(self, captura: dict):
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta = self._ruta(captura["id"])
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w") as f:
+            json.dump(captura, f)
+        os.replace(temporal, ruta)
+        # Conserva solo las `maximo` más recientes; si dos workers recortan a
+        # la vez, el que llega segundo ya no encuentra el archivo.
+        for viejo in self._ids()[self.maximo :]:
+            try:
+                os.remove(self._ruta(viejo))
+            except FileNotFoundError:
+                pass
+
+    def obtener(self, id: str) -> Optional[dict]:
+        if not self._ID.match(id):
+            return None
+        try:
+            with open(self._ruta(id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def listar(self) -> List[dict]:
+        capturas = (self.obtener(id) for id in self._ids()[: self.maximo])
+        return [c for c in capturas if c is not None]
+
+
+muestreador = Muestreador(PROFILE_INTERVAL_MS, os.getcwd())
+capturas = Capturas(PROFILE_DIR, PROFILE_CAPTURES)
+
+
+def _token_valido(token: Optional[str]) -> bool:
+    # Comparación en tiempo constante para no filtrar el token por tiempos.
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(
+        token.encode("utf-8"), PROFILE_TOKEN.encode("utf-8")
+    )
+
+
+def _verificar_token(token: Optional[str]):
+    if not _token_valido(token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+admin_router = APIRouter(prefix="/admin/profiles", tags=["profiling"])
+
+
+@admin_router.get("/")
+def listar_capturas(x_profile_token: Optional[str] = Header(None)):
+    _verificar_token(x_profile_token)
+    return [
+        {k: v for k, v in c.items() if k not in ("sql", "perfil")}
+        for c in capturas.listar()
+    ]
+
+
+@admin_router.get("/{id}")
+def obtener_captura(id: str, x_profile_token: Optional[str] = Header(None)):
+    _verificar_token(x_profile_token)
+    captura = capturas.obtener(id)
+    if captura is None:
+        raise HTTPException(status_code=404, detail="Captura no encontrada")
+    return captura
+
+
+def instalar_profiling(app: FastAPI):
+    """Agrega el middleware de profiling y los endpoints de administración."""
+    _registrar_eventos_sql()
+    if PROFILE_SLOW_REQUESTS:
+        muestreador.encender_siempre()
+
+    @app.middleware("http")
+    async def perfilar_peticion(request: Request, call_next):
+        solicitado = _token_valido(request.headers.get(PROFILE_HEADER))
+        if solicitado:
+            muestreador.adquirir()
+        sentencias = []
+        token_sql = _sql_peticion.set(sentencias)
+        inicio = time.monotonic()
+        status_code = 500
+        captura = None
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+        finally:
+            fin = time.monotonic()
+            _sql_peticion.reset(token_sql)
+            if solicitado:
+                muestreador.liberar()
+            duracion_ms = (fin - inicio) * 1000
+            if solicitado or duracion_ms >= SLOW_REQUEST_MS:
+                captura = {
+                    "id": capturas.nuevo_id(),
+                    "motivo": "solicitado" if solicitado else "lenta",
+                    "metodo": request.method,
+                    "ruta": request.url.path,
+                    "status": status_code,
+                    "duracion_ms": round(duracion_ms, 3),
+                    "fecha": time.time(),
+                    "sql_total_ms": round(sum(s["ms"] for s in sentencias), 3),
+                    "sql": sentencias,
+                    "perfil": muestreador.perfil(inicio, fin)
+                    if muestreador.activo
+                    else None,
+                }
+                try:
+                    await run_in_threadpool(capturas.guardar, captura)
+                except OSError as e:
+                    logging.warning(f"No se pudo guardar la captura {captura['id']}: {e}")
+        if solicitado:
+            response.headers["X-Profile-Id"] = captura["id"]
+        return response
+
+    app.include_router(admin_router)
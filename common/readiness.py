@@ -0,0 +1,36 @@
+"""Endpoint `/ready`, separado de `/health`.
+
+`/health` responde en cuanto el proceso atiende peticiones. `/ready` devuelve
+503 hasta que termina el arranque del lifespan (esquema creado, pool de
+conexiones abierto y calentado, tareas de fondo iniciadas) y vuelve a 503 al
+empezar el apagado. El gateway lo usa como chequeo activo para no enviar
+tráfico a instancias que todavía están arrancando o se están deteniendo.
+"""
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+
+def instalar_readiness(app: FastAPI):
+    """Envuelve el lifespan de `app` y registra GET /ready."""
+    app.state.listo = False
+    lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan_con_readiness(app: FastAPI):
+        async with lifespan(app) as estado:
+            app.state.listo = True
+            try:
+                yield estado
+            finally:
+                app.state.listo = False
+
+    app.router.lifespan_context = lifespan_con_readiness
+
+    @app.get("/ready", include_in_schema=False)
+    def ready():
+        if not app.state.listo:
+            return JSONResponse({"status": "starting"}, status_code=503)
+        return {"status": "ready"}
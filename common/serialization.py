@@ -0,0 +1,106 @@
+"""Serialización rápida de respuestas para los servicios FastAPI.
+
+Los listados grandes no pasan por objetos ORM ni modelos Pydantic: se
+consultan como tuplas y se codifican directamente con orjson (o MessagePack
+si el cliente lo pide con `Accept: application/msgpack`).
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Sequence
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson es opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - msgpack es opcional
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+# Accept para llamadas entre servicios: MessagePack si está instalado.
+ACCEPT_SERVICIOS = (
+    "application/msgpack, application/json;q=0.9"
+    if msgpack is not None
+    else "application/json"
+)
+
+
+def _default(obj: Any):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def cargar(contenido: bytes, content_type: str = "") -> Any:
+    """Decodifica el cuerpo JSON o MessagePack de la respuesta de otro servicio."""
+    if content_type.split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES:
+        return msgpack.unpackb(contenido, raw=False)
+    if orjson is not None:
+        return orjson.loads(contenido)
+    return json.loads(contenido)
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse que codifica con orjson (o json estándar si no está instalado)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class MsgPackResponse(Response):
+    media_type = "application/msgpack"
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_default, use_bin_type=True)
+
+
+def acepta_msgpack(request: Request) -> bool:
+    """Indica si el cliente pidió MessagePack en el encabezado Accept."""
+    if msgpack is None:
+        return False
+    for parte in request.headers.get("accept", "").split(","):
+        tipo, *params = [p.strip() for p in parte.split(";")]
+        if tipo.lower() not in MSGPACK_MEDIA_TYPES:
+            continue
+        calidad = 1.0
+        for param in params:
+            nombre, _, valor = param.partition("=")
+            if nombre.strip() == "q":
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        return calidad > 0
+    return False
+
+
+def respuesta(request: Request, content: Any, status_code: int = 200) -> Response:
+    """Devuelve `content` como MessagePack o JSON según el encabezado Accept."""
+    clase = MsgPackResponse if acepta_msgpack(request) else ORJSONResponse
+    return clase(content, status_code=status_code, headers={"Vary": "Accept"})
+
+
+def filas_a_dicts(columnas: Sequence[str], filas: Iterable[Sequence[Any]]):
+    return [dict(zip(columnas, fila)) for fila in filas]
+
+
+def respuesta_filas(request: Request, columnas: Sequence[str], filas) -> Response:
+    """Codifica filas de una consulta (tuplas) sin hidratar objetos ORM ni Pydantic."""
+    return respuesta(request, filas_a_dicts(columnas, filas))
@@ -0,0 +1,60 @@
+"""Modo de ejecución en producción para los servicios FastAPI.
+
+Uso (desde el directorio del servicio, con `common/` montado en /app/common):
+
+    python -m common.server main:app --port 8004
+
+Lanza uvicorn con varios workers. Cada worker importa la aplicación por su
+cuenta y crea sus recursos (motor de base de datos, clientes HTTP) en el
+lifespan, después del fork. Al recibir SIGTERM uvicorn deja de aceptar
+conexiones, espera a las peticiones en curso hasta `GRACEFUL_TIMEOUT`
+segundos y ejecuta el cierre del lifespan.
+
+Las mismas aplicaciones funcionan con gunicorn:
+
+    gunicorn -k uvicorn.workers.UvicornWorker -w 4 main:app
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+
+def numero_de_workers(valor: str = None) -> int:
+    """Interpreta WEB_CONCURRENCY; "auto" (o vacío) usa todos los núcleos."""
+    valor = (valor or os.getenv("WEB_CONCURRENCY") or "auto").strip()
+    if valor == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(valor))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("app", help="Aplicación ASGI, por ejemplo main:app")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers",
+        default=None,
+        help="Número de workers o 'auto' (por defecto WEB_CONCURRENCY o 'auto')",
+    )
+    args = parser.parse_args(argv)
+
+    workers = numero_de_workers(args.workers)
+    # Los workers heredan el valor para que cada servicio pueda consultarlo.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        proxy_headers=True,
+        timeout_graceful_shutdown=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        timeout_keep_alive=int(os.getenv("KEEP_ALIVE_TIMEOUT", "5")),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+from common.archive import EXTENSION, Archivo
+
+
+def registro(id, fecha, **extra):
+    return {"id": id, "estado": "completed", "fecha_creacion": fecha, **extra}
+
+
+def test_escribir_agrupa_por_mes_y_nombra_por_rango(tmp_path):
+    archivo = Archivo("orders", str(tmp_path))
+    rutas = archivo.escribir(
+        [
+            registro(7, datetime(2024, 1, 20)),
+            registro(3, datetime(2024, 1, 5)),
+            registro(12, datetime(2024, 2, 1)),
+        ]
+    )
+    assert len(rutas) == 2
+    por_mes = {os.path.basename(os.path.dirname(r)): os.path.basename(r) for r in rutas}
+    assert por_mes["2024-01"].startswith("3-7-")
+    assert por_mes["2024-02"].startswith("12-12-")
+    assert all(r.endswith(EXTENSION) for r in rutas)
+    # Sin temporales a medio escribir.
+    assert not [n for _, _, ns in os.walk(tmp_path) for n in ns if n.endswith(".tmp")]
+
+    with gzip.open(os.path.join(archivo.directorio, "2024-01", por_mes["2024-01"])) as f:
+        lineas = [json.loads(linea) for linea in f]
+    assert [r["id"] for r in lineas] == [3, 7]
+
+
+def test_buscar_encuentra_solo_el_id_exacto(tmp_path):
+    archivo = Archivo("payments", str(tmp_path))
+    archivo.escribir(
+        [
+            registro(1, datetime(2024, 3, 1), monto=10.0),
+            registro(10, datetime(2024, 3, 2), monto=100.0),
+            registro(100, datetime(2024, 4, 1), monto=1000.0),
+        ]
+    )
+    assert archivo.buscar(10)["monto"] == 100.0
+    assert archivo.buscar(100)["monto"] == 1000.0
+    # 5 cae dentro del rango 1-10 pero no existe; 1000 no cae en ningún rango.
+    assert archivo.buscar(5) is None
+    assert archivo.buscar(1000) is None
+
+
+def test_buscar_sin_archivo_e_ignora_nombres_ajenos(tmp_path):
+    archivo = Archivo("orders", str(tmp_path))
+    assert archivo.buscar(1) is None
+    carpeta = os.path.join(archivo.directorio, "2024-01")
+    os.makedirs(carpeta)
+    open(os.path.join(carpeta, f"basura{EXTENSION}"), "wb").close()
+    open(os.path.join(carpeta, "1-9-abc.ndjson.gz.tmp"), "wb").close()
+    assert archivo.buscar(1) is None
@@ -0,0 +1,28 @@
+import os
+import re
+
+from common.profiling import Capturas
+
+
+def test_capturas_compartidas_entre_instancias(tmp_path):
+    # Dos workers: cada uno con su Capturas sobre el mismo directorio.
+    uno, otro = Capturas(str(tmp_path), 3), Capturas(str(tmp_path), 3)
+    ids = []
+    for capturas in (uno, otro, uno, otro):
+        id = capturas.nuevo_id()
+        capturas.guardar({"id": id, "ruta": "/x"})
+        ids.append(id)
+
+    assert otro.obtener(ids[2])["id"] == ids[2]
+    # Solo quedan las 3 más recientes, de ambos workers, en orden inverso.
+    assert [c["id"] for c in uno.listar()] == ids[:0:-1]
+    assert uno.obtener(ids[0]) is None
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".tmp")]
+
+
+def test_ids_invalidos_no_salen_del_directorio(tmp_path):
+    capturas = Capturas(str(tmp_path / "capturas"), 5)
+    assert re.match(r"^[0-9a-f]{16}-\d+-\d+$", capturas.nuevo_id())
+    assert capturas.listar() == []
+    (tmp_path / "secreto.json").write_text("{}")
+    assert capturas.obtener("../secreto") is None
@@ -1,36 +1,114 @@
 from flask import Flask, render_template
 import os
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from assets import AssetManifest
 
 # URL para el navegador del usuario
 API_GATEWAY_URL_PUBLIC = os.getenv("API_GATEWAY_URL_PUBLIC", "http://localhost:8000")
 # URL para la comunicación interna entre contenedores (Docker)
 API_GATEWAY_URL_INTERNAL = os.getenv("API_GATEWAY_URL", "http://api-gateway:8000")
+
+# Render en el servidor de la primera página del catálogo (opcional).
+SSR_CATALOG = os.getenv("SSR_CATALOG", "0") == "1"
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "20"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "10"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+
 app = Flask(__name__)
+# Los recursos de static/ se publican con huella de contenido bajo /assets/.
+assets = AssetManifest(app)
+
+# Sesión HTTP compartida: reutiliza las conexiones con el gateway entre peticiones.
+gateway_session = requests.Session()
+gateway_session.mount(
+    "http://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+)
+gateway_session.mount(
+    "https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+)
+
+_cache = {}
+_cache_lock = threading.Lock()
 
 
 def gw(path):
     return f"{API_GATEWAY_URL_INTERNAL.rstrip('/')}/{path.lstrip('/')}"
 
 
-@app.route("/")
-def index():
-    return render_template("index.html", gateway_url=API_GATEWAY_URL_PUBLIC)
+def cached(key, ttl, loader):
+    """Devuelve el valor en caché de `key` o lo recalcula si venció su TTL."""
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+    value = loader()
+    with _cache_lock:
+        _cache[key] = (now + ttl, value)
+    return value
 
 
-# Panel del Gateway
-@app.route("/gateway")
-def gateway():
-    # Intenta leer /health del gateway
+def fetch_health():
     try:
-        r = requests.get(gw("/health"), timeout=3)
-        health = (
+        r = gateway_session.get(gw("/health"), timeout=3)
+        return (
             r.json()
             if r.headers.get("content-type", "").startswith("application/json")
             else r.text
         )
     except Exception as e:
-        health = {"error": str(e)}
+        return {"error": str(e)}
+
+
+def fetch_catalog():
+    """Primera página del catálogo, con un producto de más para saber si hay otra."""
+    try:
+        r = gateway_session.get(
+            gw("/api/v1/productos/"),
+            params={"limite": CATALOG_PAGE_SIZE + 1},
+            timeout=3,
+        )
+        r.raise_for_status()
+        return r.json()
+    except Exception as e:
+        app.logger.warning(f"No se pudo obtener el catálogo para el render inicial: {e}")
+        return None
+
+
+@app.template_filter("cop")
+def format_cop(value):
+    """Formatea un número como moneda COP, igual que formatCurrency en common.js."""
+    if not isinstance(value, (int, float)):
+        return "N/A"
+    return "$ " + f"{round(value):,}".replace(",", ".")
+
+
+@app.template_filter("miniatura")
+def thumbnail_url(producto):
+    """Miniatura más pequeña del producto (igual que imagenListado en productos.html)."""
+    miniaturas = producto.get("miniaturas")
+    if miniaturas:
+        lado = min(miniaturas, key=int)
+        return f"{API_GATEWAY_URL_PUBLIC.rstrip('/')}{miniaturas[lado]}"
+    image = producto.get("image")
+    if image and image.startswith("/"):
+        return f"{API_GATEWAY_URL_PUBLIC.rstrip('/')}{image}"
+    return image
+
+
+@app.route("/")
+def index():
+    return render_template("index.html", gateway_url=API_GATEWAY_URL_PUBLIC)
+
+
+# Panel del Gateway
+@app.route("/gateway")
+def gateway():
+    # Lee /health del gateway; el resultado se cachea unos segundos.
+    health = cached("health", HEALTH_CACHE_TTL, fetch_health)
     return render_template(
         "gateway.html", gateway_url=API_GATEWAY_URL_PUBLIC, health=health
     )
@@ -51,7 +129,18 @@ def pedidos():
 # Productos UI
 @app.route("/productos/")
 def productos():
-    return render_template("productos.html", gateway_url=API_GATEWAY_URL_PUBLIC)
+    productos_iniciales, hay_mas_productos = None, False
+    if SSR_CATALOG:
+        pagina = cached("catalogo", CATALOG_CACHE_TTL, fetch_catalog)
+        if isinstance(pagina, list):
+            productos_iniciales = pagina[:CATALOG_PAGE_SIZE]
+            hay_mas_productos = len(pagina) > CATALOG_PAGE_SIZE
+    return render_template(
+        "productos.html",
+        gateway_url=API_GATEWAY_URL_PUBLIC,
+        productos_iniciales=productos_iniciales,
+        hay_mas_productos=hay_mas_productos,
+    )
 
 
 # Auth UI
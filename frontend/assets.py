@@ -0,0 +1,111 @@
+"""Recursos estáticos con huella de contenido y precomprimidos.
+
+Al arrancar se recorre `static/`, se calcula un hash del contenido de cada
+archivo y se publica con ese hash en el nombre (`css/styles.3f2a9c1b7d0e.css`)
+bajo `/assets/`. Como el nombre cambia cuando cambia el contenido, las
+respuestas se pueden cachear indefinidamente (`immutable`). Los archivos de
+texto se guardan también comprimidos con gzip (y brotli si está instalado).
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from flask import Flask, Response, abort, request, url_for
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli es opcional
+    brotli = None
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".html", ".txt", ".map"}
+MIN_COMPRESS_SIZE = 256
+
+
+@dataclass
+class Asset:
+    path: str
+    mimetype: str
+    etag: str
+    data: bytes
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+
+class AssetManifest:
+    def __init__(self, app: Flask, url_prefix: str = "/assets"):
+        self.app = app
+        self.url_prefix = url_prefix
+        self.urls: Dict[str, str] = {}
+        self.assets: Dict[str, Asset] = {}
+        self.build()
+        app.add_url_rule(f"{url_prefix}/<path:name>", "assets", self.serve)
+        app.jinja_env.globals["asset_url"] = self.url
+
+    def build(self):
+        static_folder = self.app.static_folder
+        for root, _, files in os.walk(static_folder):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                relative = os.path.relpath(full_path, static_folder).replace(os.sep, "/")
+                with open(full_path, "rb") as f:
+                    data = f.read()
+
+                digest = hashlib.sha256(data).hexdigest()[:12]
+                base, ext = os.path.splitext(relative)
+                fingerprinted = f"{base}.{digest}{ext}"
+                asset = Asset(
+                    path=relative,
+                    mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+                    etag=f'"{digest}"',
+                    data=data,
+                )
+                if ext in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_SIZE:
+                    # Se comprime una sola vez con el nivel máximo; brotli va primero
+                    # para que gane cuando el navegador acepta ambas.
+                    if brotli is not None:
+                        asset.encoded["br"] = brotli.compress(data, quality=11)
+                    asset.encoded["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+                self.assets[fingerprinted] = asset
+                self.urls[relative] = f"{self.url_prefix}/{fingerprinted}"
+
+    def url(self, filename: str) -> str:
+        """URL con huella de un archivo de static/ (para usar en las plantillas)."""
+        fingerprinted = self.urls.get(filename)
+        if fingerprinted is None:
+            return url_for("static", filename=filename)
+        return fingerprinted
+
+    def serve(self, name: str):
+        asset: Optional[Asset] = self.assets.get(name)
+        if asset is None:
+            abort(404)
+
+        encoding = request.accept_encodings.best_match(list(asset.encoded))
+        # Cada codificación es una representación distinta y lleva su propio
+        # ETag fuerte; compartirlo haría que una caché sirviera gzip a quien
+        # pidió identidad tras un 304.
+        etag = asset.etag if not encoding else f'{asset.etag[:-1]}-{encoding}"'
+        headers = {
+            "Cache-Control": CACHE_CONTROL,
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+        }
+        if etag in _etags(request.headers.get("If-None-Match", "")):
+            return Response(status=304, headers=headers)
+
+        body = asset.data
+        if encoding:
+            body = asset.encoded[encoding]
+            headers["Content-Encoding"] = encoding
+        return Response(body, mimetype=asset.mimetype, headers=headers)
+
+
+def _etags(if_none_match: str) -> set:
+    """ETags de un If-None-Match; la comparación débil ignora el prefijo W/."""
+    return {
+        e.strip().removeprefix("W/") for e in if_none_match.split(",") if e.strip()
+    }
@@ -22,6 +22,7 @@ function getAuthHeaders() {
 async function fetchProductos() {
   try {
     const response = await fetch(`${window.GATEWAY_URL}/api/v1/productos/`, {
+      credentials: 'include',
       method: 'GET',
       headers: getAuthHeaders()
     });
@@ -3,16 +3,53 @@ from fastapi.middleware.cors import (
     CORSMiddleware,
 )  # No es necesario si el gateway maneja CORS
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from jose import jwt
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional
 from common.config import settings
-import bcrypt
+from common.profiling import instalar_profiling
+from common.readiness import instalar_readiness
+from common.serialization import ORJSONResponse
+from revocacion import ListaDeRevocacion
+from sesiones import crear_almacen_de_sesiones
+from usuarios import EmailDuplicado, crear_almacen
+import asyncio
+import logging
+import os
+import uuid
+
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+# Almacén de usuarios: MongoDB si DATABASE_URL apunta a Mongo, memoria en otro caso.
+usuarios = crear_almacen(os.getenv("DATABASE_URL"))
+# Refresh tokens y revocaciones, en el mismo almacén que los usuarios.
+sesiones = crear_almacen_de_sesiones(os.getenv("DATABASE_URL"))
+revocaciones = ListaDeRevocacion(sesiones)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    usuarios.abrir()
+    sesiones.abrir()
+    revocaciones.sincronizar()
+    tarea_revocaciones = asyncio.create_task(revocaciones.sincronizar_periodicamente())
+    if not usuarios.compartido and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        logging.warning(
+            "El almacén de usuarios en memoria no se comparte entre workers; "
+            "configura DATABASE_URL con MongoDB para usar varios workers."
+        )
+    yield
+    tarea_revocaciones.cancel()
+    sesiones.cerrar()
+    usuarios.cerrar()
+
 
 # Inicializar la aplicación FastAPI
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+instalar_profiling(app)
+instalar_readiness(app)
 
 
 # Modelo para el registro de usuarios
@@ -22,11 +59,13 @@ class UserRegister(BaseModel):
     password: str
 
 
-# Base de datos temporal en memoria (en producción, usa una base de datos real)
-users_db: List[Dict[str, Any]] = []
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 
-# Configuración de seguridad
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Configuración de seguridad. bcrypt y python-jose se importan en las
+# funciones que los usan y no al arrancar: el servicio queda listo antes y
+# su coste se paga una sola vez, en el primer registro o login.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
 
@@ -43,12 +82,13 @@ def health_check():
 # --- Endpoints de autenticación en el router ---
 
 
+# Los endpoints son síncronos para que bcrypt y el acceso al almacén se ejecuten
+# en el threadpool y no bloqueen el event loop del worker.
 @router.post("/register")
-async def register_user(user: UserRegister):
+def register_user(user: UserRegister):
     # Verificar si el usuario ya existe
-    for existing_user in users_db:
-        if existing_user["email"] == user.email:
-            raise HTTPException(status_code=400, detail="Email ya registrado")
+    if usuarios.buscar_por_email(user.email):
+        raise HTTPException(status_code=400, detail="Email ya registrado")
 
     # Hashear la contraseña antes de guardarla
     hashed_password = get_password_hash(user.password)
@@ -56,7 +96,10 @@ async def register_user(user: UserRegister):
     user_dict["hashed_password"] = hashed_password
     del user_dict["password"]  # No guardamos la contraseña en texto plano
 
-    users_db.append(user_dict)
+    try:
+        usuarios.crear(user_dict)
+    except EmailDuplicado:
+        raise HTTPException(status_code=400, detail="Email ya registrado")
     # No devolver el hash de la contraseña al cliente por seguridad.
     return {
         "message": "Usuario registrado exitosamente",
@@ -66,7 +109,7 @@ async def register_user(user: UserRegister):
 
 # Endpoint para el login
 @router.post("/login")
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -74,13 +117,41 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(
-        minutes=30
-    )  # Puedes mover esto a settings si lo deseas
-    access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return emitir_tokens(user["email"])
+
+
+# Renovación sin contraseña: verificar un JWT HS256 cuesta microsegundos,
+# frente a los cientos de milisegundos de bcrypt en cada login.
+@router.post("/refresh")
+def refresh(body: RefreshRequest):
+    claims = decodificar_token(body.refresh_token, "refresh")
+    registro = sesiones.consumir_refresh(claims["jti"])
+    if registro is None:
+        raise credenciales_invalidas("Refresh token desconocido")
+    if registro["usado"]:
+        # Rotación: cada refresh token sirve una sola vez. Si se reutiliza,
+        # probablemente fue robado, así que se revoca toda la sesión.
+        revocar_sesion(registro["familia"])
+        raise credenciales_invalidas("Refresh token reutilizado; sesión revocada")
+    return emitir_tokens(claims["sub"], familia=claims["fam"])
+
+
+@router.post("/logout")
+def logout(token: str = Depends(oauth2_scheme)):
+    """Revoca el access token y todos los tokens de su sesión."""
+    claims = decodificar_token(token, "access")
+    if claims.get("fam"):
+        revocar_sesion(claims["fam"])
+    elif claims.get("jti"):
+        revocaciones.revocar(claims["jti"], datetime.utcfromtimestamp(claims["exp"]))
+    return {"message": "Sesión cerrada"}
+
+
+@router.get("/verify")
+def verify(token: str = Depends(oauth2_scheme)):
+    """Valida un access token (firma, expiración y revocación) sin consultar el almacén."""
+    claims = decodificar_token(token, "access")
+    return {"sub": claims["sub"], "exp": claims["exp"]}
 
 
 # Incluimos el router en la app principal
@@ -91,6 +162,8 @@ app.include_router(router)
 def get_password_hash(password: str) -> str:
     if not isinstance(password, str):
         password = str(password)
+    import bcrypt
+
     # Generar un salt y hacer hash de la contraseña
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
@@ -100,6 +173,8 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     if not isinstance(plain_password, str):
         plain_password = str(plain_password)
+    import bcrypt
+
     try:
         return bcrypt.checkpw(
             plain_password.encode("utf-8"), hashed_password.encode("utf-8")
@@ -110,7 +185,7 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 # Función para autenticar al usuario
 def authenticate_user(email: str, password: str):
-    user = next((u for u in users_db if u["email"] == email), None)
+    user = usuarios.buscar_por_email(email)
     if not user:
         return False
     if not verify_password(password, user["hashed_password"]):
@@ -121,12 +196,71 @@ def authenticate_user(email: str, password: str):
 # Función para crear el token de acceso
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
+    # Identificador único del token, usado para revocarlo.
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
+
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
     return encoded_jwt
+
+
+def emitir_tokens(sub: str, familia: Optional[str] = None) -> dict:
+    """Emite un access token y un refresh token de la misma sesión (`fam`)."""
+    familia = familia or uuid.uuid4().hex
+    access_token = create_access_token(
+        data={"sub": sub, "type": "access", "fam": familia},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    refresh_jti = uuid.uuid4().hex
+    refresh_vigencia = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = create_access_token(
+        data={"sub": sub, "type": "refresh", "fam": familia, "jti": refresh_jti},
+        expires_delta=refresh_vigencia,
+    )
+    sesiones.guardar_refresh(
+        refresh_jti, sub, familia, datetime.utcnow() + refresh_vigencia
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+def credenciales_invalidas(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"}
+    )
+
+
+def decodificar_token(token: str, tipo: str) -> dict:
+    """Verifica firma, expiración, tipo y revocación (del token y de su sesión)."""
+    from jose import JWTError, jwt
+
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise credenciales_invalidas("Token inválido o expirado")
+    # Los access tokens emitidos antes de los refresh tokens no tienen "type".
+    if claims.get("type", "access") != tipo:
+        raise credenciales_invalidas("Tipo de token incorrecto")
+    if revocaciones.revocado(claims.get("jti")) or revocaciones.revocado(
+        claims.get("fam")
+    ):
+        raise credenciales_invalidas("Token revocado")
+    return claims
+
+
+def revocar_sesion(familia: str):
+    # Ningún token de la sesión vive más allá de este plazo.
+    revocaciones.revocar(
+        familia, datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
@@ -0,0 +1,124 @@
+"""Lista de revocación de tokens por `jti`, consultada en memoria.
+
+Cada worker mantiene una copia local de las revocaciones vigentes:
+
+- un filtro de Bloom, que responde "seguro que no está" con unas pocas
+  lecturas de bits y sin tocar el almacén; es la respuesta en casi todas
+  las verificaciones, porque casi ningún token está revocado;
+- un conjunto exacto, consultado solo cuando el filtro da positivo, para
+  descartar los falsos positivos.
+
+La copia se sincroniza cada `REVOCACION_SINCRONIZAR_SEGUNDOS` leyendo del
+almacén solo las revocaciones nuevas; las de este worker se aplican al
+instante. Las revocaciones vencidas (el token ya expiró) se descartan y el
+filtro se reconstruye, porque un filtro de Bloom no admite borrados.
+"""
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+REVOCACION_SINCRONIZAR_SEGUNDOS = float(
+    os.getenv("REVOCACION_SINCRONIZAR_SEGUNDOS", "5")
+)
+REVOCACION_CAPACIDAD = int(os.getenv("REVOCACION_CAPACIDAD", "100000"))
+REVOCACION_TASA_ERROR = float(os.getenv("REVOCACION_TASA_ERROR", "0.01"))
+# Margen al pedir las revocaciones nuevas, por diferencias de reloj entre
+# las instancias que escriben en el almacén.
+SOLAPAMIENTO = timedelta(seconds=30)
+
+
+class FiltroBloom:
+    def __init__(self, capacidad: int, tasa_error: float = REVOCACION_TASA_ERROR):
+        self.capacidad = capacidad
+        self.num_bits = max(8, int(-capacidad * math.log(tasa_error) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacidad * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _posiciones(self, clave: str):
+        # Doble hashing (Kirsch-Mitzenmacher): k posiciones a partir de un digest.
+        digest = hashlib.blake2b(clave.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def agregar(self, clave: str):
+        for p in self._posiciones(clave):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, clave: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._posiciones(clave))
+
+
+class ListaDeRevocacion:
+    def __init__(
+        self,
+        sesiones,
+        capacidad: int = REVOCACION_CAPACIDAD,
+        tasa_error: float = REVOCACION_TASA_ERROR,
+    ):
+        self.sesiones = sesiones
+        self.capacidad = capacidad
+        self.tasa_error = tasa_error
+        self._exactos: Dict[str, datetime] = {}
+        self._filtro = FiltroBloom(capacidad, tasa_error)
+        self._marca: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def revocado(self, jti: Optional[str]) -> bool:
+        return jti is not None and jti in self._filtro and jti in self._exactos
+
+    def revocar(self, jti: str, expira: datetime):
+        """Revoca `jti` hasta `expira` (cuando el token deja de ser válido de todos modos)."""
+        self.sesiones.revocar(jti, expira)
+        with self._lock:
+            self._agregar(jti, expira)
+
+    def _agregar(self, jti: str, expira: datetime):
+        if jti not in self._exactos:
+            self._filtro.agregar(jti)
+        self._exactos[jti] = expira
+        if len(self._exactos) > self._filtro.capacidad:
+            self._reconstruir()
+
+    def _reconstruir(self):
+        # Se arma un filtro nuevo y se reemplaza de una vez: las lecturas
+        # concurrentes ven el anterior o el nuevo, nunca uno a medio llenar.
+        capacidad = self.capacidad
+        while capacidad < len(self._exactos) * 2:
+            capacidad *= 2
+        filtro = FiltroBloom(capacidad, self.tasa_error)
+        for jti in self._exactos:
+            filtro.agregar(jti)
+        self._filtro = filtro
+
+    def sincronizar(self):
+        """Trae del almacén las revocaciones nuevas y descarta las vencidas."""
+        inicio = datetime.utcnow()
+        desde = None if self._marca is None else self._marca - SOLAPAMIENTO
+        nuevos = self.sesiones.revocados_desde(desde)
+        with self._lock:
+            for jti, expira in nuevos:
+                self._agregar(jti, expira)
+            vencidos = [jti for jti, expira in self._exactos.items() if expira <= inicio]
+            for jti in vencidos:
+                del self._exactos[jti]
+            if vencidos:
+                self._reconstruir()
+        self._marca = inicio
+
+    async def sincronizar_periodicamente(self):
+        """Tarea del lifespan que mantiene la copia local al día."""
+        while True:
+            await asyncio.sleep(REVOCACION_SINCRONIZAR_SEGUNDOS)
+            try:
+                await run_in_threadpool(self.sincronizar)
+            except Exception as e:
+                logging.error(f"No se pudo sincronizar la lista de revocación: {e}")
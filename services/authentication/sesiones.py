@@ -0,0 +1,138 @@
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SesionesEnMemoria:
+    """Refresh tokens y revocaciones en memoria.
+
+    Igual que `UsuariosEnMemoria`, solo sirve con un único worker: cada
+    proceso tiene sus propios registros.
+    """
+
+    compartido = False
+
+    def __init__(self):
+        self.refresh: Dict[str, Dict[str, Any]] = {}
+        self.revocados: List[Dict[str, Any]] = []
+        # Los endpoints síncronos se ejecutan en varios hilos del threadpool.
+        self._lock = threading.Lock()
+
+    def abrir(self):
+        pass
+
+    def cerrar(self):
+        pass
+
+    def guardar_refresh(self, jti: str, sub: str, familia: str, expira: datetime):
+        with self._lock:
+            self.refresh[jti] = {
+                "jti": jti,
+                "sub": sub,
+                "familia": familia,
+                "expira": expira,
+                "usado": False,
+            }
+
+    def consumir_refresh(self, jti: str) -> Optional[Dict[str, Any]]:
+        """Marca el refresh token como usado y devuelve el registro previo."""
+        with self._lock:
+            registro = self.refresh.get(jti)
+            if registro is None:
+                return None
+            previo = dict(registro)
+            registro["usado"] = True
+            return previo
+
+    def revocar(self, jti: str, expira: datetime):
+        with self._lock:
+            self.revocados.append(
+                {"jti": jti, "expira": expira, "creado": datetime.utcnow()}
+            )
+
+    def revocados_desde(self, desde: Optional[datetime]) -> List[Tuple[str, datetime]]:
+        ahora = datetime.utcnow()
+        with self._lock:
+            # Se aprovecha la lectura para descartar las revocaciones vencidas.
+            self.revocados = [r for r in self.revocados if r["expira"] > ahora]
+            self.refresh = {j: r for j, r in self.refresh.items() if r["expira"] > ahora}
+            return [
+                (r["jti"], r["expira"])
+                for r in self.revocados
+                if desde is None or r["creado"] >= desde
+            ]
+
+
+class SesionesMongo:
+    """Refresh tokens y revocaciones en MongoDB, compartidos por todos los workers.
+
+    Los índices TTL sobre `expira` borran los registros vencidos.
+    """
+
+    compartido = True
+
+    def __init__(self, url: str, database: str = "auth_db"):
+        self.url = url
+        self.database = database
+        self._client = None
+        self._refresh = None
+        self._revocados = None
+
+    def abrir(self):
+        from pymongo import ASCENDING, MongoClient
+
+        self._client = MongoClient(self.url)
+        db = self._client[self.database]
+        self._refresh = db["refresh_tokens"]
+        self._revocados = db["revocados"]
+        self._refresh.create_index([("jti", ASCENDING)], unique=True)
+        self._refresh.create_index([("expira", ASCENDING)], expireAfterSeconds=0)
+        self._revocados.create_index([("creado", ASCENDING)])
+        self._revocados.create_index([("expira", ASCENDING)], expireAfterSeconds=0)
+
+    def cerrar(self):
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._refresh = None
+        self._revocados = None
+
+    def guardar_refresh(self, jti: str, sub: str, familia: str, expira: datetime):
+        self._refresh.insert_one(
+            {"jti": jti, "sub": sub, "familia": familia, "expira": expira, "usado": False}
+        )
+
+    def consumir_refresh(self, jti: str) -> Optional[Dict[str, Any]]:
+        """Marca el refresh token como usado y devuelve el registro previo.
+
+        `find_one_and_update` es atómico: si dos peticiones usan el mismo
+        token a la vez, solo una ve `usado=False`.
+        """
+        from pymongo import ReturnDocument
+
+        return self._refresh.find_one_and_update(
+            {"jti": jti},
+            {"$set": {"usado": True}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    def revocar(self, jti: str, expira: datetime):
+        self._revocados.insert_one(
+            {"jti": jti, "expira": expira, "creado": datetime.utcnow()}
+        )
+
+    def revocados_desde(self, desde: Optional[datetime]) -> List[Tuple[str, datetime]]:
+        filtro: Dict[str, Any] = {"expira": {"$gt": datetime.utcnow()}}
+        if desde is not None:
+            filtro["creado"] = {"$gte": desde}
+        return [
+            (r["jti"], r["expira"])
+            for r in self._revocados.find(filtro, {"_id": 0, "jti": 1, "expira": 1})
+        ]
+
+
+def crear_almacen_de_sesiones(url: Optional[str]):
+    if url and url.startswith("mongodb"):
+        return SesionesMongo(url)
+    return SesionesEnMemoria()
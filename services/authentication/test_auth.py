@@ -1,6 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from main import app, get_password_hash, verify_password
+from revocacion import FiltroBloom
 import bcrypt  # Usar bcrypt directamente
 
 client = TestClient(app)
@@ -44,4 +45,39 @@ def test_duplicate_email():
     }
     response = client.post("/register", json=test_user)
     assert response.status_code == 400
-    assert "ya registrado" in response.json()["detail"].lower()
\ No newline at end of file
+    assert "ya registrado" in response.json()["detail"].lower()
+
+def login_usuario(email):
+    client.post("/api/v1/auth/register", json={"username": "u", "email": email, "password": "test123"})
+    response = client.post("/api/v1/auth/login", data={"username": email, "password": "test123"})
+    assert response.status_code == 200
+    return response.json()
+
+def test_refresh_rota_y_detecta_reutilizacion():
+    tokens = login_usuario("refresh@example.com")
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    nuevos = response.json()
+    assert nuevos["refresh_token"] != tokens["refresh_token"]
+    # Reutilizar el refresh token anterior revoca toda la sesión
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    headers = {"Authorization": f"Bearer {nuevos['access_token']}"}
+    assert client.get("/api/v1/auth/verify", headers=headers).status_code == 401
+
+def test_logout_revoca_los_tokens():
+    tokens = login_usuario("logout@example.com")
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/api/v1/auth/verify", headers=headers).status_code == 200
+    assert client.post("/api/v1/auth/logout", headers=headers).status_code == 200
+    assert client.get("/api/v1/auth/verify", headers=headers).status_code == 401
+    response = client.post("/api/v1/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+def test_filtro_bloom_sin_falsos_negativos():
+    filtro = FiltroBloom(1000, 0.01)
+    for i in range(1000):
+        filtro.agregar(f"jti-{i}")
+    assert all(f"jti-{i}" in filtro for i in range(1000))
+    falsos_positivos = sum(f"otro-{i}" in filtro for i in range(10000))
+    assert falsos_positivos < 300
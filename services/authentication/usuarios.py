@@ -0,0 +1,79 @@
+from typing import Any, Dict, List, Optional
+
+
+class EmailDuplicado(Exception):
+    pass
+
+
+class UsuariosEnMemoria:
+    """Almacén de usuarios en memoria.
+
+    Solo sirve para desarrollo y pruebas con un único worker: cada proceso
+    tiene su propia lista, por lo que no se comparte entre workers.
+    """
+
+    compartido = False
+
+    def __init__(self):
+        self.users_db: List[Dict[str, Any]] = []
+
+    def abrir(self):
+        pass
+
+    def cerrar(self):
+        pass
+
+    def buscar_por_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return next((u for u in self.users_db if u["email"] == email), None)
+
+    def crear(self, user: Dict[str, Any]):
+        if self.buscar_por_email(user["email"]):
+            raise EmailDuplicado(user["email"])
+        self.users_db.append(user)
+
+
+class UsuariosMongo:
+    """Almacén de usuarios en MongoDB, compartido por todos los workers.
+
+    El cliente se crea en `abrir()` (desde el lifespan de cada worker), ya que
+    `MongoClient` no debe heredarse a través de un fork.
+    """
+
+    compartido = True
+
+    def __init__(self, url: str, database: str = "auth_db"):
+        self.url = url
+        self.database = database
+        self._client = None
+        self._coleccion = None
+
+    def abrir(self):
+        from pymongo import ASCENDING, MongoClient
+
+        self._client = MongoClient(self.url)
+        self._coleccion = self._client[self.database]["users"]
+        # El índice único evita emails duplicados aunque dos workers registren a la vez.
+        self._coleccion.create_index([("email", ASCENDING)], unique=True)
+
+    def cerrar(self):
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._coleccion = None
+
+    def buscar_por_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return self._coleccion.find_one({"email": email}, {"_id": 0})
+
+    def crear(self, user: Dict[str, Any]):
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            self._coleccion.insert_one(dict(user))
+        except DuplicateKeyError:
+            raise EmailDuplicado(user["email"])
+
+
+def crear_almacen(url: Optional[str]):
+    if url and url.startswith("mongodb"):
+        return UsuariosMongo(url)
+    return UsuariosEnMemoria()
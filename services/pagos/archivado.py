@@ -0,0 +1,55 @@
+"""Archivado de pagos terminados o inactivos (ver common/archive.py)."""
+
+from typing import Optional
+
+from sqlalchemy import delete, or_
+from sqlalchemy.orm import Session
+
+from common.archive import (
+    ARCHIVE_BATCH_SIZE,
+    Archivo,
+    limite_de_retencion,
+    tomar_lock_de_archivado,
+)
+from models import Payment
+
+ESTADOS_FINALES = ("completed", "failed", "refunded")
+
+archivo = Archivo("payments")
+
+
+def a_registro(pago: Payment) -> dict:
+    # Columnas en el orden de la tabla: "id" queda primero (ver Archivo.buscar).
+    return {c.name: getattr(pago, c.name) for c in Payment.__table__.columns}
+
+
+def archivar_pagos(db: Session, lote: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Mueve al archivo los pagos terminados o inactivos fuera de la retención."""
+    limite = limite_de_retencion()
+    total = 0
+    # Cada lote es una transacción propia; el advisory lock se toma por lote.
+    while tomar_lock_de_archivado(db, "payments"):
+        pagos = (
+            db.query(Payment)
+            .filter(
+                Payment.fecha_creacion < limite,
+                or_(Payment.estado.in_(ESTADOS_FINALES), Payment.activo.is_(False)),
+            )
+            .order_by(Payment.id)
+            .limit(lote)
+            .all()
+        )
+        if not pagos:
+            db.rollback()
+            break
+        archivo.escribir([a_registro(p) for p in pagos])
+        ids = [p.id for p in pagos]
+        db.execute(delete(Payment).where(Payment.id.in_(ids)))
+        db.commit()
+        db.expunge_all()
+        total += len(ids)
+    return total
+
+
+def buscar_archivado(id: int) -> Optional[dict]:
+    return archivo.buscar(id)
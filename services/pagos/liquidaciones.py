@@ -0,0 +1,210 @@
+"""Liquidación masiva de pagos (archivos de confirmación del proveedor).
+
+`POST /api/v1/pagos/settlements` recibe miles de confirmaciones a la vez.
+En lugar de repetir por cada una lo que hace `update_pago` (consulta,
+validación, PUT a pedidos y commit), el lote se procesa así:
+
+1. Una sola consulta carga todos los pagos referenciados, por `id` o por
+   `id_pedido`.
+2. Cada entrada se valida en memoria contra el `monto` guardado (no puede
+   ser menor, igual que en `update_pago`).
+3. Un único `UPDATE ... FROM (lote)` marca los válidos como
+   completados en una transacción. Solo actualiza los pagos que siguen en un
+   estado liquidable y con el mismo `monto` que se validó: reenviar el mismo
+   archivo no liquida dos veces, y un pago que otra petición completó, marcó
+   como fallido o reembolsado, o cuyo monto cambió entre la lectura y el
+   UPDATE no se toca.
+4. Después del commit se avisa a pedidos con una sola llamada a
+   `POST /api/v1/pedidos/bulk/estado`.
+
+El resultado se informa por entrada, en el mismo orden en que llegaron.
+"""
+
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import Integer, String, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from common.config import settings
+from common.db import tabla_de_lote
+from models import LiquidacionEntrada, Payment
+
+LIQUIDACION_MAX_ENTRADAS = int(os.getenv("LIQUIDACION_MAX_ENTRADAS", "10000"))
+
+# Estados posibles de cada entrada en el resultado.
+LIQUIDADO = "liquidado"
+YA_LIQUIDADO = "ya_liquidado"
+NO_ENCONTRADO = "no_encontrado"
+MONTO_INSUFICIENTE = "monto_insuficiente"
+DUPLICADO = "duplicado"
+INVALIDO = "invalido"
+NO_LIQUIDABLE = "no_liquidable"
+MODIFICADO = "modificado"
+
+# Estados desde los que un pago se puede liquidar (no failed ni refunded).
+ESTADOS_LIQUIDABLES = ("pending",)
+
+
+def _cargar_pagos(db: Session, entradas: List[LiquidacionEntrada]):
+    ids = {e.id for e in entradas if e.id is not None}
+    id_pedidos = {e.id_pedido for e in entradas if e.id is None and e.id_pedido is not None}
+    condiciones = []
+    if ids:
+        condiciones.append(Payment.id.in_(ids))
+    if id_pedidos:
+        condiciones.append(Payment.id_pedido.in_(id_pedidos))
+    if not condiciones:
+        return {}, {}
+    filas = db.execute(
+        select(Payment.id, Payment.id_pedido, Payment.monto, Payment.estado)
+        .where(or_(*condiciones))
+        .order_by(Payment.id)
+    ).all()
+    por_id = {fila.id: fila for fila in filas}
+    # Si un pedido tiene varios pagos se liquida el primero liquidable.
+    por_pedido: Dict[int, object] = {}
+    for fila in filas:
+        actual = por_pedido.get(fila.id_pedido)
+        if actual is None or (
+            actual.estado not in ESTADOS_LIQUIDABLES and fila.estado in ESTADOS_LIQUIDABLES
+        ):
+            por_pedido[fila.id_pedido] = fila
+    return por_id, por_pedido
+
+
+def completar_pagos(
+    db: Session, liquidaciones: List[Tuple[int, int, int, Optional[str]]]
+) -> Dict[int, int]:
+    """Marca como completados los pagos del lote en un solo UPDATE.
+
+    Cada tupla es (id, monto_esperado, monto, metodo_pago). Solo cambia los
+    pagos que siguen en un estado liquidable y cuyo monto guardado
+    es `monto_esperado`. Devuelve {id: id_pedido} de los pagos actualizados.
+    """
+    if not liquidaciones:
+        return {}
+    lote = tabla_de_lote(
+        "lote",
+        [
+            ("id", Integer),
+            ("monto_esperado", Integer),
+            ("monto", Integer),
+            ("metodo_pago", String),
+        ],
+        liquidaciones,
+    )
+    ahora = datetime.utcnow()
+    stmt = (
+        update(Payment)
+        .where(
+            Payment.id == lote.c.id,
+            Payment.estado.in_(ESTADOS_LIQUIDABLES),
+            Payment.monto == lote.c.monto_esperado,
+        )
+        .values(
+            monto=lote.c.monto,
+            metodo_pago=func.coalesce(lote.c.metodo_pago, Payment.metodo_pago),
+            estado="completed",
+            fecha_pago=ahora,
+            fecha_actualizacion=ahora,
+        )
+        .returning(Payment.id, Payment.id_pedido)
+        .execution_options(synchronize_session=False)
+    )
+    actualizados = {fila.id: fila.id_pedido for fila in db.execute(stmt)}
+    db.commit()
+    return actualizados
+
+
+def liquidar(db: Session, entradas: List[LiquidacionEntrada]) -> Tuple[List[dict], Dict[int, int]]:
+    """Valida y liquida el lote. Devuelve (resultados por entrada, {id: id_pedido} liquidados)."""
+    por_id, por_pedido = _cargar_pagos(db, entradas)
+
+    resultados: List[dict] = []
+    a_liquidar: List[Tuple[int, int, int, Optional[str]]] = []
+    vistos = set()
+    for entrada in entradas:
+        resultado = {"id": entrada.id, "id_pedido": entrada.id_pedido}
+        resultados.append(resultado)
+        if entrada.id is None and entrada.id_pedido is None:
+            resultado["estado"] = INVALIDO
+            resultado["detalle"] = "Se requiere id o id_pedido."
+            continue
+        pago = por_id.get(entrada.id) if entrada.id is not None else por_pedido.get(entrada.id_pedido)
+        if pago is None:
+            resultado["estado"] = NO_ENCONTRADO
+            continue
+        resultado["id"], resultado["id_pedido"] = pago.id, pago.id_pedido
+        if pago.id in vistos:
+            resultado["estado"] = DUPLICADO
+        elif pago.estado == "completed":
+            resultado["estado"] = YA_LIQUIDADO
+        elif pago.estado not in ESTADOS_LIQUIDABLES:
+            resultado["estado"] = NO_LIQUIDABLE
+            resultado["detalle"] = f"El pago está en estado '{pago.estado}'."
+        elif entrada.monto < pago.monto:
+            resultado["estado"] = MONTO_INSUFICIENTE
+            resultado["detalle"] = (
+                f"El monto a pagar ({entrada.monto}) no puede ser menor al monto "
+                f"del pedido ({pago.monto})."
+            )
+        else:
+            resultado["estado"] = LIQUIDADO
+            a_liquidar.append((pago.id, pago.monto, entrada.monto, entrada.metodo_pago))
+        vistos.add(pago.id)
+
+    liquidados = completar_pagos(db, a_liquidar)
+    # Otra petición pudo liquidarlos, o cambiar su estado o su monto, entre la
+    # lectura y el UPDATE.
+    perdidos = [
+        r for r in resultados if r.get("estado") == LIQUIDADO and r["id"] not in liquidados
+    ]
+    if perdidos:
+        estados = dict(
+            db.execute(
+                select(Payment.id, Payment.estado).where(
+                    Payment.id.in_([r["id"] for r in perdidos])
+                )
+            ).all()
+        )
+        for resultado in perdidos:
+            if estados.get(resultado["id"]) == "completed":
+                resultado["estado"] = YA_LIQUIDADO
+            else:
+                resultado["estado"] = MODIFICADO
+                resultado["detalle"] = "El pago cambió durante la liquidación."
+    return resultados, liquidados
+
+
+async def notificar_pedidos(client: httpx.AsyncClient, id_pedidos: List[int]) -> bool:
+    """Marca los pedidos como completados con una sola llamada a pedidos."""
+    if not id_pedidos:
+        return True
+    try:
+        response = await client.post(
+            f"{settings.PEDIDOS_SERVICE_URL}/api/v1/pedidos/bulk/estado",
+            json={
+                "cambios": [
+                    {"id": id, "estado_previo": "pending", "estado": "completed"}
+                    for id in id_pedidos
+                ]
+            },
+        )
+        response.raise_for_status()
+        omitidos = response.json().get("omitidos")
+        if omitidos:
+            # Ya no estaban pendientes (por ejemplo, se cancelaron): no se tocan.
+            logging.warning(f"Pedidos pagados que ya no estaban pendientes: {omitidos}")
+        return True
+    except (httpx.RequestError, httpx.HTTPStatusError) as e:
+        # Como en update_pago, el pago no se revierte; la conciliación
+        # periódica de pedidos corrige los que queden pendientes.
+        logging.warning(
+            f"Se liquidaron {len(id_pedidos)} pagos, pero no se pudo actualizar "
+            f"el estado de sus pedidos: {e}"
+        )
+        return False
@@ -0,0 +1,27 @@
+"""Cambios de esquema sobre tablas existentes de pagos (ver common/migraciones.py)."""
+
+from common.migraciones import Migracion, borrar_indice, crear_indice
+
+MIGRACIONES = [
+    # Índices del archivado y de la conciliación; CONCURRENTLY para no
+    # bloquear las escrituras mientras se construyen sobre tablas grandes.
+    Migracion(
+        "0001_payments_fecha_creacion",
+        crear_indice("ix_payments_fecha_creacion", "payments", ["fecha_creacion"]),
+        concurrente=True,
+    ),
+    Migracion(
+        "0002_payments_id_pedido_id",
+        crear_indice("ix_payments_id_pedido_id", "payments", ["id_pedido", "id"]),
+        concurrente=True,
+    ),
+    # Un pedido puede tener varios pagos (por ejemplo, un reintento tras uno
+    # fallido), así que se quita el índice único que creaba la antigua
+    # 0003_payments_id_pedido_unico donde llegó a aplicarse. POST /bulk se
+    # protege con advisory locks por pedido (ver main.py).
+    Migracion(
+        "0004_payments_id_pedido_no_unico",
+        borrar_indice("uq_payments_id_pedido"),
+        concurrente=True,
+    ),
+]
@@ -1,5 +1,5 @@
-from typing import Optional
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from typing import List, Optional
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
 from sqlalchemy.orm import declarative_base
 from datetime import datetime
 
@@ -21,13 +21,13 @@ class Payment(Base):
     # Columnas de la tabla
     id = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, index=True)  # ID del usuario (cliente o vendedor)
-    id_pedido = Column(Integer, index=True)  # ID del pedido relacionado
+    id_pedido = Column(Integer)  # ID del pedido relacionado (puede tener varios pagos)
     monto = Column(Integer)  # Monto en centavos para precisión
     moneda = Column(String, default="COP")
     estado = Column(String, default="pending")  # Ej. pending, completed, failed
     metodo_pago = Column(String)  # Ej. credit_card, paypal
     fecha_pago = Column(DateTime, nullable=True)  # Fecha en que se completa el pago
-    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    fecha_creacion = Column(DateTime, default=datetime.utcnow, index=True)
 
     # agrego columna adicional de pagos
     activo = Column(Boolean, default=True)
@@ -35,6 +35,11 @@ class Payment(Base):
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    __table_args__ = (
+        # Recorrido por (id_pedido, id) de la conciliación con pedidos.
+        Index("ix_payments_id_pedido_id", "id_pedido", "id"),
+    )
+
     def __repr__(self):
         return f"<Payment(id={self.id}, amount={self.monto})>"
 
@@ -54,6 +59,22 @@ class PaymentCreate(PaymentBase):
     pass
 
 
+class PaymentLoteCreate(BaseModel):
+    pagos: List[PaymentCreate]
+
+
+class LiquidacionEntrada(BaseModel):
+    # Se identifica el pago por su id o por el id del pedido.
+    id: Optional[int] = None
+    id_pedido: Optional[int] = None
+    monto: int
+    metodo_pago: Optional[str] = None
+
+
+class LiquidacionLote(BaseModel):
+    liquidaciones: List[LiquidacionEntrada]
+
+
 class PaymentRead(PaymentBase):
     id: int
     fecha_creacion: datetime
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+import liquidaciones
+from models import Base, LiquidacionEntrada, Payment
+
+# Por defecto SQLite; con TEST_DATABASE_URL (PostgreSQL) las mismas pruebas
+# corren contra PostgreSQL. En ambos casos se ejecuta el UPDATE por lotes real.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def database(tmp_path):
+    if TEST_DATABASE_URL:
+        engine = create_engine(TEST_DATABASE_URL)
+        Base.metadata.drop_all(engine)
+    else:
+        engine = create_engine(f"sqlite:///{tmp_path / 'pagos.db'}")
+    Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)
+    db = sesion()
+    db.add_all(
+        [
+            Payment(id=1, id_pedido=10, monto=100, estado="pending"),
+            Payment(id=2, id_pedido=20, monto=200, estado="completed"),
+            Payment(id=3, id_pedido=30, monto=300, estado="failed"),
+            Payment(id=4, id_pedido=40, monto=400, estado="refunded"),
+            Payment(id=5, id_pedido=50, monto=500, estado="pending"),
+        ]
+    )
+    db.commit()
+    db.close()
+    yield sesion
+    engine.dispose()
+
+
+def entrada(monto, id=None, id_pedido=None):
+    return LiquidacionEntrada(id=id, id_pedido=id_pedido, monto=monto)
+
+
+def pago(sesion, id):
+    db = sesion()
+    try:
+        return db.get(Payment, id)
+    finally:
+        db.close()
+
+
+def test_liquida_solo_pagos_en_estado_liquidable(database):
+    db = database()
+    resultados, liquidados = liquidaciones.liquidar(
+        db,
+        [
+            entrada(120, id=1),
+            entrada(200, id=2),
+            entrada(300, id_pedido=30),
+            entrada(400, id=4),
+            entrada(1, id=5),
+            entrada(100, id=1),
+            entrada(100, id=99),
+        ],
+    )
+    db.close()
+    assert [r["estado"] for r in resultados] == [
+        liquidaciones.LIQUIDADO,
+        liquidaciones.YA_LIQUIDADO,
+        liquidaciones.NO_LIQUIDABLE,
+        liquidaciones.NO_LIQUIDABLE,
+        liquidaciones.MONTO_INSUFICIENTE,
+        liquidaciones.DUPLICADO,
+        liquidaciones.NO_ENCONTRADO,
+    ]
+    assert liquidados == {1: 10}
+    assert (pago(database, 1).estado, pago(database, 1).monto) == ("completed", 120)
+    assert pago(database, 3).estado == "failed"
+    assert pago(database, 4).estado == "refunded"
+
+
+def test_no_liquida_pagos_que_cambian_despues_de_validar(database, monkeypatch):
+    cargar = liquidaciones._cargar_pagos
+
+    def cargar_y_cambiar(db, entradas):
+        # Otra petición modifica los pagos entre la validación y el UPDATE.
+        leidos = cargar(db, entradas)
+        otra = database()
+        otra.execute(update(Payment).where(Payment.id == 1).values(monto=1000))
+        otra.execute(update(Payment).where(Payment.id == 5).values(estado="refunded"))
+        otra.commit()
+        otra.close()
+        return leidos
+
+    monkeypatch.setattr(liquidaciones, "_cargar_pagos", cargar_y_cambiar)
+    db = database()
+    resultados, liquidados = liquidaciones.liquidar(db, [entrada(100, id=1), entrada(500, id=5)])
+    db.close()
+    assert liquidados == {}
+    assert [r["estado"] for r in resultados] == [liquidaciones.MODIFICADO] * 2
+    assert (pago(database, 1).estado, pago(database, 1).monto) == ("pending", 1000)
+    assert pago(database, 5).estado == "refunded"
+
+
+def test_reenviar_el_lote_no_liquida_dos_veces(database):
+    db = database()
+    _, primera = liquidaciones.liquidar(db, [entrada(100, id=1)])
+    resultados, segunda = liquidaciones.liquidar(db, [entrada(100, id=1)])
+    db.close()
+    assert primera == {1: 10}
+    assert segunda == {}
+    assert resultados[0]["estado"] == liquidaciones.YA_LIQUIDADO
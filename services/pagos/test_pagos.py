@@ -0,0 +1,46 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from models import Payment
+
+URL = "/api/v1/pagos"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.database, "url", f"sqlite:///{tmp_path / 'pagos.db'}")
+    with TestClient(main.app) as client:
+        yield client
+
+
+def pago(id_pedido, monto=100):
+    return {"id_usuario": 7, "id_pedido": id_pedido, "monto": monto}
+
+
+def pagos_del_pedido(id_pedido):
+    db = main.database.sesion()
+    try:
+        return db.query(Payment).filter(Payment.id_pedido == id_pedido).count()
+    finally:
+        db.close()
+
+
+def test_un_pedido_puede_tener_varios_pagos(client):
+    assert client.post(f"{URL}/", json=pago(1)).status_code == 200
+    assert client.post(f"{URL}/", json=pago(1)).status_code == 200
+    assert pagos_del_pedido(1) == 2
+
+
+def test_bulk_omite_pedidos_con_pago_y_repetidos_en_el_lote(client):
+    client.post(f"{URL}/", json=pago(1))
+    respuesta = client.post(
+        f"{URL}/bulk", json={"pagos": [pago(1), pago(2), pago(3), pago(2, monto=999)]}
+    )
+    assert respuesta.status_code == 200
+    assert respuesta.json() == {"creados": 2, "omitidos": [1]}
+    assert [pagos_del_pedido(i) for i in (1, 2, 3)] == [1, 1, 1]
+
+    # Reenviar el mismo lote no crea nada.
+    respuesta = client.post(f"{URL}/bulk", json={"pagos": [pago(2), pago(3)]})
+    assert respuesta.json() == {"creados": 0, "omitidos": [2, 3]}
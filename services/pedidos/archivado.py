@@ -0,0 +1,63 @@
+"""Archivado de pedidos terminados o inactivos (ver common/archive.py)."""
+
+from typing import Optional
+
+from sqlalchemy import delete, or_
+from sqlalchemy.orm import Session, selectinload
+
+from common.archive import (
+    ARCHIVE_BATCH_SIZE,
+    Archivo,
+    limite_de_retencion,
+    tomar_lock_de_archivado,
+)
+from models import Order, OrderItem
+
+ESTADOS_FINALES = ("completed", "cancelled")
+
+archivo = Archivo("orders")
+
+
+def _fila(obj) -> dict:
+    # Columnas en el orden de la tabla: "id" queda primero (ver Archivo.buscar).
+    return {c.name: getattr(obj, c.name) for c in obj.__table__.columns}
+
+
+def a_registro(pedido: Order) -> dict:
+    registro = _fila(pedido)
+    registro["items"] = [_fila(item) for item in pedido.items]
+    return registro
+
+
+def archivar_pedidos(db: Session, lote: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Mueve al archivo los pedidos terminados o inactivos fuera de la retención."""
+    limite = limite_de_retencion()
+    total = 0
+    # Cada lote es una transacción propia; el advisory lock se toma por lote.
+    while tomar_lock_de_archivado(db, "orders"):
+        pedidos = (
+            db.query(Order)
+            .options(selectinload(Order.items))
+            .filter(
+                Order.fecha_creacion < limite,
+                or_(Order.estado.in_(ESTADOS_FINALES), Order.activo.is_(False)),
+            )
+            .order_by(Order.id)
+            .limit(lote)
+            .all()
+        )
+        if not pedidos:
+            db.rollback()
+            break
+        archivo.escribir([a_registro(p) for p in pedidos])
+        ids = [p.id for p in pedidos]
+        db.execute(delete(OrderItem).where(OrderItem.id_pedido.in_(ids)))
+        db.execute(delete(Order).where(Order.id.in_(ids)))
+        db.commit()
+        db.expunge_all()
+        total += len(ids)
+    return total
+
+
+def buscar_archivado(id: int) -> Optional[dict]:
+    return archivo.buscar(id)
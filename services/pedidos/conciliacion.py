@@ -0,0 +1,328 @@
+"""Conciliación por conjuntos entre pedidos y pagos.
+
+Recorre los pedidos (de la base local) y los pagos (del servicio de pagos)
+en páginas ordenadas por id de pedido y los combina con un merge-join, sin
+cargar nunca las tablas completas: memoria constante y tiempo lineal en el
+número de filas. Las correcciones se acumulan y se aplican por lotes:
+
+- pedido_sin_pago: pedido pendiente sin ningún pago -> se crea el pago
+  pendiente con POST /api/v1/pagos/bulk.
+- pago_completado_pedido_pendiente: hay un pago completado pero el pedido
+  sigue pendiente -> se marca completado con un único UPDATE por lote.
+
+Otras discrepancias solo se reportan porque requieren una decisión humana
+(pagos sin pedido, pedidos cancelados con pago completado, montos distintos,
+pedidos completados sin pago completado). Los pedidos creados hace menos de
+`CONCILIACION_GRACIA_SEGUNDOS` se ignoran: create_order registra el pago
+después de guardar el pedido.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Integer, String, select, text, update
+from sqlalchemy.orm import Session
+
+from common.config import settings
+from common.db import Database, clave_advisory_lock, tabla_de_lote
+from common.serialization import ACCEPT_SERVICIOS, cargar
+from models import Order
+
+# Cada cuánto se concilia en segundo plano (0 = solo bajo demanda).
+CONCILIACION_INTERVALO_SEGUNDOS = float(
+    os.getenv("CONCILIACION_INTERVALO_SEGUNDOS", "3600")
+)
+CONCILIACION_PAGINA = int(os.getenv("CONCILIACION_PAGINA", "5000"))
+CONCILIACION_LOTE = int(os.getenv("CONCILIACION_LOTE", "1000"))
+CONCILIACION_GRACIA_SEGUNDOS = int(os.getenv("CONCILIACION_GRACIA_SEGUNDOS", "300"))
+MAX_MUESTRA = 100
+
+COLUMNAS_PEDIDO = ["id", "estado", "monto_total", "id_usuario", "fecha_creacion", "activo"]
+
+
+class ConciliacionEnCurso(Exception):
+    """Otro worker o instancia ya está ejecutando la conciliación."""
+
+
+def actualizar_estados(db: Session, cambios: List[Tuple[int, str, str]]) -> List[int]:
+    """Cambia el estado de muchos pedidos en una sola sentencia.
+
+    Cada cambio es (id, estado_previo, estado). Genera
+    `UPDATE orders SET estado = lote.estado FROM (...) lote
+    WHERE orders.id = lote.id AND orders.estado = lote.estado_previo
+    RETURNING orders.id`. Un pedido que cambió de estado desde que se leyó
+    (por ejemplo, se canceló durante la conciliación) no se toca. Devuelve
+    los ids actualizados.
+    """
+    if not cambios:
+        return []
+    lote = tabla_de_lote(
+        "lote", [("id", Integer), ("estado_previo", String), ("estado", String)], cambios
+    )
+    stmt = (
+        update(Order)
+        .where(Order.id == lote.c.id, Order.estado == lote.c.estado_previo)
+        .values(estado=lote.c.estado)
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = [fila.id for fila in db.execute(stmt)]
+    db.commit()
+    return ids
+
+
+@dataclass
+class Reporte:
+    dry_run: bool
+    pedidos_revisados: int = 0
+    pagos_revisados: int = 0
+    discrepancias: Dict[str, int] = field(default_factory=dict)
+    muestras: Dict[str, List[int]] = field(default_factory=dict)
+    corregidos: Dict[str, int] = field(default_factory=dict)
+    inicio: datetime = field(default_factory=datetime.utcnow)
+    fin: Optional[datetime] = None
+
+    def anotar(self, tipo: str, id_pedido: int):
+        self.discrepancias[tipo] = self.discrepancias.get(tipo, 0) + 1
+        muestra = self.muestras.setdefault(tipo, [])
+        if len(muestra) < MAX_MUESTRA:
+            muestra.append(id_pedido)
+
+    def a_dict(self) -> dict:
+        return {
+            "dry_run": self.dry_run,
+            "pedidos_revisados": self.pedidos_revisados,
+            "pagos_revisados": self.pagos_revisados,
+            "discrepancias": self.discrepancias,
+            "muestras": self.muestras,
+            "corregidos": self.corregidos,
+            "inicio": self.inicio,
+            "fin": self.fin,
+        }
+
+
+class Conciliador:
+    def __init__(
+        self,
+        database: Database,
+        client: httpx.AsyncClient,
+        dry_run: bool = True,
+        pagina: int = CONCILIACION_PAGINA,
+        lote: int = CONCILIACION_LOTE,
+    ):
+        self.database = database
+        self.client = client
+        self.pagina = pagina
+        self.lote = lote
+        self.reporte = Reporte(dry_run=dry_run)
+        self.limite_gracia = datetime.utcnow() - timedelta(
+            seconds=CONCILIACION_GRACIA_SEGUNDOS
+        )
+        self.pagos_a_crear: List[dict] = []
+        self.estados_a_cambiar: List[Tuple[int, str, str]] = []
+        self.pagos_url = f"{settings.PAGOS_SERVICE_URL}/api/v1/pagos"
+
+    # --- Lectura por páginas ---
+
+    def _pagina_pedidos(self, despues: int):
+        db = self.database.sesion()
+        try:
+            return db.execute(
+                select(*[getattr(Order, c) for c in COLUMNAS_PEDIDO])
+                .where(Order.id > despues)
+                .order_by(Order.id)
+                .limit(self.pagina)
+            ).all()
+        finally:
+            db.close()
+
+    async def pedidos(self) -> AsyncIterator:
+        despues = 0
+        while True:
+            filas = await run_in_threadpool(self._pagina_pedidos, despues)
+            for fila in filas:
+                yield fila
+            if len(filas) < self.pagina:
+                return
+            despues = filas[-1].id
+
+    async def pagos_por_pedido(self) -> AsyncIterator[Tuple[int, List[dict]]]:
+        """Pagos agrupados por id_pedido, en orden, aunque un grupo cruce páginas."""
+        despues_pedido, despues_id = 0, 0
+        grupo_id, grupo = None, []
+        while True:
+            response = await self.client.get(
+                f"{self.pagos_url}/conciliacion",
+                params={
+                    "despues_pedido": despues_pedido,
+                    "despues_id": despues_id,
+                    "limite": self.pagina,
+                },
+                headers={"Accept": ACCEPT_SERVICIOS},
+            )
+            response.raise_for_status()
+            filas = cargar(response.content, response.headers.get("content-type", ""))
+            for fila in filas:
+                if fila["id_pedido"] != grupo_id:
+                    if grupo:
+                        yield grupo_id, grupo
+                    grupo_id, grupo = fila["id_pedido"], []
+                grupo.append(fila)
+            if len(filas) < self.pagina:
+                break
+            despues_pedido, despues_id = filas[-1]["id_pedido"], filas[-1]["id"]
+        if grupo:
+            yield grupo_id, grupo
+
+    # --- Reglas ---
+
+    def _sin_pagos(self, pedido):
+        if pedido.fecha_creacion and pedido.fecha_creacion > self.limite_gracia:
+            return
+        if pedido.estado == "pending" and pedido.activo is not False:
+            self.reporte.anotar("pedido_sin_pago", pedido.id)
+            self.pagos_a_crear.append(
+                {
+                    "id_pedido": pedido.id,
+                    "id_usuario": pedido.id_usuario,
+                    "monto": pedido.monto_total,
+                    "estado": "pending",
+                    "metodo_pago": "N/A",
+                }
+            )
+        elif pedido.estado == "completed":
+            self.reporte.anotar("pedido_completado_sin_pago_completado", pedido.id)
+
+    def _con_pagos(self, pedido, pagos: List[dict]):
+        completados = [p for p in pagos if p["estado"] == "completed"]
+        if completados:
+            if pedido.estado == "pending":
+                self.reporte.anotar("pago_completado_pedido_pendiente", pedido.id)
+                self.estados_a_cambiar.append((pedido.id, "pending", "completed"))
+            elif pedido.estado == "cancelled":
+                self.reporte.anotar("pago_completado_pedido_cancelado", pedido.id)
+            return
+        if pedido.estado == "completed":
+            self.reporte.anotar("pedido_completado_sin_pago_completado", pedido.id)
+        elif pedido.estado == "pending" and all(
+            p["monto"] != pedido.monto_total for p in pagos
+        ):
+            self.reporte.anotar("monto_distinto", pedido.id)
+
+    # --- Correcciones por lotes ---
+
+    def _contar_corregidos(self, tipo: str, n: int):
+        self.reporte.corregidos[tipo] = self.reporte.corregidos.get(tipo, 0) + n
+
+    def _cambiar_estados(self, cambios):
+        db = self.database.sesion()
+        try:
+            return actualizar_estados(db, cambios)
+        finally:
+            db.close()
+
+    async def aplicar(self, forzar: bool = False):
+        if self.pagos_a_crear and (forzar or len(self.pagos_a_crear) >= self.lote):
+            lote, self.pagos_a_crear = self.pagos_a_crear, []
+            if not self.reporte.dry_run:
+                response = await self.client.post(
+                    f"{self.pagos_url}/bulk", json={"pagos": lote}
+                )
+                response.raise_for_status()
+                self._contar_corregidos("pedido_sin_pago", response.json()["creados"])
+        if self.estados_a_cambiar and (
+            forzar or len(self.estados_a_cambiar) >= self.lote
+        ):
+            lote, self.estados_a_cambiar = self.estados_a_cambiar, []
+            if not self.reporte.dry_run:
+                ids = await run_in_threadpool(self._cambiar_estados, lote)
+                self._contar_corregidos("pago_completado_pedido_pendiente", len(ids))
+
+    # --- Merge-join ---
+
+    async def ejecutar(self) -> dict:
+        pedidos = self.pedidos()
+        pagos = self.pagos_por_pedido()
+        pedido = await anext(pedidos, None)
+        grupo = await anext(pagos, None)
+        while pedido is not None or grupo is not None:
+            if grupo is None or (pedido is not None and pedido.id < grupo[0]):
+                self.reporte.pedidos_revisados += 1
+                self._sin_pagos(pedido)
+                pedido = await anext(pedidos, None)
+            elif pedido is None or grupo[0] < pedido.id:
+                # Puede ser un pedido ya archivado; solo se reporta.
+                self.reporte.pagos_revisados += len(grupo[1])
+                self.reporte.anotar("pago_sin_pedido", grupo[0])
+                grupo = await anext(pagos, None)
+            else:
+                self.reporte.pedidos_revisados += 1
+                self.reporte.pagos_revisados += len(grupo[1])
+                self._con_pagos(pedido, grupo[1])
+                pedido = await anext(pedidos, None)
+                grupo = await anext(pagos, None)
+            await self.aplicar()
+        await self.aplicar(forzar=True)
+        self.reporte.fin = datetime.utcnow()
+        return self.reporte.a_dict()
+
+
+# --- Exclusión entre workers ---
+
+
+def _tomar_lock(database: Database):
+    """Lock de sesión de PostgreSQL mientras dura la conciliación (None si está tomado)."""
+    conn = database.engine.connect()
+    if conn.dialect.name != "postgresql":
+        return conn
+    tomado = conn.execute(
+        text("SELECT pg_try_advisory_lock(:clave)"),
+        {"clave": clave_advisory_lock("conciliacion:pedidos")},
+    ).scalar()
+    if not tomado:
+        conn.close()
+        return None
+    return conn
+
+
+def _soltar_lock(conn):
+    try:
+        if conn.dialect.name == "postgresql":
+            conn.execute(
+                text("SELECT pg_advisory_unlock(:clave)"),
+                {"clave": clave_advisory_lock("conciliacion:pedidos")},
+            )
+    finally:
+        conn.close()
+
+
+async def conciliar(
+    database: Database, client: httpx.AsyncClient, dry_run: bool = True
+) -> dict:
+    conn = await run_in_threadpool(_tomar_lock, database)
+    if conn is None:
+        raise ConciliacionEnCurso()
+    try:
+        return await Conciliador(database, client, dry_run=dry_run).ejecutar()
+    finally:
+        await run_in_threadpool(_soltar_lock, conn)
+
+
+async def conciliacion_periodica(database: Database, client: httpx.AsyncClient):
+    """Tarea del lifespan: concilia y corrige cada `CONCILIACION_INTERVALO_SEGUNDOS`."""
+    while True:
+        await asyncio.sleep(CONCILIACION_INTERVALO_SEGUNDOS)
+        try:
+            reporte = await conciliar(database, client, dry_run=False)
+            if reporte["discrepancias"]:
+                logging.info(f"Conciliación pedidos/pagos: {reporte['discrepancias']}")
+        except ConciliacionEnCurso:
+            pass
+        except Exception as e:
+            logging.error(f"Error en la conciliación pedidos/pagos: {e}")
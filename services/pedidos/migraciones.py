@@ -0,0 +1,13 @@
+"""Cambios de esquema sobre tablas existentes de pedidos (ver common/migraciones.py)."""
+
+from common.migraciones import Migracion, crear_indice
+
+MIGRACIONES = [
+    # Índice del archivado por antigüedad; CONCURRENTLY para no bloquear
+    # las escrituras mientras se construye sobre una tabla grande.
+    Migracion(
+        "0001_orders_fecha_creacion",
+        crear_indice("ix_orders_fecha_creacion", "orders", ["fecha_creacion"]),
+        concurrente=True,
+    ),
+]
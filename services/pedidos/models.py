@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
@@ -18,7 +18,7 @@ class Order(Base):
     id_usuario = Column(Integer, index=True)
     monto_total = Column(Integer)
     estado = Column(String, default="pending")
-    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    fecha_creacion = Column(DateTime, default=datetime.utcnow, index=True)
     activo = Column(Boolean, default=True)
 
     # Relación con los ítems del pedido
@@ -82,6 +82,21 @@ class OrderRead(OrderBase):
         from_attributes = True
 
 
+# Estados válidos de un pedido; los cambios masivos no aceptan otros.
+EstadoPedido = Literal["pending", "completed", "cancelled"]
+
+
+class OrderEstadoCambio(BaseModel):
+    id: int
+    estado: EstadoPedido
+    # El cambio solo se aplica si el pedido sigue en este estado.
+    estado_previo: EstadoPedido = "pending"
+
+
+class OrderEstadoLote(BaseModel):
+    cambios: List[OrderEstadoCambio]
+
+
 class OrderUpdate(OrderBase):
     id_usuario: Optional[int] = None
     estado: Optional[str] = None
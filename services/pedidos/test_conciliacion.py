@@ -0,0 +1,179 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import conciliacion
+from models import Base, Order, OrderEstadoCambio
+
+ANTIGUO = datetime.utcnow() - timedelta(days=1)
+
+
+class BaseDePrueba:
+    """Lo único que usa el Conciliador de `Database`: `sesion()`."""
+
+    def __init__(self, url):
+        engine = create_engine(url)
+        Base.metadata.create_all(engine)
+        self.sesion = sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def database(tmp_path):
+    return BaseDePrueba(f"sqlite:///{tmp_path / 'pedidos.db'}")
+
+
+def crear_pedidos(database, *pedidos):
+    db = database.sesion()
+    for id, estado, monto in pedidos:
+        db.add(
+            Order(
+                id=id, id_usuario=7, monto_total=monto, estado=estado, fecha_creacion=ANTIGUO
+            )
+        )
+    db.commit()
+    db.close()
+
+
+def pago(id, id_pedido, monto, estado="pending"):
+    return {"id": id, "id_pedido": id_pedido, "monto": monto, "estado": estado}
+
+
+def servicio_de_pagos(pagos, creados):
+    """Simula GET /conciliacion (paginado por clave) y POST /bulk de pagos."""
+
+    def handler(request):
+        if request.url.path.endswith("/bulk"):
+            lote = json.loads(request.content)["pagos"]
+            creados.extend(lote)
+            return httpx.Response(200, json={"creados": len(lote), "omitidos": []})
+        params = request.url.params
+        clave = (int(params["despues_pedido"]), int(params["despues_id"]))
+        pagina = [p for p in pagos if (p["id_pedido"], p["id"]) > clave]
+        return httpx.Response(200, json=pagina[: int(params["limite"])])
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def conciliar(database, pagos, dry_run=True, creados=None):
+    async def ejecutar():
+        async with servicio_de_pagos(pagos, creados if creados is not None else []) as client:
+            # Páginas de 2 para que los grupos de pagos crucen páginas.
+            conciliador = conciliacion.Conciliador(database, client, dry_run=dry_run, pagina=2)
+            return await conciliador.ejecutar(), conciliador
+
+    return asyncio.run(ejecutar())
+
+
+def test_merge_join_detecta_faltantes_huerfanos_y_montos_distintos(database):
+    crear_pedidos(
+        database,
+        (1, "pending", 100),  # sin pago
+        (2, "pending", 200),  # pago con otro monto
+        (3, "pending", 300),  # cuadra
+        (5, "pending", 500),  # dos pagos, uno con el monto correcto
+    )
+    pagos = [
+        pago(10, 2, 250),
+        pago(11, 3, 300),
+        pago(12, 4, 400),  # sin pedido
+        pago(13, 5, 1),
+        pago(14, 5, 500),
+        pago(15, 9, 900),  # sin pedido, después del último pedido
+    ]
+    reporte, _ = conciliar(database, pagos)
+    assert reporte["discrepancias"] == {
+        "pedido_sin_pago": 1,
+        "monto_distinto": 1,
+        "pago_sin_pedido": 2,
+    }
+    assert reporte["muestras"]["pedido_sin_pago"] == [1]
+    assert reporte["muestras"]["monto_distinto"] == [2]
+    assert reporte["muestras"]["pago_sin_pedido"] == [4, 9]
+    assert reporte["pedidos_revisados"] == 4
+    assert reporte["pagos_revisados"] == 6
+    assert reporte["corregidos"] == {}
+
+
+def test_reglas_de_estado(database):
+    crear_pedidos(
+        database,
+        (1, "pending", 100),  # pago completado -> pedido a completar
+        (2, "cancelled", 200),  # cancelado con pago completado
+        (3, "completed", 300),  # completado con pago pendiente
+        (4, "completed", 400),  # completado sin ningún pago
+    )
+    pagos = [
+        pago(10, 1, 100, "completed"),
+        pago(11, 2, 200, "completed"),
+        pago(12, 3, 300),
+    ]
+    reporte, conciliador = conciliar(database, pagos)
+    assert reporte["discrepancias"] == {
+        "pago_completado_pedido_pendiente": 1,
+        "pago_completado_pedido_cancelado": 1,
+        "pedido_completado_sin_pago_completado": 2,
+    }
+    # En dry run no se aplica nada.
+    assert conciliador.estados_a_cambiar == []
+    assert reporte["corregidos"] == {}
+
+
+def test_crea_los_pagos_faltantes_por_lotes(database):
+    crear_pedidos(database, (1, "pending", 100), (2, "pending", 200), (3, "cancelled", 300))
+    creados = []
+    reporte, _ = conciliar(database, [], dry_run=False, creados=creados)
+    assert [(p["id_pedido"], p["monto"], p["estado"]) for p in creados] == [
+        (1, 100, "pending"),
+        (2, 200, "pending"),
+    ]
+    assert reporte["corregidos"] == {"pedido_sin_pago": 2}
+
+
+def test_ignora_pedidos_recientes(database):
+    db = database.sesion()
+    db.add(Order(id=1, id_usuario=7, monto_total=100, estado="pending"))
+    db.commit()
+    db.close()
+    reporte, _ = conciliar(database, [])
+    assert reporte["discrepancias"] == {}
+
+
+def test_cambio_de_estado_solo_acepta_estados_validos():
+    assert OrderEstadoCambio(id=1, estado="completed").estado == "completed"
+    with pytest.raises(ValueError):
+        OrderEstadoCambio(id=1, estado="borrado")
+
+
+def test_no_completa_pedidos_cancelados_durante_la_conciliacion(database, monkeypatch):
+    crear_pedidos(database, (1, "pending", 100), (2, "pending", 200))
+    pagos = [pago(10, 1, 100, "completed"), pago(11, 2, 200, "completed")]
+    cambiar_estados = conciliacion.Conciliador._cambiar_estados
+
+    def cancelar_y_cambiar(self, cambios):
+        # El pedido 2 se cancela entre el recorrido y la corrección.
+        db = database.sesion()
+        db.get(Order, 2).estado = "cancelled"
+        db.commit()
+        db.close()
+        return cambiar_estados(self, cambios)
+
+    monkeypatch.setattr(conciliacion.Conciliador, "_cambiar_estados", cancelar_y_cambiar)
+    reporte, _ = conciliar(database, pagos, dry_run=False)
+    assert reporte["corregidos"] == {"pago_completado_pedido_pendiente": 1}
+    db = database.sesion()
+    assert [db.get(Order, id).estado for id in (1, 2)] == ["completed", "cancelled"]
+    db.close()
+
+
+def test_actualizar_estados_exige_el_estado_previo(database):
+    crear_pedidos(database, (1, "pending", 100), (2, "cancelled", 200))
+    db = database.sesion()
+    cambios = [(id, "pending", "completed") for id in (1, 2, 3)]
+    assert conciliacion.actualizar_estados(db, cambios) == [1]
+    assert db.get(Order, 2).estado == "cancelled"
+    db.close()
@@ -0,0 +1,197 @@
+"""Almacenamiento y entrega de imágenes de productos.
+
+- Los originales se guardan en disco con su SHA-256 como nombre
+  (`originales/ab/abcd....jpg`): subir dos veces la misma imagen no duplica
+  nada y el contenido de una URL nunca cambia.
+- Las miniaturas (`miniaturas/ab/abcd...-128.webp`) se generan en un pool de
+  procesos, fuera del event loop y sin competir por el GIL. La subida no las
+  espera; si alguien pide una que todavía no existe, se espera la tarea en
+  curso o se genera en ese momento.
+- Se sirven con FileResponse (Range, If-Range y `http.response.pathsend` si
+  el servidor ASGI lo soporta), ETag fuerte derivado del hash, 304 con
+  If-None-Match y caché `immutable`.
+"""
+
+import asyncio
+import glob
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.responses import FileResponse
+
+from miniaturas import (
+    FORMATO,
+    IMAGENES_URL,
+    MINIATURAS,
+    es_digest,
+    generar_miniaturas,
+)
+
+IMAGENES_DIR = os.getenv("IMAGENES_DIR", "imagenes")
+IMAGEN_MAX_BYTES = int(os.getenv("IMAGEN_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGENES_PROCESOS = int(os.getenv("IMAGENES_PROCESOS", "2"))
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Firmas de los formatos aceptados: (prefijo, extensión).
+FIRMAS = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+MEDIA_TYPES = {
+    "jpg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+
+class ImagenInvalida(Exception):
+    pass
+
+
+def detectar_formato(datos: bytes) -> str:
+    """Extensión según el contenido (no se confía en el nombre ni en Content-Type)."""
+    if datos[:4] == b"RIFF" and datos[8:12] == b"WEBP":
+        return "webp"
+    for firma, extension in FIRMAS:
+        if datos.startswith(firma):
+            return extension
+    raise ImagenInvalida("Formato no soportado: se aceptan JPEG, PNG, GIF y WebP.")
+
+
+def ruta_original(digest: str, extension: str) -> str:
+    return os.path.join(IMAGENES_DIR, "originales", digest[:2], f"{digest}.{extension}")
+
+
+def ruta_miniatura(digest: str, lado: int) -> str:
+    return os.path.join(
+        IMAGENES_DIR, "miniaturas", digest[:2], f"{digest}-{lado}.{FORMATO}"
+    )
+
+
+def buscar_original(digest: str) -> Optional[str]:
+    coincidencias = glob.glob(ruta_original(digest, "*"))
+    return coincidencias[0] if coincidencias else None
+
+
+def guardar_original(datos: bytes) -> Tuple[str, str]:
+    """Guarda la imagen con su hash como nombre. Devuelve (digest, extensión)."""
+    if len(datos) > IMAGEN_MAX_BYTES:
+        raise ImagenInvalida(f"La imagen supera el máximo de {IMAGEN_MAX_BYTES} bytes.")
+    extension = detectar_formato(datos)
+    digest = hashlib.sha256(datos).hexdigest()
+    ruta = ruta_original(digest, extension)
+    if not os.path.exists(ruta):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            f.write(datos)
+        os.replace(temporal, ruta)
+    return digest, extension
+
+
+class Miniaturas:
+    """Pool de procesos que genera miniaturas, con las tareas en curso por hash."""
+
+    def __init__(self, procesos: int = IMAGENES_PROCESOS):
+        self.procesos = procesos
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pendientes: Dict[str, asyncio.Future] = {}
+
+    def _ejecutor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn": hacer fork de un proceso con hilos (uvicorn, SQLAlchemy)
+            # puede heredar locks tomados.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def programar(self, digest: str, origen: str) -> asyncio.Future:
+        pendiente = self._pendientes.get(digest)
+        if pendiente is not None:
+            return pendiente
+        destinos = {lado: ruta_miniatura(digest, lado) for lado in MINIATURAS}
+        futuro = asyncio.get_running_loop().run_in_executor(
+            self._ejecutor(), generar_miniaturas, origen, destinos
+        )
+        self._pendientes[digest] = futuro
+
+        def terminar(f: asyncio.Future):
+            self._pendientes.pop(digest, None)
+            if not f.cancelled() and f.exception() is not None:
+                logging.error(
+                    f"No se pudieron generar miniaturas de {digest}: {f.exception()}"
+                )
+
+        futuro.add_done_callback(terminar)
+        return futuro
+
+    async def obtener(self, digest: str, lado: int) -> Optional[str]:
+        """Ruta de la miniatura; la genera (o espera la generación en curso) si falta."""
+        ruta = ruta_miniatura(digest, lado)
+        if os.path.exists(ruta):
+            return ruta
+        origen = buscar_original(digest)
+        if origen is None:
+            return None
+        try:
+            await asyncio.shield(self.programar(digest, origen))
+        except Exception:
+            return None
+        return ruta if os.path.exists(ruta) else None
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+miniaturas = Miniaturas()
+
+
+def _etags(if_none_match: str) -> set:
+    """ETags de un If-None-Match; la comparación débil ignora el prefijo W/."""
+    return {
+        e.strip().removeprefix("W/") for e in if_none_match.split(",") if e.strip()
+    }
+
+
+def servir(request: Request, ruta: str, etag: str, media_type: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    etags = _etags(request.headers.get("if-none-match", ""))
+    if etag in etags or "*" in etags:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(ruta, media_type=media_type, headers=headers)
+
+
+def servir_original(request: Request, nombre: str) -> Optional[Response]:
+    digest, _, extension = nombre.partition(".")
+    if not es_digest(digest) or extension not in MEDIA_TYPES:
+        return None
+    ruta = ruta_original(digest, extension)
+    if not os.path.exists(ruta):
+        return None
+    return servir(request, ruta, f'"{digest}"', MEDIA_TYPES[extension])
+
+
+async def servir_miniatura(
+    request: Request, digest: str, archivo: str
+) -> Optional[Response]:
+    lado, _, extension = archivo.partition(".")
+    if not es_digest(digest) or extension != FORMATO or not lado.isdigit():
+        return None
+    if int(lado) not in MINIATURAS:
+        return None
+    ruta = await miniaturas.obtener(digest, int(lado))
+    if ruta is None:
+        return None
+    return servir(request, ruta, f'"{digest}-{lado}"', MEDIA_TYPES[FORMATO])
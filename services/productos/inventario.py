@@ -0,0 +1,218 @@
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import Integer, func, select, update
+from sqlalchemy.orm import Session
+
+from common.db import tabla_de_lote
+from models import Producto, Reserva, ReservaItem
+
+# Tiempo de vida de una reserva sin confirmar y frecuencia del barrido de expiradas.
+RESERVA_TTL_SEGUNDOS = int(os.getenv("RESERVA_TTL_SEGUNDOS", "900"))
+BARRIDO_INTERVALO_SEGUNDOS = int(os.getenv("RESERVA_BARRIDO_SEGUNDOS", "30"))
+BARRIDO_LOTE = int(os.getenv("RESERVA_BARRIDO_LOTE", "500"))
+
+
+class ProductosInexistentes(Exception):
+    def __init__(self, ids: List[int]):
+        super().__init__(f"Productos inexistentes: {ids}")
+        self.ids = ids
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, ids: List[int]):
+        super().__init__(f"Stock insuficiente para los productos: {ids}")
+        self.ids = ids
+
+
+class ReservaNoDisponible(Exception):
+    """La reserva no existe o ya no está pendiente (confirmada, liberada o expirada)."""
+
+
+def agrupar_cantidades(items: Iterable) -> List[Tuple[int, int]]:
+    """Suma las cantidades por producto y las ordena por id.
+
+    Ordenar por id hace que transacciones concurrentes bloqueen las filas
+    en el mismo orden, lo que reduce la probabilidad de deadlocks.
+    """
+    cantidades = {}
+    for item in items:
+        if item.cantidad <= 0:
+            raise ValueError(
+                f"La cantidad del producto {item.id_producto} debe ser mayor que cero."
+            )
+        cantidades[item.id_producto] = cantidades.get(item.id_producto, 0) + item.cantidad
+    return sorted(cantidades.items())
+
+
+def _ajustar_stock_sentencia(cantidades: List[Tuple[int, int]], descontar: bool):
+    """`UPDATE` que ajusta el stock de todo el lote en una única sentencia.
+
+    Genera `UPDATE productos SET stock = stock -/+ lote.cantidad FROM (...) lote
+    WHERE productos.id = lote.id_producto [AND productos.stock >= lote.cantidad]`,
+    con el lote armado por `tabla_de_lote`. Solo se bloquean las filas
+    afectadas, nunca la tabla completa, y en READ COMMITTED la condición se
+    reevalúa tras esperar el bloqueo de otra transacción, por lo que el stock
+    nunca queda negativo.
+    """
+    lote = tabla_de_lote(
+        "lote", [("id_producto", Integer), ("cantidad", Integer)], cantidades
+    )
+    stmt = update(Producto).where(Producto.id == lote.c.id_producto)
+    if descontar:
+        stmt = stmt.where(Producto.stock >= lote.c.cantidad).values(
+            stock=Producto.stock - lote.c.cantidad
+        )
+    else:
+        stmt = stmt.values(stock=Producto.stock + lote.c.cantidad)
+    return stmt.returning(Producto.id, Producto.precio).execution_options(
+        synchronize_session=False
+    )
+
+
+def _ajustar_stock(db: Session, cantidades: List[Tuple[int, int]], descontar: bool):
+    """Aplica el ajuste de stock del lote. Devuelve (id, precio) de las filas cambiadas."""
+    return db.execute(_ajustar_stock_sentencia(cantidades, descontar)).all()
+
+
+def ajustar_stock_de_producto(db: Session, id_producto: int, delta: int) -> Producto:
+    """Suma `delta` al stock de un producto sin dejarlo negativo (UPDATE condicional)."""
+    fila = db.execute(
+        update(Producto)
+        .where(Producto.id == id_producto, Producto.stock + delta >= 0)
+        .values(stock=Producto.stock + delta)
+        .returning(Producto.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if fila is None:
+        db.rollback()
+        if db.get(Producto, id_producto) is None:
+            raise ProductosInexistentes([id_producto])
+        raise StockInsuficiente([id_producto])
+    db.commit()
+    producto = db.get(Producto, id_producto)
+    db.refresh(producto)
+    return producto
+
+
+def reservar(db: Session, items: Iterable, ttl_segundos: int = None) -> Reserva:
+    """Descuenta atómicamente el stock de un carrito completo y crea la reserva.
+
+    Si algún producto no existe o no tiene stock suficiente no se descuenta
+    nada (todo o nada).
+    """
+    cantidades = agrupar_cantidades(items)
+    if not cantidades:
+        raise ValueError("La reserva debe incluir al menos un producto.")
+
+    filas = _ajustar_stock(db, cantidades, descontar=True)
+    if len(filas) != len(cantidades):
+        db.rollback()
+        solicitados = {id_producto for id_producto, _ in cantidades}
+        fallidos = solicitados - {fila.id for fila in filas}
+        existentes = set(
+            db.scalars(select(Producto.id).where(Producto.id.in_(fallidos)))
+        )
+        if fallidos - existentes:
+            raise ProductosInexistentes(sorted(fallidos - existentes))
+        raise StockInsuficiente(sorted(fallidos))
+
+    precios = {fila.id: fila.precio for fila in filas}
+    ttl = ttl_segundos or RESERVA_TTL_SEGUNDOS
+    reserva = Reserva(
+        id=uuid.uuid4().hex,
+        estado="pending",
+        expira_en=datetime.utcnow() + timedelta(seconds=ttl),
+        items=[
+            ReservaItem(
+                id_producto=id_producto,
+                cantidad=cantidad,
+                precio_unitario=precios[id_producto],
+            )
+            for id_producto, cantidad in cantidades
+        ],
+    )
+    db.add(reserva)
+    db.commit()
+    db.refresh(reserva)
+    return reserva
+
+
+def _cambiar_estado(db: Session, id_reserva: str, nuevo_estado: str, vigente: bool):
+    """Transición condicional `pending -> nuevo_estado`; gana una sola transacción."""
+    stmt = update(Reserva).where(Reserva.id == id_reserva, Reserva.estado == "pending")
+    if vigente:
+        stmt = stmt.where(Reserva.expira_en > datetime.utcnow())
+    stmt = stmt.values(estado=nuevo_estado).returning(Reserva.id)
+    return db.execute(stmt.execution_options(synchronize_session=False)).first()
+
+
+def confirmar(db: Session, id_reserva: str) -> Reserva:
+    """Confirma la reserva: el stock ya descontado queda vendido.
+
+    Es idempotente: confirmar una reserva ya confirmada no es un error, así
+    que quien llama puede reintentar si no recibió la respuesta.
+    """
+    if _cambiar_estado(db, id_reserva, "committed", vigente=True) is None:
+        db.rollback()
+        reserva = db.get(Reserva, id_reserva)
+        if reserva is not None and reserva.estado == "committed":
+            return reserva
+        raise ReservaNoDisponible(id_reserva)
+    db.commit()
+    return db.get(Reserva, id_reserva)
+
+
+def _devolver_stock(db: Session, ids_reserva: List[str]):
+    cantidades = db.execute(
+        select(ReservaItem.id_producto, func.sum(ReservaItem.cantidad))
+        .where(ReservaItem.id_reserva.in_(ids_reserva))
+        .group_by(ReservaItem.id_producto)
+        .order_by(ReservaItem.id_producto)
+    ).all()
+    if cantidades:
+        _ajustar_stock(db, [tuple(fila) for fila in cantidades], descontar=False)
+
+
+def liberar(db: Session, id_reserva: str) -> Reserva:
+    """Libera una reserva pendiente y devuelve su stock en la misma transacción."""
+    if _cambiar_estado(db, id_reserva, "released", vigente=False) is None:
+        db.rollback()
+        raise ReservaNoDisponible(id_reserva)
+    _devolver_stock(db, [id_reserva])
+    db.commit()
+    return db.get(Reserva, id_reserva)
+
+
+def barrer_expiradas(db: Session, lote: int = BARRIDO_LOTE) -> int:
+    """Marca como expiradas las reservas vencidas y devuelve su stock.
+
+    Usa `FOR UPDATE SKIP LOCKED` para que varias instancias puedan barrer en
+    paralelo sin esperarse entre sí. Devuelve el número de reservas expiradas.
+    """
+    total = 0
+    while True:
+        vencidas = (
+            select(Reserva.id)
+            .where(Reserva.estado == "pending", Reserva.expira_en <= datetime.utcnow())
+            .order_by(Reserva.expira_en)
+            .limit(lote)
+            .with_for_update(skip_locked=True)
+        )
+        ids = db.scalars(
+            update(Reserva)
+            .where(Reserva.id.in_(vencidas))
+            .values(estado="expired")
+            .returning(Reserva.id)
+            .execution_options(synchronize_session=False)
+        ).all()
+        if not ids:
+            db.rollback()
+            return total
+        _devolver_stock(db, ids)
+        db.commit()
+        total += len(ids)
+        if len(ids) < lote:
+            return total
@@ -0,0 +1,11 @@
+"""Cambios de esquema sobre tablas existentes de productos (ver common/migraciones.py)."""
+
+from common.migraciones import Migracion, agregar_columna
+
+MIGRACIONES = [
+    # Tablas creadas antes de las reservas de inventario.
+    Migracion(
+        "0001_productos_stock",
+        agregar_columna("productos", "stock", "INTEGER NOT NULL DEFAULT 0"),
+    ),
+]
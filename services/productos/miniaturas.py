@@ -0,0 +1,64 @@
+"""Miniaturas de las imágenes de productos.
+
+Módulo liviano a propósito: lo importan los procesos del pool que generan las
+miniaturas (y models.py para armar las URLs), así que no depende de FastAPI
+ni de SQLAlchemy. Pillow se importa solo dentro del proceso que la usa.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+IMAGENES_URL = "/api/v1/productos/imagenes"
+# Lado máximo (px) de cada miniatura; el listado usa la más pequeña.
+MINIATURAS = tuple(
+    int(lado) for lado in os.getenv("IMAGENES_MINIATURAS", "128,512").split(",")
+)
+FORMATO = "webp"
+CALIDAD = int(os.getenv("IMAGENES_CALIDAD", "80"))
+# Límite de píxeles para rechazar "bombas de descompresión".
+MAX_PIXELES = int(os.getenv("IMAGENES_MAX_PIXELES", str(40_000_000)))
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def es_digest(valor: str) -> bool:
+    return bool(_DIGEST.match(valor))
+
+
+def digest_de_imagen(image: Optional[str]) -> Optional[str]:
+    """Devuelve el hash si `image` apunta a una imagen subida a este servicio."""
+    prefijo = IMAGENES_URL + "/"
+    if not image or not image.startswith(prefijo):
+        return None
+    digest = image[len(prefijo):].split(".", 1)[0]
+    return digest if es_digest(digest) else None
+
+
+def urls_de_miniaturas(image: Optional[str]) -> Optional[Dict[str, str]]:
+    digest = digest_de_imagen(image)
+    if digest is None:
+        return None
+    return {str(lado): f"{IMAGENES_URL}/{digest}/{lado}.{FORMATO}" for lado in MINIATURAS}
+
+
+def generar_miniaturas(origen: str, destinos: Dict[int, str]) -> List[str]:
+    """Genera las miniaturas de `origen` (se ejecuta en un proceso del pool)."""
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELES
+    generadas = []
+    with Image.open(origen) as imagen:
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ("RGB", "RGBA"):
+            imagen = imagen.convert("RGBA" if "transparency" in imagen.info else "RGB")
+        # De mayor a menor: cada miniatura se reduce a partir de la anterior.
+        for lado in sorted(destinos, reverse=True):
+            imagen.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+            destino = destinos[lado]
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            temporal = f"{destino}.{os.getpid()}.tmp"
+            imagen.save(temporal, FORMATO.upper(), quality=CALIDAD, method=4)
+            os.replace(temporal, destino)
+            generadas.append(destino)
+    return generadas
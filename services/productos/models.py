@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
-from pydantic import BaseModel
-from typing import Optional
+from sqlalchemy.orm import relationship
+from pydantic import BaseModel, Field, computed_field
+from datetime import datetime
+from typing import Dict, Optional, List
+
+from miniaturas import urls_de_miniaturas
 
 # Define la base declarativa
 Base = declarative_base()
@@ -21,13 +25,42 @@ class Producto(Base):
     categoria = Column(String)
     image = Column(String)
     is_active = Column(Boolean, default=True)
-    
+    # Unidades disponibles; solo se modifica con UPDATE condicionales (ver inventario.py)
+    stock = Column(Integer, nullable=False, default=0, server_default="0")
 
 
     def __repr__(self):
         return f"<Producto(id={self.id}, nombre='{self.nombre}')>"
 
 
+class Reserva(Base):
+    """Reserva temporal de stock para un carrito completo."""
+
+    __tablename__ = "reservas"
+
+    id = Column(String, primary_key=True)
+    estado = Column(String, default="pending", index=True)  # pending, committed, released, expired
+    fecha_creacion = Column(DateTime, default=datetime.utcnow)
+    expira_en = Column(DateTime, index=True)
+
+    items = relationship("ReservaItem", back_populates="reserva")
+
+    def __repr__(self):
+        return f"<Reserva(id={self.id}, estado='{self.estado}')>"
+
+
+class ReservaItem(Base):
+    __tablename__ = "reserva_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    id_reserva = Column(String, ForeignKey("reservas.id"), index=True)
+    id_producto = Column(Integer, index=True)
+    cantidad = Column(Integer)
+    precio_unitario = Column(Float)  # Precio al momento de reservar
+
+    reserva = relationship("Reserva", back_populates="items")
+
+
 class ProductoCreate(BaseModel):
     nombre: str
     descripcion: str
@@ -35,6 +68,7 @@ class ProductoCreate(BaseModel):
     categoria: str
     image: Optional[str] = None
     is_active: bool = True
+    stock: int = 0
 
 class ProductoUpdate(BaseModel):
     nombre: Optional[str] = None
@@ -43,6 +77,12 @@ class ProductoUpdate(BaseModel):
     categoria: Optional[str] = None
     image: Optional[str] = None
     is_active: Optional[bool] = None
+    # El stock no se sobrescribe con PUT: se ajusta con POST /{id}/stock.
+
+
+class StockAjuste(BaseModel):
+    # Unidades a sumar (reposición) o restar (merma); nunca deja el stock negativo.
+    delta: int
 
 
 class ProductoResponse(BaseModel):
@@ -53,6 +93,43 @@ class ProductoResponse(BaseModel):
     categoria: str
     image: Optional[str] = None
     is_active: bool = True
-    
+    stock: int = 0
+
+    @computed_field
+    @property
+    def miniaturas(self) -> Optional[Dict[str, str]]:
+        """URLs de las miniaturas por lado en px (solo para imágenes subidas)."""
+        return urls_de_miniaturas(self.image)
+
+    class Config:
+        from_attributes = True
+
+
+# --- Reservas de inventario ---
+
+
+class ReservaItemCreate(BaseModel):
+    id_producto: int
+    cantidad: int
+
+
+class ReservaCreate(BaseModel):
+    items: List[ReservaItemCreate]
+    ttl_segundos: Optional[int] = Field(None, gt=0)
+
+
+class ReservaItemRead(ReservaItemCreate):
+    precio_unitario: float
+
+    class Config:
+        from_attributes = True
+
+
+class ReservaRead(BaseModel):
+    id: str
+    estado: str
+    expira_en: datetime
+    items: List[ReservaItemRead] = []
+
     class Config:
         from_attributes = True
@@ -0,0 +1,91 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import imagenes
+import main
+
+URL = "/api/v1/productos"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main.database, "url", f"sqlite:///{tmp_path / 'productos.db'}")
+    monkeypatch.setattr(imagenes, "IMAGENES_DIR", str(tmp_path / "imagenes"))
+    with TestClient(main.app) as client:
+        db = main.database.sesion()
+        db.add(
+            main.Producto(
+                id=1,
+                nombre="Mate",
+                descripcion="Calabaza",
+                categoria="Mates",
+                precio=1500.0,
+                stock=5,
+            )
+        )
+        db.commit()
+        db.close()
+        yield client
+
+
+def png(ancho=600, alto=400):
+    buffer = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (200, 30, 30)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def subir(client, datos, id=1):
+    return client.post(f"{URL}/{id}/imagen", files={"archivo": ("foto.png", datos, "image/png")})
+
+
+def test_subida_guarda_por_hash_y_genera_miniaturas(client):
+    datos = png()
+    respuesta = subir(client, datos)
+    assert respuesta.status_code == 200
+    digest = imagenes.hashlib.sha256(datos).hexdigest()
+    assert respuesta.json()["image"] == f"{imagenes.IMAGENES_URL}/{digest}.png"
+    assert set(respuesta.json()["miniaturas"]) == {"128", "512"}
+
+    miniatura = client.get(f"{URL}/imagenes/{digest}/128.webp")
+    assert miniatura.status_code == 200
+    assert miniatura.headers["content-type"] == "image/webp"
+    assert miniatura.headers["etag"] == f'"{digest}-128"'
+    with Image.open(io.BytesIO(miniatura.content)) as imagen:
+        assert max(imagen.size) == 128
+
+    assert client.get(f"{URL}/imagenes/{digest}/64.webp").status_code == 404
+
+
+def test_subida_rechaza_formatos_y_productos_desconocidos(client):
+    assert subir(client, b"no es una imagen").status_code == 400
+    assert subir(client, png(), id=99).status_code == 404
+
+
+def test_original_con_rangos_y_304(client):
+    datos = png()
+    nombre = subir(client, datos).json()["image"].rsplit("/", 1)[1]
+    ruta = f"{URL}/imagenes/{nombre}"
+
+    completa = client.get(ruta)
+    assert completa.status_code == 200
+    assert completa.content == datos
+    assert completa.headers["cache-control"] == imagenes.CACHE_CONTROL
+    etag = completa.headers["etag"]
+
+    parcial = client.get(ruta, headers={"range": "bytes=0-9"})
+    assert parcial.status_code == 206
+    assert parcial.content == datos[:10]
+    assert parcial.headers["content-range"] == f"bytes 0-9/{len(datos)}"
+
+    no_modificada = client.get(ruta, headers={"if-none-match": etag})
+    assert no_modificada.status_code == 304
+    assert no_modificada.content == b""
+    for lista in (f'"otro", W/{etag}', "*"):
+        assert client.get(ruta, headers={"if-none-match": lista}).status_code == 304
+    # Se comparan valores completos, no subcadenas.
+    contiene = f'"{etag}-viejo"'
+    assert client.get(ruta, headers={"if-none-match": contiene}).status_code == 200
+    assert client.get(f"{URL}/imagenes/{'0' * 64}.png").status_code == 404
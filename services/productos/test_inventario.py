@@ -0,0 +1,136 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+import inventario
+from models import Base, Producto, Reserva, ReservaCreate, ReservaItemCreate
+
+# Por defecto SQLite; con TEST_DATABASE_URL (PostgreSQL) las mismas pruebas
+# corren contra PostgreSQL. En ambos casos se ejecuta el UPDATE por lotes real.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+@pytest.fixture
+def db(tmp_path):
+    if TEST_DATABASE_URL:
+        engine = create_engine(TEST_DATABASE_URL)
+        Base.metadata.drop_all(engine)
+    else:
+        engine = create_engine(f"sqlite:///{tmp_path / 'productos.db'}")
+    Base.metadata.create_all(engine)
+    sesion = sessionmaker(bind=engine)()
+    sesion.add_all(
+        [
+            Producto(id=1, nombre="Mate", precio=1500.0, stock=5),
+            Producto(id=2, nombre="Bombilla", precio=800.0, stock=1),
+        ]
+    )
+    sesion.commit()
+    yield sesion
+    sesion.close()
+    engine.dispose()
+
+
+def items(*pares):
+    return [ReservaItemCreate(id_producto=i, cantidad=c) for i, c in pares]
+
+
+def stock(db, id_producto):
+    db.expire_all()
+    return db.get(Producto, id_producto).stock
+
+
+def test_agrupar_cantidades_suma_y_ordena():
+    assert inventario.agrupar_cantidades(items((2, 1), (1, 2), (2, 3))) == [(1, 2), (2, 4)]
+    with pytest.raises(ValueError):
+        inventario.agrupar_cantidades(items((1, 0)))
+
+
+def test_reservar_descuenta_stock_y_guarda_precios(db):
+    reserva = inventario.reservar(db, items((1, 2), (2, 1)))
+    assert reserva.estado == "pending"
+    assert {i.id_producto: i.precio_unitario for i in reserva.items} == {1: 1500.0, 2: 800.0}
+    assert stock(db, 1) == 3
+    assert stock(db, 2) == 0
+
+
+def test_reservar_sin_stock_no_descuenta_nada(db):
+    with pytest.raises(inventario.StockInsuficiente) as error:
+        inventario.reservar(db, items((1, 2), (2, 2)))
+    assert error.value.ids == [2]
+    assert stock(db, 1) == 5
+    assert stock(db, 2) == 1
+
+
+def test_reservar_producto_inexistente(db):
+    with pytest.raises(inventario.ProductosInexistentes) as error:
+        inventario.reservar(db, items((1, 1), (99, 1)))
+    assert error.value.ids == [99]
+    assert stock(db, 1) == 5
+
+
+def test_confirmar_es_idempotente(db):
+    reserva = inventario.reservar(db, items((1, 2)))
+    assert inventario.confirmar(db, reserva.id).estado == "committed"
+    assert inventario.confirmar(db, reserva.id).estado == "committed"
+    assert stock(db, 1) == 3
+    # Una reserva confirmada ya no se puede liberar.
+    with pytest.raises(inventario.ReservaNoDisponible):
+        inventario.liberar(db, reserva.id)
+
+
+def test_liberar_devuelve_stock(db):
+    reserva = inventario.reservar(db, items((1, 2), (2, 1)))
+    assert inventario.liberar(db, reserva.id).estado == "released"
+    assert stock(db, 1) == 5
+    assert stock(db, 2) == 1
+    with pytest.raises(inventario.ReservaNoDisponible):
+        inventario.confirmar(db, reserva.id)
+
+
+def test_barrer_expiradas_devuelve_stock(db):
+    vencida = inventario.reservar(db, items((1, 2)))
+    vigente = inventario.reservar(db, items((1, 1)))
+    db.execute(
+        update(Reserva)
+        .where(Reserva.id == vencida.id)
+        .values(expira_en=datetime.utcnow() - timedelta(seconds=1))
+    )
+    db.commit()
+
+    assert inventario.barrer_expiradas(db) == 1
+    assert stock(db, 1) == 4
+    assert db.get(Reserva, vencida.id).estado == "expired"
+    assert db.get(Reserva, vigente.id).estado == "pending"
+    with pytest.raises(inventario.ReservaNoDisponible):
+        inventario.confirmar(db, vencida.id)
+
+
+def test_ajustar_stock_no_queda_negativo(db):
+    assert inventario.ajustar_stock_de_producto(db, 2, 4).stock == 5
+    with pytest.raises(inventario.StockInsuficiente):
+        inventario.ajustar_stock_de_producto(db, 2, -6)
+    assert stock(db, 2) == 5
+    with pytest.raises(inventario.ProductosInexistentes):
+        inventario.ajustar_stock_de_producto(db, 99, 1)
+
+
+def test_ttl_de_reserva_debe_ser_positivo():
+    with pytest.raises(ValueError):
+        ReservaCreate(items=items((1, 1)), ttl_segundos=0)
+
+
+def test_ajuste_por_lotes_es_una_sola_sentencia_condicional():
+    sql = str(
+        inventario._ajustar_stock_sentencia([(1, 2), (2, 1)], descontar=True).compile(
+            dialect=postgresql.dialect()
+        )
+    )
+    assert sql.count("UPDATE productos") == 1
+    assert "UNION ALL" in sql
+    assert "productos.stock >= lote.cantidad" in sql
+    assert "RETURNING productos.id, productos.precio" in sql